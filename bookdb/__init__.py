@@ -1,26 +1,55 @@
-from pyramid.config import Configurator
-from sqlalchemy import engine_from_config
-from pyramid.authentication import AuthTktAuthenticationPolicy
-from pyramid.authorization import ACLAuthorizationPolicy
-from bookdb.security import groupfinder
-from pyramid.settings import asbool
-
-from .models import DBSession
+import os
 
 
 def main(global_config, **settings):
     """ This function returns a Pyramid WSGI application.
     """
-    engine = engine_from_config(settings, 'sqlalchemy.')
+    # imported here rather than above, so the console scripts and the bulk
+    # PDF workers, which import the package but never build the app, do not
+    # load Pyramid's configurator, Chameleon and the metrics
+    from pyramid.config import Configurator
+    from pyramid.authentication import AuthTktAuthenticationPolicy
+    from pyramid.authorization import ACLAuthorizationPolicy
+    from bookdb.security import groupfinder
+    from pyramid.settings import asbool
+
+    from .models import (
+        DBSession,
+        lookup_cache,
+        )
+    from .pdfcache import order_pdfs
+    from .database import engine_from_settings
+    from . import (
+        metrics,
+        templating,
+        )
+
+    engine = engine_from_settings(settings)
     DBSession.configure(bind=engine)
+    lookup_cache.ttl = float(settings.get('lookup_cache.ttl', lookup_cache.ttl))
     authn_policy = AuthTktAuthenticationPolicy('sosecret', callback=groupfinder)
     authz_policy = ACLAuthorizationPolicy()
     develop = asbool(settings.get('develop', 'false'))
     settings['develop'] = develop
+    if develop:
+        pdf_directory = os.path.join(os.path.dirname(__file__), 'orders')
+    else:
+        pdf_directory = '/Users/bmbr/Orders'
+    # an empty order_pdf.directory archives no PDFs, e.g. on a read-only disk
+    order_pdfs.configure(settings.get('order_pdf.directory', pdf_directory) or None,
+                         workers=int(settings.get('order_pdf.workers', 2)))
+    # compiled templates are kept there for later processes to import
+    if settings.get('templates.cache_directory'):
+        templating.configure_cache(settings['templates.cache_directory'])
     config = Configurator(settings=settings,
-                          root_factory='bookdb.models.RootFactory')
+                          root_factory='bookdb.security.RootFactory')
     config.set_authentication_policy(authn_policy)
     config.set_authorization_policy(authz_policy)
+    if asbool(settings.get('metrics.enabled', 'true')):
+        metrics.instrument(engine)
+        config.add_tween('bookdb.metrics.metrics_tween_factory')
+        config.add_route('metrics', '/_metrics')
+        config.add_view(metrics.metrics, route_name='metrics')
     config.add_static_view('static', 'static', cache_max_age=3600)
 
     config.add_route('front_page', '/')
@@ -28,18 +57,23 @@ def main(global_config, **settings):
     config.add_route('logout', '/logout')
 
     config.add_route('book_list',   '/book/list')
+    config.add_route('book_list_json', '/book/list.json')
     config.add_route('book_add',    '/book/add')
+    config.add_route('book_search', '/book/search')
     config.add_route('book_view',   '/book/{isbn13}')
     config.add_route('book_edit',   '/book/{isbn13}/edit')
     config.add_route('book_delete', '/book/{isbn13}/delete')
 
     config.add_route('order_list',   '/order/list')
     config.add_route('order_add',    '/order/add')
+    config.add_route('order_pdf_export', '/order/pdfs.zip')
     config.add_route('order_view',   '/order/{po}')
     config.add_route('order_edit',   '/order/{po}/edit')
     config.add_route('order_delete', '/order/{po}/delete')
     config.add_route('order_pdf',    '/order/{po}/pdf')
+    config.add_route('order_pdf_status', '/order/{po}/pdf/status')
     config.add_route('order_entry_delete', '/order/{po}/delete_entry/{isbn13}')
+    config.add_route('order_entries_add', '/order/{po}/entries')
 
     config.add_route('distributor_list',   '/distributor/list')
     config.add_route('distributor_add',    '/distributor/add')
@@ -51,5 +85,25 @@ def main(global_config, **settings):
     config.add_route('publisher_add',    '/publisher/add')
     config.add_route('publisher_edit',   '/publisher/{short_name}/edit')
 
-    config.scan()
-    return config.make_wsgi_app()
+    config.add_route('export', '/export/{table}.{format}')
+    config.add_route('report', '/report/{name}.pdf')
+
+    config.add_route('api_books',        '/api/books')
+    config.add_route('api_book',         '/api/books/{key}')
+    config.add_route('api_orders',       '/api/orders')
+    config.add_route('api_order',        '/api/orders/{key}')
+    config.add_route('api_distributors', '/api/distributors')
+    config.add_route('api_distributor',  '/api/distributors/{key}')
+    config.add_route('api_publishers',   '/api/publishers')
+    config.add_route('api_publisher',    '/api/publishers/{key}')
+
+    # only the modules with views and subscribers: a scan of the whole package
+    # would import the PDF modules, the scripts and the tests as well
+    config.scan('.views')
+    config.scan('.metrics')
+    app = config.make_wsgi_app()
+    # compile the templates now rather than on their first requests; by
+    # default only into a cache, as compiling in memory slows every restart
+    if asbool(settings.get('templates.precompile', bool(settings.get('templates.cache_directory')))):
+        templating.precompile(config.registry)
+    return app
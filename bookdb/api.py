@@ -0,0 +1,212 @@
+"""Read-only JSON API over books, orders, distributors and publishers.
+
+Each resource is a Core select over its table joined to the tables of its
+to-one relationships, so rows come back as tuples and are zipped straight
+into dicts without building ORM objects. fields picks the fields returned
+(the key always is) and include adds relationships: a to-one relationship
+is read by the same join and comes back as an object in place of its name,
+a to-many one by a single IN query for all the rows fetched. A batch of
+keys is also fetched with one IN query.
+"""
+from collections import (
+    OrderedDict,
+    namedtuple,
+    )
+
+from sqlalchemy import (
+    Date,
+    select,
+    )
+
+from .models import (
+    Author,
+    Binding,
+    Book,
+    DBSession,
+    Distributor,
+    Order,
+    OrderEntry,
+    Publisher,
+    ShelfLocation,
+    ShippingMethod,
+    )
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# keys fetched by one batch request, kept under SQLite's 999 parameters
+MAX_BATCH = 500
+
+# the rows of a to-many relationship: parent is the column matching the
+# parent's id, and fields are (name, column) pairs read from from_obj in
+# order_by order
+Many = namedtuple('Many', 'parent from_obj fields order_by')
+
+
+class Resource(object):
+    """A kind of thing served by the API, and how to read it.
+
+    fields maps each field name to its column; key names the field that
+    identifies a row, and param the query parameter a batch of keys is
+    given in. one maps a to-one relationship's name to the fields of its
+    object, read from the same join, and many maps a to-many relationship's
+    name to a Many.
+    """
+    def __init__(self, name, key, param, id_column, from_obj, fields, one=None, many=None):
+        self.name = name
+        self.key = key
+        self.param = param
+        self.id_column = id_column
+        self.from_obj = from_obj
+        self.fields = OrderedDict(fields)
+        self.one = dict((relationship, OrderedDict(one_fields))
+                        for relationship, one_fields in (one or {}).items())
+        self.many = many or {}
+
+    def field_names(self, fields=None):
+        """Return the names of fields in order, with the key first; all of them if fields is None."""
+        if fields is None:
+            return list(self.fields)
+        for name in fields:
+            if name not in self.fields:
+                raise ValueError("'{}' is not a field of {}".format(name, self.name))
+        return [self.key] + [name for name in self.fields if name in fields and name != self.key]
+
+    def check_include(self, include):
+        for name in include:
+            if name not in self.one and name not in self.many:
+                raise ValueError("'{}' is not a relationship of {}".format(name, self.name))
+
+
+def _converter(column):
+    if isinstance(column.type, Date):
+        return lambda value: value.isoformat() if value is not None else None
+    return None
+
+
+def _to_dicts(names, columns, rows, start=0):
+    """Return a dict of names for each row, read from row[start:]."""
+    converters = [(i, _converter(column)) for i, column in enumerate(columns)]
+    converters = [(i, convert) for i, convert in converters if convert is not None]
+    end = start + len(names)
+    result = [dict(zip(names, row[start:end])) for row in rows]
+    for i, convert in converters:
+        name = names[i]
+        for obj in result:
+            obj[name] = convert(obj[name])
+    return result
+
+
+books = Book.__table__
+authors = Author.__table__
+publishers = Publisher.__table__
+bindings = Binding.__table__
+locations = ShelfLocation.__table__
+orders = Order.__table__
+entries = OrderEntry.__table__
+distributors = Distributor.__table__
+shipping = ShippingMethod.__table__
+
+_DISTRIBUTOR_FIELDS = [(name, distributors.c[name]) for name in (
+    'short_name', 'full_name', 'account_number', 'sales_rep', 'phone', 'fax', 'email',
+    'address1', 'address2', 'city', 'province', 'postal_code', 'country')]
+
+RESOURCES = dict((resource.name, resource) for resource in (
+    Resource('books', 'isbn13', 'isbn', books.c.book_id,
+             books.join(publishers).join(bindings).join(locations),
+             [('isbn13', books.c.isbn13),
+              ('title', books.c.title),
+              ('author_name', books.c.author_name),
+              ('publisher', publishers.c.short_name),
+              ('binding', bindings.c.binding),
+              ('shelf_location', locations.c.location)],
+             one={'publisher': [('short_name', publishers.c.short_name),
+                                ('full_name', publishers.c.full_name)]},
+             many={'authors': Many(authors.c.book_id, authors,
+                                   [('lastname', authors.c.lastname),
+                                    ('firstname', authors.c.firstname)],
+                                   [authors.c.author_id])}),
+    Resource('orders', 'po', 'po', orders.c.order_id,
+             orders.join(distributors).join(shipping),
+             [('po', orders.c.po),
+              ('date', orders.c.date),
+              ('distributor', distributors.c.short_name),
+              ('shipping_method', shipping.c.shipping_method),
+              ('comment', orders.c.comment)],
+             one={'distributor': _DISTRIBUTOR_FIELDS},
+             many={'entries': Many(entries.c.order_id, entries.join(books),
+                                   [('isbn13', books.c.isbn13),
+                                    ('title', books.c.title),
+                                    ('quantity', entries.c.quantity)],
+                                   [books.c.title, books.c.isbn13])}),
+    Resource('distributors', 'short_name', 'name', distributors.c.distributor_id, distributors,
+             _DISTRIBUTOR_FIELDS,
+             many={'orders': Many(orders.c.distributor_id, orders.join(shipping),
+                                  [('po', orders.c.po),
+                                   ('date', orders.c.date),
+                                   ('shipping_method', shipping.c.shipping_method)],
+                                  [orders.c.date, orders.c.po])}),
+    Resource('publishers', 'short_name', 'name', publishers.c.publisher_id, publishers,
+             [('short_name', publishers.c.short_name),
+              ('full_name', publishers.c.full_name)]),
+    ))
+
+
+def get_resource(name):
+    try:
+        return RESOURCES[name]
+    except KeyError:
+        raise ValueError("'{}' is not an API resource".format(name))
+
+
+def _include_many(resource, relationship, ids, objs):
+    many = resource.many[relationship]
+    names = [field for field, column in many.fields]
+    columns = [column for field, column in many.fields]
+    related = dict((i, []) for i in ids)
+    if ids:
+        query = select([many.parent] + columns).select_from(many.from_obj).where(
+            many.parent.in_(ids)).order_by(many.parent, *many.order_by)
+        rows = DBSession.execute(query).fetchall()
+        for row, obj in zip(rows, _to_dicts(names, columns, rows, start=1)):
+            related[row[0]].append(obj)
+    for i, obj in zip(ids, objs):
+        obj[relationship] = related[i]
+
+
+def fetch(resource, keys=None, after=None, limit=PAGE_SIZE, fields=None, include=()):
+    """Return a dict for each row of resource, with fields and the relationships in include.
+
+    The rows are those with the given keys if keys is not None, in no
+    particular order, and otherwise up to limit rows in key order after
+    the key after. Raises ValueError for an unknown field or relationship.
+    """
+    names = resource.field_names(fields)
+    resource.check_include(include)
+    columns = [resource.fields[field] for field in names]
+    ones = [relationship for relationship in include if relationship in resource.one]
+    one_columns = [list(resource.one[relationship].values()) for relationship in ones]
+    selected = [resource.id_column] + columns + [column for cs in one_columns for column in cs]
+    # labelled, as a column may be selected twice, e.g. publisher and its short_name
+    query = select([column.label('c{}'.format(i)) for i, column in enumerate(selected)]).select_from(
+        resource.from_obj)
+    key = resource.fields[resource.key]
+    if keys is not None:
+        if not keys:
+            return []
+        query = query.where(key.in_(keys))
+    else:
+        if after is not None:
+            query = query.where(key > after)
+        query = query.order_by(key).limit(limit)
+    rows = DBSession.execute(query).fetchall()
+    objs = _to_dicts(names, columns, rows, start=1)
+    start = 1 + len(names)
+    for relationship, cs in zip(ones, one_columns):
+        for obj, one in zip(objs, _to_dicts(list(resource.one[relationship]), cs, rows, start=start)):
+            obj[relationship] = one
+        start += len(cs)
+    ids = [row[0] for row in rows]
+    for relationship in include:
+        if relationship in resource.many:
+            _include_many(resource, relationship, ids, objs)
+    return objs
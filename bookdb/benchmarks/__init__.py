@@ -0,0 +1,9 @@
+"""Benchmarks of the app's hot paths, kept apart from the unit tests.
+
+Each module is run on its own, with its sizes as arguments, e.g.:
+
+    python -m bookdb.benchmarks.indexes [books] [repeat]
+
+and builds any database it measures with bookdb.fixtures.make_database(). The unit
+tests check the same paths at a small size with the functions here.
+"""
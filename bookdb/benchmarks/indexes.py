@@ -0,0 +1,112 @@
+"""Query plans and latencies of the hot access paths, before and after the indexes.
+
+A database made by bookdb.fixtures is taken back to schema version 0 with
+bookdb.migrations, measured, brought up to date and measured again. Run it
+with:
+
+    python -m bookdb.benchmarks.indexes [books] [repeat]
+"""
+import datetime
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from sqlalchemy import text
+
+from bookdb import (
+    fixtures,
+    migrations,
+    )
+
+QUERIES = (
+    ('book by isbn',
+     'SELECT * FROM books WHERE isbn13 = :isbn13'),
+    ('books of a publisher',
+     'SELECT * FROM books WHERE publisher_id = :publisher_id AND isbn13 > :isbn13 '
+     'ORDER BY isbn13 LIMIT 50'),
+    ('books by title',
+     'SELECT * FROM books WHERE title > :title ORDER BY title LIMIT 50'),
+    ('authors of a book',
+     'SELECT * FROM authors WHERE book_id = :book_id'),
+    ('orders of a book',
+     'SELECT order_id FROM order_entries WHERE book_id = :book_id'),
+    ('lines of an order',
+     'SELECT * FROM order_entries WHERE order_id = :order_id ORDER BY order_id, book_id'),
+    ('orders of a distributor',
+     'SELECT * FROM orders WHERE distributor_id = :distributor_id '
+     'AND date BETWEEN :start AND :end ORDER BY po'),
+    ('orders by date',
+     'SELECT * FROM orders WHERE date BETWEEN :start AND :end ORDER BY po'),
+    )
+
+# the defaults of fixtures.generate()
+PUBLISHERS = 200
+DISTRIBUTORS = 50
+
+
+def _params(rand, books, orders):
+    # fixtures.generate() dates orders over the last five years
+    start = datetime.date.today() - datetime.timedelta(days=rand.randrange(5 * 365))
+    return dict(isbn13=fixtures.make_isbn13(rand.randrange(books)),
+                publisher_id=rand.randrange(PUBLISHERS) + 1,
+                title=rand.choice(fixtures.TITLE_WORDS),
+                book_id=rand.randrange(books) + 1,
+                order_id=rand.randrange(max(orders, 1)) + 1,
+                distributor_id=rand.randrange(DISTRIBUTORS) + 1,
+                start=start.isoformat(),
+                end=(start + datetime.timedelta(days=30)).isoformat())
+
+
+def plans(connection):
+    """Return {query name: EXPLAIN QUERY PLAN details joined by ' / '}."""
+    params = _params(random.Random(0), 1, 1)
+    return dict((name, ' / '.join(row[-1] for row in connection.execute(
+        text('EXPLAIN QUERY PLAN ' + sql), **params))) for name, sql in QUERIES)
+
+
+def latencies(connection, books, orders, repeat):
+    """Return {query name: median seconds over repeat runs with random parameters}."""
+    rand = random.Random(1)
+    result = {}
+    for name, sql in QUERIES:
+        query = text(sql)
+        times = []
+        for i in range(repeat):
+            params = _params(rand, books, orders)
+            started = time.time()
+            connection.execute(query, **params).fetchall()
+            times.append(time.time() - started)
+        result[name] = sorted(times)[len(times) // 2]
+    return result
+
+
+def main(argv=sys.argv):
+    books = int(argv[1]) if len(argv) > 1 else 1000000
+    repeat = int(argv[2]) if len(argv) > 2 else 20
+    orders = max(books // 50, 1)
+    directory = tempfile.mkdtemp()
+    try:
+        engine = fixtures.make_database('sqlite:///' + os.path.join(directory, 'bench.db'),
+                                        books=books, orders=orders)
+        results = []
+        for version in (0, migrations.HEAD):
+            migrations.upgrade(engine, version)
+            with engine.connect() as conn:
+                conn.execute('ANALYZE')
+                results.append((plans(conn), latencies(conn, books, orders, repeat)))
+        engine.dispose()
+        (plans_before, before), (plans_after, after) = results
+        print('{} books, median of {} runs'.format(books, repeat))
+        for name, sql in QUERIES:
+            print('{:26} {:10.3f} ms {:10.3f} ms'.format(name, before[name] * 1000, after[name] * 1000))
+            print('    before: {}'.format(plans_before[name]))
+            print('    after:  {}'.format(plans_after[name]))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
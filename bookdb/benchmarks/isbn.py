@@ -0,0 +1,86 @@
+"""Throughput of ISBN checking, one code at a time and in batches.
+
+Checks COUNT codes made by bookdb.fixtures, as bare ISBN-13s, hyphenated
+ISBN-13s and ISBN-10s, with the per-code check models.valid_isbn13 made
+before bookdb.isbn, with isbn.normalize() and with isbn.normalize_batch(),
+and prints the best of a few runs of each. Run it with:
+
+    python -m bookdb.benchmarks.isbn [count] [repeat]
+"""
+import re
+import sys
+import time
+
+from bookdb import isbn
+from bookdb.fixtures import make_isbn13
+
+COUNT = 1000000
+
+_OLD_REGEX = re.compile("^\d{13}$")
+
+
+def _old_valid_isbn13(isbn13):
+    # models.valid_isbn13 as it was, for comparison
+    if _OLD_REGEX.match(isbn13) is None:
+        return False
+    total = sum([int(num) * weight for num, weight in zip(isbn13, (1, 3) * 6)])
+    ck = (10 - (total % 10)) % 10
+    return ck == int(isbn13[-1])
+
+
+def _isbn10(isbn13):
+    values = [int(c) for c in isbn13[3:12]]
+    check = (11 - sum(v * w for v, w in zip(values, range(10, 1, -1))) % 11) % 11
+    return isbn13[3:12] + ('X' if check == 10 else str(check))
+
+
+def _hyphenated(isbn13):
+    return '-'.join((isbn13[:3], isbn13[3], isbn13[4:8], isbn13[8:12], isbn13[12]))
+
+
+def codes(count):
+    """Return {form: [code, ...]} of count books, for each form of their ISBNs."""
+    bare = [make_isbn13(n * 7919 % 10 ** 9) for n in range(count)]
+    return {
+        'bare': bare,
+        'hyphenated': [_hyphenated(code) for code in bare],
+        'ISBN-10': [_isbn10(code) for code in bare],
+        }
+
+
+# (name, form of the codes, function of the list of codes)
+RUNS = (
+    ('old valid_isbn13 loop', 'bare', lambda codes: [_old_valid_isbn13(code) for code in codes]),
+    ('normalize loop', 'bare', lambda codes: [isbn.normalize(code) for code in codes]),
+    ('normalize_batch', 'bare', isbn.normalize_batch),
+    ('normalize_batch', 'hyphenated', isbn.normalize_batch),
+    ('normalize_batch', 'ISBN-10', isbn.normalize_batch),
+    )
+
+
+def best(function, arg, repeat):
+    """Return the least seconds of repeat calls of function(arg)."""
+    seconds = []
+    for i in range(repeat):
+        started = time.time()
+        function(arg)
+        seconds.append(time.time() - started)
+    return min(seconds)
+
+
+def main(argv=sys.argv):
+    count = int(argv[1]) if len(argv) > 1 else COUNT
+    repeat = int(argv[2]) if len(argv) > 2 else 3
+    forms = codes(count)
+    print('{} codes, {}'.format(count, 'with NumPy' if isbn._import_numpy() is not None else 'without NumPy'))
+    print('{:22} {:11} {:>9} {:>12} {:>8}'.format('run', 'codes', 'seconds', 'codes/s', 'speed-up'))
+    baseline = None
+    for name, form, function in RUNS:
+        seconds = best(function, forms[form], repeat)
+        baseline = baseline or seconds
+        print('{:22} {:11} {:9.3f} {:12,.0f} {:7.1f}x'.format(
+            name, form, seconds, count / seconds, baseline / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Concurrent read throughput on a SQLite file, with and without bookdb.database.
+
+Reader threads page through the books table while two threads keep writing,
+as waitress threads do when some requests save orders while others browse.
+Run it with:
+
+    python -m bookdb.benchmarks.load [books] [threads] [seconds]
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import (
+    create_engine,
+    exc,
+    select,
+    )
+
+from bookdb import fixtures
+from bookdb.database import engine_from_settings
+
+
+def run(engine, books, threads, seconds):
+    """Return (reads, writes, locked errors) in seconds of mixed load."""
+    from bookdb.models import Book
+    table = Book.__table__
+    stop = time.time() + seconds
+    counts = {'reads': 0, 'writes': 0, 'locked': 0}
+    lock = threading.Lock()
+
+    def count(key):
+        with lock:
+            counts[key] += 1
+
+    def read():
+        while time.time() < stop:
+            after = fixtures.make_isbn13(random.randrange(books))
+            try:
+                with engine.connect() as conn:
+                    conn.execute(select([table]).where(table.c.isbn13 > after)
+                                 .order_by(table.c.isbn13).limit(50)).fetchall()
+                count('reads')
+            except exc.OperationalError:
+                count('locked')
+
+    def write():
+        while time.time() < stop:
+            try:
+                with engine.begin() as conn:
+                    for n in random.sample(range(books), 20):
+                        conn.execute(table.update().where(table.c.book_id == n + 1)
+                                     .values(title='TITLE {}'.format(random.random())))
+                    # a request does some work between its first write and the commit
+                    time.sleep(0.01)
+                count('writes')
+            except exc.OperationalError:
+                count('locked')
+
+    workers = [threading.Thread(target=read) for i in range(threads)]
+    workers += [threading.Thread(target=write) for i in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return counts['reads'], counts['writes'], counts['locked']
+
+
+def main(argv=sys.argv):
+    books = int(argv[1]) if len(argv) > 1 else 50000
+    threads = int(argv[2]) if len(argv) > 2 else 4
+    seconds = float(argv[3]) if len(argv) > 3 else 10
+    directory = tempfile.mkdtemp()
+    try:
+        for name, make_engine in (
+                ('default', create_engine),
+                ('tuned', lambda url: engine_from_settings({'sqlalchemy.url': url}))):
+            url = 'sqlite:///' + os.path.join(directory, name + '.db')
+            fixtures.make_database(url, books=books, orders=0).dispose()
+            engine = make_engine(url)
+            reads, writes, locked = run(engine, books, threads, seconds)
+            engine.dispose()
+            print('{:8} {:8.0f} reads/s {:6.1f} writes/s {:6} locked'.format(
+                name, reads / seconds, writes / seconds, locked))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
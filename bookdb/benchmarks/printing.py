@@ -0,0 +1,65 @@
+"""How long a large order takes to print, and how much memory it takes.
+
+Run the benchmark with:
+
+    python -m bookdb.benchmarks.printing [lines] [repeat]
+
+It also writes a short sample order to test.pdf. The peak memory of
+printing orders of each size, each in a new process, is shown by:
+
+    python -m bookdb.benchmarks.printing memory [lines ...]
+"""
+import io
+import subprocess
+import sys
+import time
+
+from bookdb.printing import generate_order_pdf
+from bookdb.tests.print_tests import (
+    _pages,
+    make_order,
+    make_test_pdf,
+    )
+
+
+def _print_rss(lines):
+    """Print the pages of an order of lines lines, and the peak RSS before and after printing it."""
+    import resource
+    order = make_order(lines)
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    buf = io.BytesIO()
+    generate_order_pdf(order, buf)
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print('{} {} {}'.format(_pages(buf.getvalue()), before, after))
+
+
+def memory(sizes):
+    # ru_maxrss is in KiB on Linux and bytes on OS X
+    print('{:>8} {:>8} {:>12} {:>12}'.format('lines', 'pages', 'peak KiB', 'printing KiB'))
+    for lines in sizes:
+        output = subprocess.check_output([sys.executable, '-m', 'bookdb.benchmarks.printing', 'rss', str(lines)])
+        pages, before, after = [int(n) for n in output.split()]
+        print('{:8} {:8} {:12} {:12}'.format(lines, pages, after, after - before))
+
+
+def main(argv=sys.argv):
+    if argv[1:2] == ['rss']:
+        return _print_rss(int(argv[2]))
+    if argv[1:2] == ['memory']:
+        return memory([int(n) for n in argv[2:]] or [500, 2000, 8000, 32000])
+    lines = int(argv[1]) if len(argv) > 1 else 2000
+    repeat = int(argv[2]) if len(argv) > 2 else 5
+    make_test_pdf()
+    order = make_order(lines)
+    times = []
+    for i in range(repeat):
+        started = time.time()
+        generate_order_pdf(order, io.BytesIO())
+        times.append(time.time() - started)
+    times.sort()
+    print('{} lines: median {:.3f} s, best {:.3f} s of {} runs'.format(
+        lines, times[len(times) // 2], times[0], repeat))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Objects, memory and time of the list queries as mapped objects and as 'lite' rows.
+
+A database of books books and orders orders is made by bookdb.fixtures, and
+each list query is run both ways on it: whole catalogue and order book, as
+the lists would be at that size without paging. Run it with:
+
+    python -m bookdb.benchmarks.projection [books] [orders] [repeat]
+"""
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+# (name, profile of the current path, profile of the projected one, query)
+QUERIES = (
+    ('Book.list', 'listing', 'lite', lambda load: _models().Book.list(load=load)),
+    ('Order.list', 'listing', 'lite', lambda load: _models().Order.list(load=load)),
+    ('Order.summaries', 'listing', 'lite', lambda load: _models().Order.summaries(load=load)),
+    )
+
+
+def _models():
+    from bookdb import models
+    return models
+
+
+def make_database(path, books, orders):
+    from bookdb import fixtures
+    return fixtures.make_database('sqlite:///' + path, books=books, orders=orders, mean_lines=2, max_lines=10)
+
+
+def measure(query, load, repeat):
+    """Return (rows, objects, peak KiB, best seconds) of query(load).
+
+    objects counts the objects the garbage collector tracks that the result
+    keeps alive: the mapped instances, their state and the row tuples.
+    """
+    from bookdb.models import DBSession
+    times = []
+    for i in range(repeat):
+        DBSession.remove()
+        started = time.time()
+        query(load)
+        times.append(time.time() - started)
+    DBSession.remove()
+    gc.collect()
+    before = len(gc.get_objects())
+    if tracemalloc is not None:
+        tracemalloc.start()
+    result = query(load)
+    peak = None
+    if tracemalloc is not None:
+        peak = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+    gc.collect()
+    objects = len(gc.get_objects()) - before
+    rows = len(result)
+    del result
+    DBSession.remove()
+    return rows, objects, peak, min(times)
+
+
+def compare(engine, repeat=3):
+    """Return [(name, load, rows, objects, peak KiB, seconds), ...] for both profiles of QUERIES."""
+    from bookdb.models import DBSession
+    DBSession.configure(bind=engine)
+    results = []
+    for name, current, lite, query in QUERIES:
+        for load in (current, lite):
+            results.append((name, load) + measure(query, load, repeat))
+    return results
+
+
+def main(argv=sys.argv):
+    books = int(argv[1]) if len(argv) > 1 else 100000
+    orders = int(argv[2]) if len(argv) > 2 else 100000
+    repeat = int(argv[3]) if len(argv) > 3 else 3
+    directory = tempfile.mkdtemp()
+    try:
+        engine = make_database(os.path.join(directory, 'lists.db'), books, orders)
+        print('{:16} {:8} {:>8} {:>10} {:>10} {:>8}'.format('query', 'profile', 'rows', 'objects',
+                                                          'peak KiB', 'seconds'))
+        for result in compare(engine, repeat):
+            print('{:16} {:8} {:8} {:10} {:>10} {:8.3f}'.format(*result))
+        engine.dispose()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Cold-start time of the WSGI app and the console scripts, from python -X importtime.
+
+Each target is started in a new interpreter: bookdb:main builds the whole
+application on an in-memory database, which scans and so imports every
+view, and a console script imports its module, which is all it does
+before reading its config file. For each, the wall time of the process,
+the time spent importing and the packages that took most of it are
+printed. Run it with:
+
+    python -m bookdb.benchmarks.startup [repeat] [packages shown]
+
+-X importtime needs Python 3.7; on older interpreters only the wall time
+is measured.
+"""
+import json
+import subprocess
+import sys
+import time
+
+_MAIN = """
+try:
+    import pyramid_chameleon
+    includes = 'pyramid_tm\\npyramid_chameleon'
+except ImportError:  # Pyramid before 1.5 renders .pt templates itself
+    includes = 'pyramid_tm'
+import bookdb
+bookdb.main({}, **{'sqlalchemy.url': 'sqlite://', 'pyramid.includes': includes,
+                   'order_pdf.directory': ''})
+"""
+
+# (target, code started); the console scripts are named as in setup.py
+TARGETS = (
+    ('bookdb:main', _MAIN),
+    ('initialize_bookdb_db', 'import bookdb.scripts.initializedb'),
+    ('migrate_bookdb_db', 'import bookdb.scripts.migratedb'),
+    ('export_bookdb_order_pdfs', 'import bookdb.scripts.exportpdfs'),
+    ('import_books', 'import bookdb.scripts.importbooks'),
+    ('export_bookdb', 'import bookdb.scripts.export'),
+    ('generate_bookdb_fixture', 'import bookdb.scripts.generatefixture'),
+    ('print_bookdb_report', 'import bookdb.scripts.printreport'),
+    ('precompile_bookdb_templates', 'import bookdb.scripts.precompiletemplates'),
+    )
+
+# printed by each target last, for the tests
+_MODULES = "\nimport json, sys\nprint(json.dumps(sorted(sys.modules)))\n"
+
+
+def import_times(report):
+    """Return {top-level package: seconds} from the lines of an -X importtime report.
+
+    Each module's own time, not counting the modules it imports, is put
+    down to its top-level package.
+    """
+    packages = {}
+    for line in report.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        package = name.strip().split('.')[0]
+        packages[package] = packages.get(package, 0.0) + int(own) / 1e6
+    return packages
+
+
+def start(code):
+    """Run code in a new interpreter; return (seconds, {package: import seconds}, modules)."""
+    started = time.time()
+    process = subprocess.Popen([sys.executable, '-X', 'importtime', '-c', code + _MODULES],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = process.communicate()
+    seconds = time.time() - started
+    if process.returncode:
+        raise RuntimeError(err.decode('utf-8', 'replace'))
+    modules = json.loads(out.decode('utf-8').splitlines()[-1])
+    return seconds, import_times(err.decode('utf-8', 'replace')), set(modules)
+
+
+def main(argv=sys.argv):
+    repeat = int(argv[1]) if len(argv) > 1 else 5
+    shown = int(argv[2]) if len(argv) > 2 else 4
+    print('{:28} {:>8} {:>8}  {}'.format('target', 'process', 'imports', 'heaviest packages'))
+    for name, code in TARGETS:
+        runs = sorted((start(code) for i in range(repeat)), key=lambda run: run[0])
+        # the median run by wall time
+        seconds, packages, modules = runs[len(runs) // 2]
+        heaviest = sorted(packages.items(), key=lambda item: -item[1])[:shown]
+        print('{:28} {:8.3f} {:8.3f}  {}'.format(
+            name, seconds, sum(packages.values()),
+            ', '.join('{} {:.0f} ms'.format(package, s * 1000) for package, s in heaviest)))
+
+
+if __name__ == '__main__':
+    main()
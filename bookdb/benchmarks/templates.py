@@ -0,0 +1,143 @@
+"""Startup time and first-request latency of the pages, with and without compiling the templates first.
+
+Each mode starts the application in a fresh process on a database made by
+bookdb.fixtures, and times main() and then the first request of each page
+in PAGES, logged in as the editor:
+
+    lazy        templates compiled on their pages' first requests, as before
+    precompiled compiled by main(), in memory
+    cold cache  compiled by main() into an empty templates.cache_directory
+    warm cache  imported by main() from the cache the last mode filled
+
+Needs WebTest. Run it with:
+
+    python -m bookdb.benchmarks.templates [books] [orders] [repeat]
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# (mode, templates.precompile, use the cache directory, empty it first)
+MODES = (
+    ('lazy', 'false', False, False),
+    ('precompiled', 'true', False, False),
+    ('cold cache', 'true', True, True),
+    ('warm cache', 'true', True, False),
+    )
+
+# the pages rendered from templates; the keys in braces are filled by make_database
+PAGES = (
+    '/',
+    '/login',
+    '/book/list',
+    '/book/search?q=river',
+    '/book/{isbn13}',
+    '/book/{isbn13}/edit',
+    '/book/{isbn13}/delete',
+    '/order/list',
+    '/order/add',
+    '/order/{po}',
+    '/order/{po}/edit',
+    '/order/{po}/delete',
+    '/distributor/list',
+    '/distributor/add',
+    '/distributor/{distributor}',
+    '/distributor/{distributor}/edit',
+    '/publisher/list',
+    '/publisher/add',
+    '/publisher/{publisher}/edit',
+    )
+
+
+def _includes():
+    try:
+        import pyramid_chameleon
+        return 'pyramid_tm\npyramid_chameleon'
+    except ImportError:  # Pyramid before 1.5 renders .pt templates itself
+        return 'pyramid_tm'
+
+
+def make_database(path, books, orders):
+    """Make a database at path; return the keys of a book, an order, a distributor and a publisher."""
+    from bookdb import fixtures
+    engine = fixtures.make_database('sqlite:///' + path, books=books, orders=orders)
+    row = engine.execute('SELECT o.po, d.short_name FROM orders o '
+                         'JOIN distributors d USING (distributor_id) LIMIT 1').first()
+    engine.dispose()
+    return dict(isbn13=fixtures.make_isbn13(0), po=row[0], distributor=row[1],
+                publisher=fixtures.PUBLISHER_NAMES[0])
+
+
+def serve(settings, keys):
+    """Start the application and get each of PAGES once; return (startup seconds, [seconds, ...])."""
+    started = time.time()
+    import bookdb
+    import webtest
+    app = webtest.TestApp(bookdb.main({}, **settings))
+    startup = time.time() - started
+    app.post('/login', {'login': 'editor', 'password': 'editor', 'form.submitted': '1'})
+    seconds = []
+    for page in PAGES:
+        started = time.time()
+        app.get(page.format(**keys))
+        seconds.append(time.time() - started)
+    from bookdb.pdfcache import order_pdfs
+    order_pdfs.join()
+    return startup, seconds
+
+
+def make_settings(directory, precompile, cache):
+    settings = {
+        'sqlalchemy.url': 'sqlite:///' + os.path.join(directory, 'pages.db'),
+        'pyramid.includes': _includes(),
+        'pyramid.reload_templates': 'true',
+        'develop': 'true',
+        'order_pdf.directory': '',
+        'templates.precompile': precompile,
+        }
+    if cache:
+        settings['templates.cache_directory'] = os.path.join(directory, 'template_cache')
+    return settings
+
+
+def run(directory, keys, mode):
+    """Return (process seconds, main() seconds, [first request seconds, ...]) of mode in a new process."""
+    name, precompile, cache, empty = [m for m in MODES if m[0] == mode][0]
+    if empty:
+        shutil.rmtree(os.path.join(directory, 'template_cache'), ignore_errors=True)
+    started = time.time()
+    output = subprocess.check_output(
+        [sys.executable, '-m', 'bookdb.benchmarks.templates', '--serve',
+         json.dumps([make_settings(directory, precompile, cache), keys])])
+    process = time.time() - started
+    startup, seconds = json.loads(output.decode('utf-8').splitlines()[-1])
+    return process, startup, seconds
+
+
+def main(argv=sys.argv):
+    if argv[1:2] == ['--serve']:
+        print(json.dumps(serve(*json.loads(argv[2]))))
+        return
+    books = int(argv[1]) if len(argv) > 1 else 10000
+    orders = int(argv[2]) if len(argv) > 2 else 1000
+    repeat = int(argv[3]) if len(argv) > 3 else 3
+    directory = tempfile.mkdtemp()
+    try:
+        keys = make_database(os.path.join(directory, 'pages.db'), books, orders)
+        print('{:12} {:>9} {:>9} {:>14} {:>14}'.format(
+            'mode', 'process', 'main()', 'first requests', 'slowest first'))
+        for i in range(repeat):
+            for mode in MODES:
+                process, startup, seconds = run(directory, keys, mode[0])
+                print('{:12} {:9.3f} {:9.3f} {:14.3f} {:14.3f}'.format(
+                    mode[0], process, startup, sum(seconds), max(seconds)))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""Render the PDFs of many purchase orders at once, across a pool of processes.
+
+Orders are selected and prefetched with the 'print' loading profile, turned
+into order_data() and handed to worker processes, which return the PDF bytes
+in order. PDFs already in the order_pdfs cache are read instead of redrawn,
+and new ones are added to it.
+
+One pool is started by the first export and shared by every later one, so
+however many exports run at once there are never more rendering processes
+than it has; their orders wait their turn in its queue. Its processes are
+started by a fork server rather than forked from the server's threads,
+where a lock another thread held, the logging or connection pool's, would
+stay held in the child for good.
+
+An order that cannot be drawn is logged and comes back without a PDF, so
+an export being streamed goes on with the other orders.
+"""
+import collections
+import logging
+import multiprocessing
+import os
+import threading
+import zipfile
+
+from .models import (
+    DBSession,
+    Order,
+    _apply_load_profile,
+    )
+from .pdfcache import (
+    order_data,
+    data_digest,
+    order_from_data,
+    order_pdfs,
+    render_pdf,
+    )
+
+log = logging.getLogger(__name__)
+
+
+def select_orders(start=None, end=None, distributor=None):
+    """Return the orders dated from start to end inclusive, for distributor if given.
+
+    The orders, their lines, books and authors are fetched in a handful of
+    queries however many orders match.
+    """
+    query = _apply_load_profile(DBSession.query(Order), Order, 'print')
+    if start is not None:
+        query = query.filter(Order.date >= start)
+    if end is not None:
+        query = query.filter(Order.date <= end)
+    if distributor is not None:
+        query = query.filter(Order.distributor_id == distributor.distributor_id)
+    return query.order_by(Order.po).all()
+
+
+def _render_job(job):
+    """Return the PDF of one order_data(), from the cache at path if it is there."""
+    data, path = job
+    if path is not None and os.path.exists(path):
+        with open(path, 'rb') as f:
+            return f.read()
+    pdf = render_pdf(order_from_data(data))
+    if path is not None:
+        partial = '{}.{}.partial'.format(path, os.getpid())
+        with open(partial, 'wb') as f:
+            f.write(pdf)
+        os.rename(partial, path)
+    return pdf
+
+
+_pool = None
+_pool_size = None
+_pool_lock = threading.Lock()
+
+
+def _context():
+    try:
+        return multiprocessing.get_context('forkserver')
+    except ValueError:  # no fork server, e.g. on Windows, where processes are spawned anyway
+        return multiprocessing.get_context('spawn')
+    except AttributeError:  # Python 2 can only fork
+        return multiprocessing
+
+
+def _shared_pool(processes):
+    """Return (pool, its number of processes), starting it with processes on the first call."""
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is None:
+            _pool_size = processes or multiprocessing.cpu_count()
+            _pool = _context().Pool(_pool_size)
+        return _pool, _pool_size
+
+
+def render_orders(orders, processes=None):
+    """Return an iterator of (po, pdf) for each of orders, in order.
+
+    pdf is None for an order that could not be drawn. The orders are read straight away, so the iterator can be consumed after
+    the session has closed, e.g. as a response's app_iter. processes sizes
+    the shared pool if this is the first export, and defaults to the number
+    of CPUs; later exports use the pool as it is.
+    """
+    jobs = []
+    for order in orders:
+        data = order_data(order)
+        path = None
+        if order_pdfs.directory is not None:
+            path = order_pdfs.path(data_digest(data))
+        jobs.append((data, path))
+    return _render_jobs(jobs, processes)
+
+
+def _result(po, result):
+    try:
+        return po, result.get()
+    except Exception:
+        log.exception('Could not draw the PDF of order %s', po)
+        return po, None
+
+
+def _render_jobs(jobs, processes):
+    if not jobs:
+        return
+    pool, size = _shared_pool(processes)
+    # only a couple of jobs per process are queued ahead of the one being
+    # read, so an export whose client goes away leaves little work behind
+    pending = collections.deque()
+    for job in jobs:
+        pending.append((job[0]['po'], pool.apply_async(_render_job, (job,))))
+        if len(pending) > 2 * size:
+            yield _result(*pending.popleft())
+    while pending:
+        yield _result(*pending.popleft())
+
+
+class _ZipSink(object):
+    """A write-only file that hands back what was written since the last drain()."""
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def zip_stream(pdfs):
+    """Yield a ZIP archive of (po, pdf) pairs piece by piece, one member at a time.
+
+    An order whose pdf is None gets a note saying so instead, as the
+    response has been under way since the first member.
+    """
+    sink = _ZipSink()
+    # PDF streams are already compressed
+    archive = zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED)
+    for po, pdf in pdfs:
+        if pdf is None:
+            archive.writestr('{}.error.txt'.format(po),
+                             'The PDF of order {} could not be made; see the server log.\n'.format(po))
+        else:
+            archive.writestr('{}.pdf'.format(po), pdf)
+        yield sink.drain()
+    archive.close()
+    yield sink.drain()
@@ -0,0 +1,86 @@
+import threading
+import time
+
+
+class LookupCache(object):
+    """Process-local read-through cache for small reference tables.
+
+    Each cached class is loaded whole by loader(cls), which returns the rows
+    in display order and a dict indexing them by natural key. The snapshot is
+    served until it is older than ttl seconds or the class is invalidated.
+    Invalidating bumps a per-class version, so a load that raced with a
+    write is never stored. derived() keeps values built from the rows, such
+    as rendered markup, with the snapshot they were built from.
+
+    If private(cls) returns True, the caller is loaded a snapshot of its own,
+    which is not kept: it may hold rows no other caller should see yet.
+    """
+    def __init__(self, loader, ttl=300, clock=time.time, private=None):
+        self.loader = loader
+        self.ttl = ttl
+        self.clock = clock
+        self.private = private
+        self._lock = threading.Lock()
+        self._snapshots = {}
+        self._versions = {}
+        self._hits = {}
+        self._misses = {}
+
+    def _snapshot(self, cls):
+        if self.private is not None and self.private(cls):
+            rows, index = self.loader(cls)
+            return (None, None, rows, index, {})
+        now = self.clock()
+        with self._lock:
+            version = self._versions.get(cls, 0)
+            snapshot = self._snapshots.get(cls)
+            if snapshot is not None and snapshot[0] == version and snapshot[1] > now:
+                self._hits[cls] = self._hits.get(cls, 0) + 1
+                return snapshot
+            self._misses[cls] = self._misses.get(cls, 0) + 1
+        rows, index = self.loader(cls)
+        snapshot = (version, now + self.ttl, rows, index, {})
+        with self._lock:
+            if self._versions.get(cls, 0) == version:
+                self._snapshots[cls] = snapshot
+        return snapshot
+
+    def rows(self, cls):
+        """Return every row of cls, in display order."""
+        return self._snapshot(cls)[2]
+
+    def lookup(self, cls, key, default=None):
+        """Return the row of cls with natural key key."""
+        return self._snapshot(cls)[3].get(key, default)
+
+    def derived(self, cls, name, build):
+        """Return build(rows of cls), built once per snapshot and kept under name."""
+        snapshot = self._snapshot(cls)
+        derived = snapshot[4]
+        if name not in derived:
+            # two threads may both build it; either result will do
+            derived[name] = build(snapshot[2])
+        return derived[name]
+
+    def invalidate(self, cls):
+        with self._lock:
+            self._versions[cls] = self._versions.get(cls, 0) + 1
+            self._snapshots.pop(cls, None)
+
+    def clear(self):
+        """Drop every snapshot and reset the counters."""
+        with self._lock:
+            for cls in list(self._snapshots):
+                self._versions[cls] = self._versions.get(cls, 0) + 1
+            self._snapshots.clear()
+            self._hits.clear()
+            self._misses.clear()
+
+    def stats(self):
+        """Return {class name: {'hits': n, 'misses': n, 'version': n}}."""
+        with self._lock:
+            classes = set(self._hits) | set(self._misses) | set(self._versions)
+            return dict((cls.__name__, {'hits': self._hits.get(cls, 0),
+                                        'misses': self._misses.get(cls, 0),
+                                        'version': self._versions.get(cls, 0)})
+                        for cls in classes)
@@ -0,0 +1,64 @@
+"""Engine construction with connection pool and SQLite tuning from settings.
+
+SQLite connections get the pragmas in SQLITE_PRAGMAS (each can be changed
+with a sqlite.<pragma> setting) as they are opened: write-ahead logging lets
+readers carry on while a request writes, and busy_timeout makes a writer
+wait for the lock instead of failing with "database is locked".
+
+Other databases get a QueuePool of db_pool.size connections, which should
+match the number of waitress threads (both are set in development.ini and
+production.ini), plus db_pool.max_overflow for the order PDF workers, with
+connections checked before use.
+"""
+from sqlalchemy import (
+    engine_from_config,
+    event,
+    )
+from sqlalchemy.engine.url import make_url
+
+# busy_timeout first: switching a new file to WAL takes a lock, which
+# another connection opened at the same time may hold
+SQLITE_PRAGMAS = (
+    ('busy_timeout', '5000'),       # milliseconds
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', '-65536'),       # negative means KiB, so 64 MiB
+    ('mmap_size', '268435456'),     # bytes
+    ('temp_store', 'MEMORY'),
+    )
+
+# for an ini file without db_pool.size; the waitress default of 4 threads
+DEFAULT_POOL_SIZE = 4
+DEFAULT_MAX_OVERFLOW = 2
+
+
+def sqlite_pragmas(settings):
+    """Return [(pragma, value), ...] from SQLITE_PRAGMAS and sqlite.* settings."""
+    return [(name, settings.get('sqlite.' + name, default)) for name, default in SQLITE_PRAGMAS]
+
+
+def _pragma_listener(pragmas):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                cursor.execute('PRAGMA {}={}'.format(name, value))
+        finally:
+            cursor.close()
+    return set_pragmas
+
+
+def engine_from_settings(settings, prefix='sqlalchemy.'):
+    """Return engine_from_config(settings, prefix), tuned for the database in use."""
+    url = make_url(settings[prefix + 'url'])
+    if url.get_backend_name() == 'sqlite':
+        engine = engine_from_config(settings, prefix)
+        event.listen(engine, 'connect', _pragma_listener(sqlite_pragmas(settings)))
+        return engine
+    return engine_from_config(
+        settings, prefix,
+        pool_size=int(settings.get('db_pool.size', DEFAULT_POOL_SIZE)),
+        max_overflow=int(settings.get('db_pool.max_overflow', DEFAULT_MAX_OVERFLOW)),
+        pool_timeout=int(settings.get('db_pool.timeout', 30)),
+        pool_recycle=int(settings.get('db_pool.recycle', 3600)),
+        pool_pre_ping=True)
@@ -0,0 +1,140 @@
+"""Streaming export of the catalogue and orders as CSV or JSON Lines.
+
+Rows are read through SQLAlchemy Core on a connection of their own with
+server-side cursors where the database supports them, and fetched and
+encoded a batch at a time, so an export starts sending at once and uses the
+same memory whatever the size of the table.
+"""
+import csv
+import io
+import json
+
+from sqlalchemy import select
+
+from .models import (
+    Binding,
+    Book,
+    Distributor,
+    Order,
+    OrderEntry,
+    Publisher,
+    ShelfLocation,
+    ShippingMethod,
+    )
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    }
+
+BATCH_SIZE = 1000
+
+_PY2 = str is bytes
+
+
+def _books():
+    books = Book.__table__
+    publishers = Publisher.__table__
+    bindings = Binding.__table__
+    locations = ShelfLocation.__table__
+    return select([books.c.isbn13,
+                   books.c.title,
+                   # migration 4 filled it in for the books made before it was kept
+                   books.c.author_name.label('authors'),
+                   publishers.c.short_name.label('publisher'),
+                   bindings.c.binding,
+                   locations.c.location.label('shelf_location')]).select_from(
+        books.join(publishers).join(bindings).join(locations)).order_by(books.c.isbn13)
+
+
+def _orders():
+    orders = Order.__table__
+    distributors = Distributor.__table__
+    shipping = ShippingMethod.__table__
+    return select([orders.c.po,
+                   orders.c.date,
+                   distributors.c.short_name.label('distributor'),
+                   shipping.c.shipping_method,
+                   orders.c.comment]).select_from(
+        orders.join(distributors).join(shipping)).order_by(orders.c.po)
+
+
+def _order_entries():
+    entries = OrderEntry.__table__
+    orders = Order.__table__
+    books = Book.__table__
+    return select([orders.c.po,
+                   books.c.isbn13,
+                   entries.c.quantity,
+                   books.c.title]).select_from(
+        entries.join(orders).join(books)).order_by(orders.c.po, books.c.isbn13)
+
+
+EXPORTS = {
+    'books': _books,
+    'orders': _orders,
+    'order_entries': _order_entries,
+    }
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def _encode_csv(columns, rows, header):
+    if _PY2:
+        buf = io.BytesIO()
+        rows = [[_text(v).encode('utf-8') if isinstance(v, unicode) else _text(v) for v in row]
+                for row in rows]
+    else:
+        buf = io.StringIO()
+        rows = [[_text(v) for v in row] for row in rows]
+    writer = csv.writer(buf)
+    if header:
+        writer.writerow(columns)
+    writer.writerows(rows)
+    data = buf.getvalue()
+    return data if _PY2 else data.encode('utf-8')
+
+
+def _encode_jsonl(columns, rows, header):
+    lines = [json.dumps(dict(zip(columns, row)), default=_text) for row in rows]
+    return ''.join(line + '\n' for line in lines).encode('utf-8')
+
+
+def export(engine, table, fmt, batch_size=BATCH_SIZE):
+    """Yield the encoded bytes of table ('books', 'orders' or 'order_entries') in fmt.
+
+    The rows are read on a new connection from engine, which is closed when
+    the iterator is exhausted or closed. Raises ValueError for an unknown
+    table or format before anything is read.
+    """
+    if table not in EXPORTS:
+        raise ValueError("'{}' is not an exportable table".format(table))
+    if fmt not in FORMATS:
+        raise ValueError("'{}' is not an export format".format(fmt))
+    encode = _encode_csv if fmt == 'csv' else _encode_jsonl
+    query = EXPORTS[table]()
+    return _stream(engine, query, encode, batch_size)
+
+
+def _stream(engine, query, encode, batch_size):
+    connection = engine.connect()
+    try:
+        result = connection.execution_options(stream_results=True).execute(query)
+        columns = list(result.keys())
+        header = True
+        while True:
+            rows = result.fetchmany(batch_size)
+            if rows or header:
+                yield encode(columns, rows, header)
+            header = False
+            if len(rows) < batch_size:
+                break
+        result.close()
+    finally:
+        connection.close()
@@ -0,0 +1,246 @@
+"""Synthetic catalogues and order books for trying the app at scale.
+
+generate() fills an empty database through SQLAlchemy Core executemany
+inserts. A few publishers and authors account for most of the books, and a
+few bestsellers for most of the order lines, as in a real bookshop.
+Everything is drawn from random.Random(seed), so a seed always gives the
+same data.
+
+make_database() makes a whole new database of them, for the benchmarks in
+bookdb.benchmarks and the tests that need more than a few rows.
+"""
+import bisect
+import datetime
+import random
+
+from sqlalchemy import (
+    func,
+    select,
+    )
+
+from . import versions
+from .models import (
+    Author,
+    Binding,
+    Book,
+    Distributor,
+    Order,
+    OrderEntry,
+    Publisher,
+    ShelfLocation,
+    ShippingMethod,
+    lookup_cache,
+    )
+
+BINDINGS = (('Paper', 75), ('Cloth', 25))
+
+SHELF_LOCATIONS = ('Fiction', 'Philosophy', 'History', 'Poetry', 'Drama', 'Religion',
+                   'Science', 'Children', 'Reference', 'Art')
+
+SHIPPING_METHODS = ('Usual Means', 'UPS', 'Canada Post')
+
+# (authors per book, weight)
+AUTHOR_COUNTS = ((1, 80), (2, 15), (3, 4), (0, 1))
+
+PUBLISHER_NAMES = ('Penguin', 'Oxford', 'Fordham', 'Vintage', 'Harper', 'Knopf', 'Norton',
+                   'Routledge', 'Verso', 'Faber', 'Cambridge', 'Chicago', 'Princeton', 'Yale')
+
+SURNAMES = ('Smith', 'Brown', 'Tremblay', 'Martin', 'Roy', 'Wilson', 'MacDonald', 'Gagnon',
+            'Johnson', 'Taylor', 'Cote', 'Campbell', 'Anderson', 'Leblanc', 'Lee', 'Jones',
+            'White', 'Williams', 'Miller', 'Thompson', 'Gauthier', 'Young', 'Morin', 'Scott',
+            'Stewart', 'Wong', 'Murray', 'King', 'Clarke', 'Fraser', 'Dickens', 'Austen',
+            'Woolf', 'Hegel', 'Kant', 'Atwood', 'Munro', 'Ondaatje', 'Davies', 'Laurence')
+
+FIRST_NAMES = ('Anne', 'Charles', 'Margaret', 'John', 'Alice', 'Robert', 'Mary', 'Michael',
+               'Jane', 'David', 'Elizabeth', 'James', 'Sarah', 'William', 'Virginia', 'Thomas',
+               'Susan', 'Peter', 'Helen', 'George', 'Carol', 'Richard', 'Ruth', 'Paul')
+
+TITLE_WORDS = ('THE', 'OF', 'AND', 'A', 'HISTORY', 'LIFE', 'NIGHT', 'HOUSE', 'RIVER', 'WAR',
+               'PEACE', 'WORLD', 'GARDEN', 'SEA', 'CITY', 'MIND', 'PHILOSOPHY', 'STORY',
+               'LETTERS', 'SHADOW', 'LIGHT', 'WINTER', 'SUMMER', 'NORTH', 'EMPIRE', 'REASON',
+               'SPIRIT', 'POEMS', 'ESSAYS', 'LAST', 'FIRST', 'GREAT', 'LITTLE', 'SECRET',
+               'ISLAND', 'ROAD', 'STONE', 'FIRE', 'WATER', 'KINGDOM', 'MEMORY', 'TIME')
+
+
+class _Weighted(object):
+    """Draw from choices with the given weights."""
+    def __init__(self, choices, weights):
+        self.choices = list(choices)
+        self.totals = []
+        total = 0
+        for weight in weights:
+            total += weight
+            self.totals.append(total)
+
+    def draw(self, rand):
+        return self.choices[bisect.bisect(self.totals, rand.random() * self.totals[-1])]
+
+
+def _zipf(choices):
+    """Draw from choices, the nth as often as the first divided by n."""
+    return _Weighted(choices, [1.0 / n for n in range(1, len(choices) + 1)])
+
+
+def make_isbn13(n):
+    """Return the nth valid ISBN-13, counting from 978-0-00-000000."""
+    stem = '978{:09d}'.format(n)
+    total = sum([int(num) * weight for num, weight in zip(stem, (1, 3) * 6)])
+    return stem + str((10 - (total % 10)) % 10)
+
+
+def _lookup_rows(rand, distributors, publishers):
+    names = list(PUBLISHER_NAMES[:publishers])
+    names += ['Press {}'.format(n) for n in range(len(names), publishers)]
+    publisher_rows = [dict(short_name=name, full_name=name + ' Books') for name in names]
+    distributor_rows = []
+    for n in range(distributors):
+        name = 'Distributor {}'.format(n)
+        distributor_rows.append(dict(
+            short_name=name, full_name=name + ' Ltd.',
+            account_number='{:08d}'.format(rand.randrange(10 ** 8)),
+            sales_rep='{} {}'.format(rand.choice(FIRST_NAMES), rand.choice(SURNAMES)),
+            phone='416-555-{:04d}'.format(n), fax='416-555-{:04d}'.format(n + 5000),
+            email='orders{}@example.com'.format(n),
+            address1='{} {} Street'.format(rand.randrange(1, 999), rand.choice(SURNAMES)),
+            address2='', city='Toronto', province='ON', postal_code='M5V 2T6', country='Canada'))
+    return publisher_rows, distributor_rows
+
+
+def _new_lookups(connection, cls, name, rows):
+    """Return (the rows not yet in cls's table, the id of each of rows).
+
+    A row whose name column matches one already there takes that row's id,
+    so a database made by initialize_bookdb_db keeps its lookups; the others
+    are given ids after the highest.
+    """
+    table = cls.__table__
+    key = list(table.primary_key.columns)[0]
+    ids = dict(connection.execute(select([table.c[name], key])).fetchall())
+    next_id = max(ids.values()) + 1 if ids else 1
+    new = []
+    for row in rows:
+        if row[name] not in ids:
+            row[key.name] = ids[row[name]] = next_id
+            next_id += 1
+            new.append(row)
+    return new, [ids[row[name]] for row in rows]
+
+
+def generate(connection, books=10000, orders=1000, distributors=50, publishers=200,
+             mean_lines=12, max_lines=100, seed=0, chunk=5000, progress=None):
+    """Fill the empty database on connection with synthetic books and orders.
+
+    Orders have a geometric number of lines with mean mean_lines, at most
+    max_lines, drawn from the books with a bias towards the first ones.
+    Rows are built and inserted chunk at a time. progress(table, rows) is
+    called after each table is written. Returns {table: rows inserted}.
+    Lookups already in the database (publishers, distributors, bindings,
+    shelf locations and shipping methods) with the names generated are used
+    rather than inserted again. Raises ValueError if there are books or
+    orders already.
+    """
+    for cls in (Book, Order):
+        if connection.execute(select([func.count()]).select_from(cls.__table__)).scalar():
+            raise ValueError('the database already has {}'.format(cls.__tablename__))
+    if books < 1 or publishers < 1 or distributors < 1 or mean_lines < 1:
+        raise ValueError('books, publishers, distributors and mean_lines must be at least 1')
+    rand = random.Random(seed)
+    counts = {}
+
+    def write(cls, rows):
+        if rows:
+            connection.execute(cls.__table__.insert(), rows)
+            versions.bump(connection, [cls.__tablename__])
+        counts[cls.__tablename__] = counts.get(cls.__tablename__, 0) + len(rows)
+
+    def write_lookups(cls, name, rows):
+        new, ids = _new_lookups(connection, cls, name, rows)
+        write(cls, new)
+        return ids
+
+    def done(*classes):
+        if progress is not None:
+            for cls in classes:
+                progress(cls.__tablename__, counts.get(cls.__tablename__, 0))
+
+    publisher_rows, distributor_rows = _lookup_rows(rand, distributors, publishers)
+    with connection.begin():
+        publisher_ids = write_lookups(Publisher, 'short_name', publisher_rows)
+        distributor_ids = write_lookups(Distributor, 'short_name', distributor_rows)
+        binding_ids = write_lookups(Binding, 'binding', [dict(binding=name) for name, w in BINDINGS])
+        location_ids = write_lookups(ShelfLocation, 'location',
+                                     [dict(location=name) for name in SHELF_LOCATIONS])
+        shipping_ids = write_lookups(ShippingMethod, 'shipping_method',
+                                     [dict(shipping_method=name) for name in SHIPPING_METHODS])
+    for cls in (Publisher, Distributor, Binding, ShelfLocation, ShippingMethod):
+        lookup_cache.invalidate(cls)
+    done(Publisher, Distributor, Binding, ShelfLocation, ShippingMethod)
+
+    publisher_draw = _zipf(publisher_ids)
+    binding_draw = _Weighted(binding_ids, [w for name, w in BINDINGS])
+    author_counts = _Weighted([n for n, w in AUTHOR_COUNTS], [w for n, w in AUTHOR_COUNTS])
+    # a pool of writers with a few prolific ones
+    writers = _zipf([(last, first) for last in SURNAMES for first in FIRST_NAMES])
+    with connection.begin():
+        for start in range(0, books, chunk):
+            book_rows = []
+            author_rows = []
+            for n in range(start, min(start + chunk, books)):
+                names = [writers.draw(rand) for i in range(author_counts.draw(rand))]
+                title = ' '.join(rand.choice(TITLE_WORDS) for i in range(rand.randint(1, 5)))
+                book_rows.append(dict(book_id=n + 1, isbn13=make_isbn13(n), title=title,
+                                      author_name='; '.join(', '.join(name) for name in names),
+                                      publisher_id=publisher_draw.draw(rand),
+                                      binding_id=binding_draw.draw(rand),
+                                      location_id=rand.choice(location_ids)))
+                author_rows.extend(dict(book_id=n + 1, lastname=last, firstname=first)
+                                   for last, first in names)
+            write(Book, book_rows)
+            if author_rows:
+                write(Author, author_rows)
+    done(Book, Author)
+
+    distributor_draw = _zipf(distributor_ids)
+    bestsellers = _zipf(range(1, books + 1))
+    today = datetime.date.today()
+    with connection.begin():
+        for start in range(0, orders, chunk):
+            order_rows = []
+            entry_rows = []
+            for n in range(start, min(start + chunk, orders)):
+                order_rows.append(dict(order_id=n + 1, po='F{:07d}'.format(n),
+                                       date=today - datetime.timedelta(days=rand.randrange(5 * 365)),
+                                       distributor_id=distributor_draw.draw(rand),
+                                       shipping_id=rand.choice(shipping_ids),
+                                       comment=rand.choice(('', '', 'No Backorders', 'Rush'))))
+                lines = min(int(rand.expovariate(1.0 / mean_lines)) + 1, max_lines, books)
+                ordered = set()
+                while len(ordered) < lines:
+                    ordered.add(bestsellers.draw(rand))
+                entry_rows.extend(dict(order_id=n + 1, book_id=book_id,
+                                       quantity=rand.choice((1, 1, 1, 2, 2, 3, 5, 10)))
+                                  for book_id in sorted(ordered))
+            write(Order, order_rows)
+            write(OrderEntry, entry_rows)
+    done(Order, OrderEntry)
+    return counts
+
+
+def make_database(url, **kw):
+    """Create the schema at url, fill it with generate(**kw) and return an engine on it.
+
+    The database is stamped with the current schema version, and the search
+    index and change counters are installed once the rows are in, as
+    generate_bookdb_fixture leaves a new database.
+    """
+    from sqlalchemy import create_engine
+    from . import migrations, search
+    from .models import Base
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    migrations.stamp(engine)
+    with engine.connect() as connection:
+        generate(connection, **kw)
+    search.install(engine)
+    versions.install(engine)
+    return engine
@@ -0,0 +1,266 @@
+"""Bulk loading of books from CSV and ONIX files.
+
+Records are streamed from the file, validated, and written a batch at a time
+with executemany inserts and updates through SQLAlchemy Core, so a backlist
+of tens of thousands of titles loads in a few hundred statements. Books whose
+ISBN is already in the catalogue are updated in place.
+"""
+import csv
+import io
+import time
+from itertools import islice
+from xml.etree.ElementTree import iterparse
+
+from sqlalchemy import (
+    bindparam,
+    select,
+    )
+
+from . import (
+    isbn,
+    versions,
+    )
+from .models import (
+    Author,
+    Binding,
+    Book,
+    Publisher,
+    ShelfLocation,
+    lookup_cache,
+    )
+
+CSV_FIELDS = ('isbn13', 'title', 'author', 'publisher', 'binding', 'shelf_location')
+
+# ONIX ProductForm codes and the bindings they are filed under
+ONIX_BINDINGS = {
+    'BB': 'Cloth',
+    'BC': 'Paper',
+    }
+
+_PY2 = str is bytes
+
+
+def read_csv(f):
+    """Yield (line number, record) for each row of a CSV file opened in binary mode.
+
+    The file must be UTF-8 with a header row naming the CSV_FIELDS columns;
+    author is in the 'last1, first1; last2, first2' form.
+    """
+    if _PY2:
+        reader = csv.DictReader(f)
+    else:
+        reader = csv.DictReader(io.TextIOWrapper(f, encoding='utf-8', newline=''))
+    for row in reader:
+        record = dict((key, (row.get(key) or '').strip()) for key in CSV_FIELDS)
+        if _PY2:
+            record = dict((key, value.decode('utf-8')) for key, value in record.items())
+        yield reader.line_num, record
+
+
+def _local(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _child(elem, *path):
+    for name in path:
+        if elem is None:
+            return None
+        elem = next((c for c in elem if _local(c.tag) == name), None)
+    return elem
+
+
+def _children(elem, name):
+    return [c for c in elem if _local(c.tag) == name]
+
+
+def _text(elem, *path):
+    found = _child(elem, *path)
+    if found is None or found.text is None:
+        return ''
+    return found.text.strip()
+
+
+def _onix_record(product, shelf_location):
+    isbn13 = ''
+    for identifier in _children(product, 'ProductIdentifier'):
+        if _text(identifier, 'ProductIDType') == '15':
+            isbn13 = _text(identifier, 'IDValue')
+    detail = _child(product, 'DescriptiveDetail')
+    title_element = _child(detail, 'TitleDetail', 'TitleElement')
+    title = _text(title_element, 'TitleText')
+    if not title:
+        title = ' '.join(t for t in (_text(title_element, 'TitlePrefix'),
+                                     _text(title_element, 'TitleWithoutPrefix')) if t)
+    authors = []
+    for contributor in _children(detail, 'Contributor') if detail is not None else []:
+        if _text(contributor, 'ContributorRole') != 'A01':
+            continue
+        lastname = _text(contributor, 'KeyNames')
+        firstname = _text(contributor, 'NamesBeforeKey')
+        if not lastname:
+            lastname = _text(contributor, 'PersonNameInverted') or _text(contributor, 'PersonName')
+        if lastname:
+            authors.append(', '.join(n for n in (lastname, firstname) if n))
+    return dict(isbn13=isbn13,
+                title=title,
+                author='; '.join(authors),
+                publisher=_text(product, 'PublishingDetail', 'Publisher', 'PublisherName'),
+                binding=ONIX_BINDINGS.get(_text(detail, 'ProductForm'), ''),
+                shelf_location=shelf_location or '')
+
+
+def read_onix(f, shelf_location=None):
+    """Yield (product number, record) for each Product of an ONIX 3.0 file.
+
+    Only the parts of the message that the catalogue keeps are read, and each
+    product is discarded once it has been read, so memory use does not grow
+    with the file. ONIX has no shelf locations, so every record is filed
+    under shelf_location.
+    """
+    count = 0
+    root = None
+    for event, elem in iterparse(f, events=('start', 'end')):
+        if root is None:
+            root = elem
+        if event == 'end' and _local(elem.tag) == 'Product':
+            count += 1
+            yield count, _onix_record(elem, shelf_location)
+            root.clear()
+
+
+class BookImporter(object):
+    """Validate book records and write them to the database in batches.
+
+    Publishers, bindings and shelf locations are resolved from maps loaded
+    once at the start. Unknown publishers are created if create_missing is
+    true; otherwise, like unknown bindings and locations, the record is
+    rejected. progress(importer) is called after each batch.
+    """
+    def __init__(self, connection, batch_size=500, create_missing=False, progress=None):
+        self.connection = connection
+        # SQLite allows at most 999 parameters in an IN list
+        self.batch_size = min(batch_size, 900)
+        self.create_missing = create_missing
+        self.progress = progress
+        self.read = 0
+        self.inserted = 0
+        self.updated = 0
+        self.rejected = []  # (record number, isbn13, reason)
+        self.started = None
+        self._publishers = self._map(Publisher.short_name, Publisher.publisher_id)
+        self._bindings = self._map(Binding.binding, Binding.binding_id)
+        self._locations = self._map(ShelfLocation.location, ShelfLocation.location_id)
+
+    def _map(self, name, key):
+        return dict((row[0], row[1]) for row in self.connection.execute(select([name, key])))
+
+    @property
+    def rows_per_second(self):
+        elapsed = time.time() - self.started
+        return self.read / elapsed if elapsed > 0 else 0.0
+
+    def run(self, records):
+        """Import every (record number, record) of records; return self.
+
+        The records' ISBNs are checked and normalized batch_size at a time
+        with isbn.normalize_batch(), so hyphenated ISBNs and ISBN-10s are
+        filed under their ISBN-13.
+        """
+        self.started = time.time()
+        records = iter(records)
+        batch = {}
+        while True:
+            chunk = list(islice(records, self.batch_size))
+            if not chunk:
+                break
+            isbns, errors = isbn.normalize_batch([record.get('isbn13', '') for number, record in chunk])
+            for (number, record), isbn13 in zip(chunk, isbns):
+                self.read += 1
+                values = self._validate(number, record, isbn13)
+                if values is not None:
+                    # a later record for the same ISBN replaces an earlier one
+                    batch[values['isbn13']] = values
+                if len(batch) >= self.batch_size:
+                    self._write(batch)
+                    batch = {}
+        if batch:
+            self._write(batch)
+        return self
+
+    def _reject(self, number, record, reason):
+        self.rejected.append((number, record.get('isbn13', ''), reason))
+
+    def _validate(self, number, record, isbn13):
+        if isbn13 is None:
+            return self._reject(number, record, 'invalid ISBN')
+        if not record.get('title'):
+            return self._reject(number, record, 'missing title')
+        publisher_id = self._publishers.get(record.get('publisher'))
+        if publisher_id is None:
+            if not (self.create_missing and record.get('publisher')):
+                return self._reject(number, record, 'unknown publisher')
+            publisher_id = self._create_publisher(record['publisher'])
+        binding_id = self._bindings.get(record.get('binding'))
+        if binding_id is None:
+            return self._reject(number, record, 'unknown binding')
+        location_id = self._locations.get(record.get('shelf_location'))
+        if location_id is None:
+            return self._reject(number, record, 'unknown shelf location')
+        authors = Author.split_author_string(record.get('author', ''))
+        author_name = '; '.join(last if first is None else ', '.join((last, first))
+                                for last, first in authors)
+        return dict(isbn13=isbn13,
+                    title=record['title'].upper(),
+                    author_name=author_name,
+                    publisher_id=publisher_id,
+                    binding_id=binding_id,
+                    location_id=location_id,
+                    authors=authors)
+
+    def _create_publisher(self, name):
+        publishers = Publisher.__table__
+        result = self.connection.execute(publishers.insert(), short_name=name, full_name=name)
+        versions.bump(self.connection, ['publishers'])
+        lookup_cache.invalidate(Publisher)
+        self._publishers[name] = result.inserted_primary_key[0]
+        return self._publishers[name]
+
+    def _book_ids(self, isbns):
+        books = Book.__table__
+        rows = self.connection.execute(
+            select([books.c.isbn13, books.c.book_id]).where(books.c.isbn13.in_(isbns)))
+        return dict((row[0], row[1]) for row in rows)
+
+    def _write(self, batch):
+        books = Book.__table__
+        authors = Author.__table__
+        columns = ('isbn13', 'title', 'author_name', 'publisher_id', 'binding_id', 'location_id')
+        with self.connection.begin():
+            existing = self._book_ids(list(batch))
+            new = [dict((c, values[c]) for c in columns)
+                   for isbn13, values in batch.items() if isbn13 not in existing]
+            changed = [dict([('b_' + c, values[c]) for c in columns] + [('b_book_id', existing[isbn13])])
+                       for isbn13, values in batch.items() if isbn13 in existing]
+            if new:
+                self.connection.execute(books.insert(), new)
+            if changed:
+                self.connection.execute(
+                    books.update().where(books.c.book_id == bindparam('b_book_id')).values(
+                        dict((c, bindparam('b_' + c)) for c in columns)),
+                    changed)
+                self.connection.execute(
+                    authors.delete().where(authors.c.book_id.in_(list(existing.values()))))
+            book_ids = existing
+            if new:
+                book_ids.update(self._book_ids([values['isbn13'] for values in new]))
+            author_rows = [dict(book_id=book_ids[isbn13], lastname=last, firstname=first)
+                           for isbn13, values in batch.items()
+                           for last, first in values['authors']]
+            if author_rows:
+                self.connection.execute(authors.insert(), author_rows)
+            # one count per batch, not per row
+            versions.bump(self.connection, ['books', 'authors'])
+        self.inserted += len(new)
+        self.updated += len(changed)
+        if self.progress is not None:
+            self.progress(self)
@@ -0,0 +1,182 @@
+"""Checking ISBNs and normalizing them to ISBN-13, one at a time or in batches.
+
+normalize() takes an ISBN-13 or ISBN-10, with or without hyphens or
+spaces, and returns the bare ISBN-13 and an error code: OK, or why the code
+is not an ISBN. An ISBN-10 becomes the 978 ISBN-13 of the same book.
+
+normalize_batch() does the same for a whole list of codes. With NumPy
+installed, each block of BLOCK codes is made into a matrix of characters
+and checked and converted with array operations, without a Python loop
+over the codes, which is many times faster for catalogue imports and
+scanner batches of thousands of codes. Without NumPy it calls normalize()
+on each code. Either way the results are the same. NumPy is imported by
+the first batch rather than with this module, which models imports and so
+the app and every script load at startup.
+"""
+import re
+
+# set by _import_numpy(): the module, or None if it is not installed
+numpy = False
+
+# error codes
+OK = 0
+BAD_LENGTH = 1       # not 10 or 13 characters once hyphens and spaces are taken out
+BAD_CHARACTER = 2    # not all digits, but for an X check digit of an ISBN-10
+BAD_CHECK_DIGIT = 3  # the check digit does not match the others
+
+ERRORS = {
+    OK: 'valid',
+    BAD_LENGTH: 'not 10 or 13 digits',
+    BAD_CHARACTER: 'not all digits',
+    BAD_CHECK_DIGIT: 'wrong check digit',
+    }
+
+# a code this long or longer is never an ISBN, however it is hyphenated
+MAX_LENGTH = 24
+
+# codes checked at once by normalize_batch(); a block's arrays fit in the
+# processor's cache, and bound its memory
+BLOCK = 1 << 14
+
+_ISBN13 = re.compile(r'[0-9]{13}\Z')
+_ISBN10 = re.compile(r'[0-9]{9}[0-9Xx]\Z')
+
+_WEIGHTS13 = (1, 3) * 6 + (1,)
+_WEIGHTS10 = tuple(range(10, 0, -1))
+# the weighted sum of 978, the prefix of an ISBN-10 made an ISBN-13
+_PREFIX = (9, 7, 8)
+_PREFIX_SUM = 9 * 1 + 7 * 3 + 8 * 1
+
+
+def _check_digit13(values):
+    """Return the check digit of the ISBN-13 whose first 12 digits are values."""
+    return (10 - sum(v * w for v, w in zip(values, _WEIGHTS13)) % 10) % 10
+
+
+def normalize(code):
+    """Return (isbn13, OK) for code, an ISBN-13 or ISBN-10, or (None, error code)."""
+    if len(code) >= MAX_LENGTH:
+        return None, BAD_LENGTH
+    digits = code.replace('-', '').replace(' ', '')
+    if len(digits) == 13:
+        if _ISBN13.match(digits) is None:
+            return None, BAD_CHARACTER
+        values = [int(c) for c in digits]
+        if _check_digit13(values[:12]) != values[12]:
+            return None, BAD_CHECK_DIGIT
+        return digits, OK
+    if len(digits) == 10:
+        if _ISBN10.match(digits) is None:
+            return None, BAD_CHARACTER
+        values = [int(c) for c in digits[:9]] + [10 if digits[9] in 'Xx' else int(digits[9])]
+        if sum(v * w for v, w in zip(values, _WEIGHTS10)) % 11:
+            return None, BAD_CHECK_DIGIT
+        values = list(_PREFIX) + values[:9]
+        return ''.join(str(v) for v in values) + str(_check_digit13(values)), OK
+    return None, BAD_LENGTH
+
+
+def _import_numpy():
+    global numpy
+    if numpy is False:
+        try:
+            import numpy as module
+        except ImportError:  # checked one code at a time
+            module = None
+        numpy = module
+    return numpy
+
+
+def normalize_batch(codes):
+    """Return ([isbn13 or None, ...], [error code, ...]) for a list of codes, as normalize() does."""
+    if _import_numpy() is None:
+        results = [normalize(code) for code in codes]
+        return [isbn13 for isbn13, error in results], [error for isbn13, error in results]
+    isbns = []
+    errors = []
+    for start in range(0, len(codes), BLOCK):
+        block_isbns, block_errors = _normalize_block(codes[start:start + BLOCK])
+        isbns.extend(block_isbns)
+        errors.extend(block_errors)
+    return isbns, errors
+
+
+def _characters(codes):
+    """Return the codes' characters as a matrix with a column per code.
+
+    Row i holds the i-th characters of the codes, and zero past a code's
+    end, down to MAX_LENGTH rows; a code of MAX_LENGTH characters or more is
+    cut short, and so fills its column. Characters past Latin-1 are all 255,
+    which is not part of an ISBN either. A code's characters are a column
+    rather than a row so that each step below works along whole rows.
+    """
+    try:
+        chars = numpy.array(codes, dtype='S{}'.format(MAX_LENGTH))
+        chars = chars.view(numpy.uint8).reshape(len(codes), MAX_LENGTH)
+    except UnicodeError:  # not all ASCII
+        chars = numpy.array(codes, dtype='U{}'.format(MAX_LENGTH))
+        chars = chars.view(numpy.uint32).reshape(len(codes), MAX_LENGTH)
+        chars = numpy.minimum(chars, 255).astype(numpy.uint8)
+    return numpy.ascontiguousarray(chars.T)
+
+
+def _normalize_block(codes):
+    n = len(codes)
+    if not n:
+        return [], []
+    chars = _characters(codes)
+    too_long = chars[-1] != 0
+    separator = (chars == ord('-')) | (chars == ord(' '))
+    separated = separator.any(axis=0)
+    if separated.any():
+        # move each other character up by the number of separators above it
+        keep = (chars != 0) & ~separator
+        shift = numpy.cumsum(separator, axis=0, dtype=numpy.uint8)
+        packed = numpy.where(keep & (shift == 0), chars, 0).astype(numpy.uint8)
+        for up in range(1, int(shift[-1].max()) + 1):
+            moved = keep[up:] & (shift[up:] == up)
+            packed[:-up] = numpy.where(moved, chars[up:], packed[:-up])
+        chars = packed
+    length = (chars != 0).sum(axis=0)
+    is13 = (length == 13) & ~too_long
+    is10 = (length == 10) & ~too_long
+
+    # the other characters wrap around past 9
+    values = chars[:13] - numpy.uint8(ord('0'))
+    digit = values <= 9
+    # the check digit of an ISBN-10 may be X, for 10
+    x = is10 & ((chars[9] == ord('X')) | (chars[9] == ord('x')))
+    values[9, x] = 10
+    digit[9] |= x
+    values[~digit] = 0
+    digits13 = is13 & digit.all(axis=0)
+    digits10 = is10 & digit[:10].all(axis=0)
+    weights13 = numpy.array(_WEIGHTS13, dtype=numpy.uint8)[:, None]
+    weights10 = numpy.array(_WEIGHTS10, dtype=numpy.uint8)[:, None]
+    checked13 = digits13 & ((values * weights13).sum(axis=0, dtype=numpy.uint16) % 10 == 0)
+    checked10 = digits10 & ((values[:10] * weights10).sum(axis=0, dtype=numpy.uint16) % 11 == 0)
+
+    error = numpy.full(n, BAD_LENGTH, dtype=numpy.uint8)
+    error[is13 | is10] = BAD_CHARACTER
+    error[digits13 | digits10] = BAD_CHECK_DIGIT
+    error[checked13 | checked10] = OK
+
+    # a bare ISBN-13 is returned as it was given; only the others are made anew
+    remade = (checked13 & separated) | checked10
+    if not remade.any():
+        isbns = list(codes)
+        for i in numpy.flatnonzero(error).tolist():
+            isbns[i] = None
+        return isbns, error.tolist()
+    isbn13 = numpy.ascontiguousarray(values[:, remade].T)
+    # an ISBN-10 is 978, its first nine digits and a new check digit
+    ten = checked10[remade]
+    isbn13[ten, 3:12] = isbn13[ten, :9]
+    isbn13[ten, :3] = _PREFIX
+    weighted = (isbn13[ten, 3:12] * weights13[3:12, 0]).sum(axis=1, dtype=numpy.uint16) + _PREFIX_SUM
+    isbn13[ten, 12] = (10 - weighted % 10) % 10
+    isbn13 += ord('0')
+    isbns = numpy.array(codes, dtype=object)
+    isbns[remade] = isbn13.view('S13').ravel().astype('U13')
+    isbns[error != OK] = None
+    return isbns.tolist(), error.tolist()
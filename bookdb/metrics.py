@@ -0,0 +1,248 @@
+"""Per-route request, template and SQL timings, published on /_metrics.
+
+metrics_tween_factory times each request and keeps the totals by route
+name. The engine passed to instrument() counts and times the statements run
+on the request's thread, and BeforeRender and NewResponse subscribers mark
+when the template starts and when its response is made, so the time
+between them is put down to rendering; the commit and the tweens after it
+are not. A request that runs one statement shape more than
+metrics.n_plus_one_threshold times (10 by default) is logged and counted as
+an N+1. The totals are exposed in the Prometheus text format by the
+metrics view, to editors and to a scraper sending the metrics.bearer_token
+setting as an "Authorization: Bearer" header.
+
+Each statement costs two clock reads and a dict update, and each request
+one lock, so it is meant to stay on in production.
+"""
+import hmac
+import logging
+import re
+import threading
+import time
+
+from pyramid.events import (
+    BeforeRender,
+    NewResponse,
+    subscriber,
+    )
+from pyramid.httpexceptions import HTTPForbidden
+from pyramid.response import Response
+from sqlalchemy import event
+
+from .models import lookup_cache
+
+log = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+N_PLUS_ONE_THRESHOLD = 10
+
+# IN lists of different lengths are one statement shape
+_IN_LIST = re.compile(r'\((?:\?|%\(\w+\)s|:\w+)(?:, (?:\?|%\(\w+\)s|:\w+))*\)')
+
+_local = threading.local()
+
+
+def statement_shape(statement):
+    return _IN_LIST.sub('(?)', statement)
+
+
+class _RequestStats(object):
+    __slots__ = ('statements', 'sql_seconds', 'render_started', 'render_seconds')
+
+    def __init__(self):
+        self.statements = {}  # statement -> times run
+        self.sql_seconds = 0.0
+        self.render_started = None
+        self.render_seconds = 0.0
+
+
+class _RouteStats(object):
+    __slots__ = ('requests', 'seconds', 'buckets', 'render_seconds', 'statements',
+                 'sql_seconds', 'n_plus_one')
+
+    def __init__(self):
+        self.requests = 0
+        self.seconds = 0.0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.render_seconds = 0.0
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.n_plus_one = 0
+
+
+class RequestMetrics(object):
+    """Totals of the requests to each route."""
+    def __init__(self, n_plus_one_threshold=N_PLUS_ONE_THRESHOLD):
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def record(self, route, seconds, stats):
+        """Add one request to route's totals; return the statement shapes run too often."""
+        shapes = {}
+        for statement, count in stats.statements.items():
+            shape = statement_shape(statement)
+            shapes[shape] = shapes.get(shape, 0) + count
+        repeated = [(shape, count) for shape, count in shapes.items()
+                    if count > self.n_plus_one_threshold]
+        with self._lock:
+            route_stats = self._routes.get(route)
+            if route_stats is None:
+                route_stats = self._routes[route] = _RouteStats()
+            route_stats.requests += 1
+            route_stats.seconds += seconds
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    route_stats.buckets[i] += 1
+            route_stats.render_seconds += stats.render_seconds
+            route_stats.statements += sum(stats.statements.values())
+            route_stats.sql_seconds += stats.sql_seconds
+            if repeated:
+                route_stats.n_plus_one += 1
+        return repeated
+
+    def snapshot(self):
+        """Return {route: {total: value}} of everything recorded so far."""
+        with self._lock:
+            result = {}
+            for route, route_stats in self._routes.items():
+                totals = dict((name, getattr(route_stats, name)) for name in _RouteStats.__slots__)
+                totals['buckets'] = list(totals['buckets'])
+                result[route] = totals
+            return result
+
+    def clear(self):
+        with self._lock:
+            self._routes.clear()
+
+
+request_metrics = RequestMetrics()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = getattr(_local, 'stats', None)
+    if stats is not None:
+        stats.statements[statement] = stats.statements.get(statement, 0) + 1
+        conn.info.setdefault('bookdb_metrics_started', []).append(time.time())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = getattr(_local, 'stats', None)
+    started = conn.info.get('bookdb_metrics_started')
+    if stats is not None and started:
+        stats.sql_seconds += time.time() - started.pop()
+
+
+def instrument(engine):
+    """Count and time the statements engine runs during requests."""
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+@subscriber(BeforeRender)
+def _mark_render(event):
+    stats = getattr(_local, 'stats', None)
+    if stats is not None and stats.render_started is None:
+        stats.render_started = time.time()
+
+
+@subscriber(NewResponse)
+def _end_render(event):
+    stats = getattr(_local, 'stats', None)
+    if stats is not None and stats.render_started is not None:
+        stats.render_seconds += max(time.time() - stats.render_started, 0.0)
+        stats.render_started = None
+
+
+def metrics_tween_factory(handler, registry):
+    """Record the timings of every request in request_metrics."""
+    threshold = registry.settings.get('metrics.n_plus_one_threshold')
+    if threshold is not None:
+        request_metrics.n_plus_one_threshold = int(threshold)
+
+    def metrics_tween(request):
+        stats = _local.stats = _RequestStats()
+        started = time.time()
+        try:
+            return handler(request)
+        finally:
+            _local.stats = None
+            route = getattr(request.matched_route, 'name', 'unmatched')
+            for shape, count in request_metrics.record(route, time.time() - started, stats):
+                log.warning('%s ran one statement %d times (possible N+1): %s', request.path, count, shape)
+    return metrics_tween
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def exposition(snapshot, cache_stats):
+    """Return snapshot and lookup cache stats in the Prometheus text format."""
+    lines = []
+
+    def family(name, kind, text, samples):
+        lines.append('# HELP {} {}'.format(name, text))
+        lines.append('# TYPE {} {}'.format(name, kind))
+        lines.extend(samples)
+
+    routes = sorted(snapshot)
+
+    def per_route(name, key):
+        return ['{}{{route="{}"}} {}'.format(name, _escape(route), snapshot[route][key]) for route in routes]
+
+    family('bookdb_requests_total', 'counter', 'Requests handled.',
+           per_route('bookdb_requests_total', 'requests'))
+    histogram = []
+    for route in routes:
+        label = _escape(route)
+        for bound, count in zip(DURATION_BUCKETS, snapshot[route]['buckets']):
+            histogram.append('bookdb_request_seconds_bucket{{route="{}",le="{}"}} {}'.format(label, bound, count))
+        histogram.append('bookdb_request_seconds_bucket{{route="{}",le="+Inf"}} {}'.format(
+            label, snapshot[route]['requests']))
+        histogram.append('bookdb_request_seconds_sum{{route="{}"}} {}'.format(label, snapshot[route]['seconds']))
+        histogram.append('bookdb_request_seconds_count{{route="{}"}} {}'.format(label, snapshot[route]['requests']))
+    family('bookdb_request_seconds', 'histogram', 'Wall time of requests.', histogram)
+    family('bookdb_render_seconds_total', 'counter', 'Time spent rendering templates.',
+           per_route('bookdb_render_seconds_total', 'render_seconds'))
+    family('bookdb_sql_statements_total', 'counter', 'SQL statements run by requests.',
+           per_route('bookdb_sql_statements_total', 'statements'))
+    family('bookdb_sql_seconds_total', 'counter', 'Time spent in SQL statements run by requests.',
+           per_route('bookdb_sql_seconds_total', 'sql_seconds'))
+    family('bookdb_n_plus_one_total', 'counter',
+           'Requests that ran one statement shape more than the N+1 threshold.',
+           per_route('bookdb_n_plus_one_total', 'n_plus_one'))
+    tables = sorted(cache_stats)
+    family('bookdb_lookup_cache_hits_total', 'counter', 'Lookup cache hits.',
+           ['bookdb_lookup_cache_hits_total{{table="{}"}} {}'.format(t, cache_stats[t]['hits']) for t in tables])
+    family('bookdb_lookup_cache_misses_total', 'counter', 'Lookup cache misses.',
+           ['bookdb_lookup_cache_misses_total{{table="{}"}} {}'.format(t, cache_stats[t]['misses']) for t in tables])
+    return '\n'.join(lines) + '\n'
+
+
+def _may_scrape(request):
+    """Whether request is from an editor or carries the metrics.bearer_token."""
+    token = request.registry.settings.get('metrics.bearer_token')
+    if token:
+        credential = request.headers.get('Authorization', '')
+        # compared in constant time, so the token cannot be guessed a byte at a time
+        if hmac.compare_digest(credential.encode('utf-8'), ('Bearer ' + token).encode('utf-8')):
+            return True
+    return bool(request.has_permission('edit'))
+
+
+def metrics(request):
+    """The totals in the Prometheus text format; main() adds this view on /_metrics.
+
+    A scraper cannot log in, so rather than a view permission the view lets in
+    editors and any request with the metrics.bearer_token.
+    """
+    if not _may_scrape(request):
+        raise HTTPForbidden()
+    response = Response(body=exposition(request_metrics.snapshot(), lookup_cache.stats()).encode('utf-8'))
+    response.content_type = 'text/plain'
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    response.cache_control.no_cache = True
+    return response
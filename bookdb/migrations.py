@@ -0,0 +1,212 @@
+"""Numbered schema migrations for databases created by earlier versions of bookdb.
+
+The version a database is at is kept in the one-row schema_version table; a
+database without it is at version 0, the schema of the first release.
+initialize_bookdb_db creates the current schema and stamps it with HEAD, and
+migrate_bookdb_db brings an older database up (or down) to a version, one
+migration per transaction.
+
+A migration names the DDL it runs instead of reading it from the models, so
+that what it does stays fixed as the models change.
+"""
+from collections import namedtuple
+
+from sqlalchemy import (
+    Column,
+    Index,
+    Integer,
+    MetaData,
+    Table,
+    inspect,
+    select,
+    text,
+    )
+
+from . import (
+    search,
+    versions,
+    )
+
+Migration = namedtuple('Migration', 'version description upgrade downgrade')
+
+_metadata = MetaData()
+schema_version = Table('schema_version', _metadata,
+                       Column('version', Integer, nullable=False))
+
+
+def _index(name, table, columns):
+    columns = [Column(c) for c in columns]
+    return Index(name, *Table(table, MetaData(), *columns).columns)
+
+
+def _index_names(connection, tables):
+    inspector = inspect(connection)
+    return set(index['name'] for table in tables for index in inspector.get_indexes(table))
+
+
+def _create_indexes(indexes):
+    def upgrade(connection):
+        existing = _index_names(connection, set(table for name, table, columns in indexes))
+        for name, table, columns in indexes:
+            if name not in existing:
+                _index(name, table, columns).create(connection)
+    return upgrade
+
+
+def _drop_indexes(indexes):
+    def downgrade(connection):
+        existing = _index_names(connection, set(table for name, table, columns in indexes))
+        for name, table, columns in reversed(indexes):
+            if name in existing:
+                _index(name, table, columns).drop(connection)
+    return downgrade
+
+
+# (name, table, columns)
+_SORT_INDEXES = (
+    ('ix_books_title', 'books', ('title',)),
+    ('ix_books_author_name', 'books', ('author_name',)),
+    ('ix_authors_lastname', 'authors', ('lastname',)),
+    )
+
+_KEY_INDEXES = (
+    ('ix_books_publisher_id_isbn13', 'books', ('publisher_id', 'isbn13')),
+    ('ix_books_binding_id', 'books', ('binding_id',)),
+    ('ix_books_location_id', 'books', ('location_id',)),
+    ('ix_authors_book_id', 'authors', ('book_id',)),
+    ('ix_orders_distributor_id_date', 'orders', ('distributor_id', 'date')),
+    ('ix_orders_shipping_id', 'orders', ('shipping_id',)),
+    ('ix_orders_date', 'orders', ('date',)),
+    ('ix_order_entries_book_id', 'order_entries', ('book_id',)),
+    )
+
+# (name, table, expressions): the sort keys of Book.page(), which SQLAlchemy
+# cannot reflect, so they are made and dropped by name
+_SORT_KEY_INDEXES = (
+    ('ix_books_title_sort', 'books', "coalesce(title, ''), isbn13"),
+    ('ix_books_author_name_sort', 'books', "coalesce(author_name, ''), isbn13"),
+    )
+
+
+def _fill_author_names(connection):
+    """Set the author_name books made before it was kept to what Book.author_string() returns."""
+    rows = connection.execute(
+        'SELECT a.book_id, a.lastname, a.firstname FROM authors a '
+        'JOIN books b ON b.book_id = a.book_id WHERE b.author_name IS NULL '
+        'ORDER BY a.book_id, a.author_id')
+    names = {}
+    for book_id, lastname, firstname in rows:
+        name = lastname if firstname is None else ', '.join([lastname, firstname])
+        names.setdefault(book_id, []).append(name)
+    if names:
+        connection.execute(text('UPDATE books SET author_name = :author_name WHERE book_id = :book_id'),
+                           [dict(book_id=book_id, author_name='; '.join(authors))
+                            for book_id, authors in names.items()])
+    # books without authors
+    connection.execute("UPDATE books SET author_name = '' WHERE author_name IS NULL")
+
+
+def _fill_and_index_sort_keys(connection):
+    _fill_author_names(connection)
+    for name, table, expressions in _SORT_KEY_INDEXES:
+        connection.execute('CREATE INDEX IF NOT EXISTS {} ON {} ({})'.format(name, table, expressions))
+
+
+def _drop_sort_key_indexes(connection):
+    # the author names filled in are kept: they are what the books should have had
+    for name, table, expressions in reversed(_SORT_KEY_INDEXES):
+        connection.execute('DROP INDEX IF EXISTS {}'.format(name))
+
+
+def _install_search(connection):
+    # an index made before this migration ran has been kept up to date by
+    # its triggers; a new one is filled from the books already there
+    search.install(connection)
+
+
+# the per-row triggers migration 3 made, which bumped table_versions once
+# for every row written; versions.bump() now counts a flush or batch once
+_VERSION_TRIGGER = ("CREATE TRIGGER IF NOT EXISTS table_versions_{table}_{suffix} "
+                    "AFTER {event} ON {table} BEGIN "
+                    "UPDATE table_versions SET version = version + 1, "
+                    "modified = (julianday('now') - 2440587.5) * 86400.0 "
+                    "WHERE table_name = '{table}'; END")
+_VERSION_TRIGGER_EVENTS = (('ai', 'INSERT'), ('au', 'UPDATE'), ('ad', 'DELETE'))
+
+
+def _drop_version_triggers(connection):
+    if connection.dialect.name != 'sqlite':
+        return
+    for table in versions.TABLES:
+        for suffix, event in _VERSION_TRIGGER_EVENTS:
+            connection.execute('DROP TRIGGER IF EXISTS table_versions_{}_{}'.format(table, suffix))
+
+
+def _create_version_triggers(connection):
+    if connection.dialect.name != 'sqlite':
+        return
+    for table in versions.TABLES:
+        for suffix, event in _VERSION_TRIGGER_EVENTS:
+            connection.execute(_VERSION_TRIGGER.format(table=table, suffix=suffix, event=event))
+
+
+MIGRATIONS = (
+    Migration(1, 'index book titles and author names for sorting and search',
+              _create_indexes(_SORT_INDEXES), _drop_indexes(_SORT_INDEXES)),
+    Migration(2, 'index foreign keys and order dates',
+              _create_indexes(_KEY_INDEXES), _drop_indexes(_KEY_INDEXES)),
+    Migration(3, 'count the writes to each table for HTTP caching',
+              versions.install, versions.uninstall),
+    Migration(4, 'fill in missing author names and index the book list sort keys',
+              _fill_and_index_sort_keys, _drop_sort_key_indexes),
+    Migration(5, 'index book titles, authors and publishers for full text search',
+              _install_search, search.uninstall),
+    Migration(6, 'count writes to each table once per flush rather than once per row',
+              _drop_version_triggers, _create_version_triggers),
+    )
+
+HEAD = MIGRATIONS[-1].version
+
+
+def current_version(connection):
+    """Return the schema version of the database connection is on."""
+    if not connection.dialect.has_table(connection, schema_version.name):
+        return 0
+    version = connection.execute(select([schema_version.c.version])).scalar()
+    return version or 0
+
+
+def _set_version(connection, version):
+    schema_version.create(connection, checkfirst=True)
+    connection.execute(schema_version.delete())
+    connection.execute(schema_version.insert(), version=version)
+
+
+def stamp(engine, version=HEAD):
+    """Record that engine's database is at version without running anything."""
+    if version not in range(HEAD + 1):
+        raise ValueError("'{}' is not a schema version".format(version))
+    with engine.begin() as connection:
+        _set_version(connection, version)
+
+
+def upgrade(engine, version=HEAD):
+    """Run every migration after the database's version up to version.
+
+    If the database is past version, its migrations are undone instead.
+    Returns the migrations run, in the order they ran.
+    """
+    if version not in range(HEAD + 1):
+        raise ValueError("'{}' is not a schema version".format(version))
+    with engine.connect() as connection:
+        current = current_version(connection)
+    if current <= version:
+        steps = [(m, m.upgrade, m.version) for m in MIGRATIONS if current < m.version <= version]
+    else:
+        steps = [(m, m.downgrade, m.version - 1)
+                 for m in reversed(MIGRATIONS) if version < m.version <= current]
+    for m, run, reached in steps:
+        with engine.begin() as connection:
+            run(connection)
+            _set_version(connection, reached)
+    return [m for m, run, reached in steps]
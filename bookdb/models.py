@@ -1,53 +1,200 @@
 from sqlalchemy import (
+    and_,
+    or_,
     Column,
     Integer,
     Text,
     String,
     Date,
     ForeignKey,
+    Index,
+    event,
+    extract,
+    func,
     )
 
 from sqlalchemy.ext.declarative import declarative_base
 
 from sqlalchemy.orm import (
+    Session,
     scoped_session,
     sessionmaker,
     relationship,
+    contains_eager,
+    joinedload,
+    subqueryload,
     exc as sqlexceptions,
     )
 
 from zope.sqlalchemy import ZopeTransactionExtension
 
-from pyramid.security import (
-    Allow,
-    Everyone,
-    )
-
-import re
+import base64
+import json
 
-ISBN13_REGEX = re.compile("^\d{13}$")
+from . import isbn
+from .cache import LookupCache
 
 DBSession = scoped_session(sessionmaker(extension=ZopeTransactionExtension()))
 Base = declarative_base()
 
 
 def valid_isbn13(isbn13):
-    if ISBN13_REGEX.match(isbn13) is None:
-        return False
-    total = sum([int(num) * weight for num, weight in zip(isbn13, (1, 3) * 6)])
-    ck = (10 - (total % 10)) % 10
-    return ck == int(isbn13[-1])
+    """Return True if isbn13 is a bare ISBN-13, 13 digits with the right check digit."""
+    return isbn.normalize(isbn13) == (isbn13, isbn.OK)
+
+
+def _apply_load_profile(query, cls, load):
+    """Add the loader options of the named loading profile of cls to query.
+
+    Profiles are declared by the load_profiles() classmethod of each model and
+    name the relationships a group of templates will touch, so that they can
+    be fetched with the main query instead of one lazy load per row.
+    """
+    if load is None:
+        return query
+    try:
+        options = cls.load_profiles()[load]
+    except KeyError:
+        raise ValueError("'{}' is not a loading profile of {}".format(load, cls.__name__))
+    return query.options(*options)
+
+
+def _query(cls, load=None):
+    """Return a query of cls loaded by the named loading profile.
+
+    The 'lite' profile of a class with a lite_query() selects just the
+    columns its list pages show, as named tuples: they skip the identity map
+    and change tracking, but cannot be edited and have no relationships.
+    """
+    if load == 'lite' and hasattr(cls, 'lite_query'):
+        return cls.lite_query()
+    return _apply_load_profile(DBSession.query(cls), cls, load)
+
+
+def encode_cursor(key):
+    """Return an opaque, URL-safe token for a keyset pagination key."""
+    return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Return the key encoded by encode_cursor, or raise ValueError."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(str(cursor)).decode('utf-8'))
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError("'{}' is not a valid cursor".format(cursor))
+    if not isinstance(key, list) or len(key) != 2 or not all(isinstance(v, unicode) for v in key):
+        raise ValueError("'{}' is not a valid cursor".format(cursor))
+    return key
+
+
+def _load_lookup_table(cls):
+    """Load every row of cls, detached from any session, for lookup_cache.
+
+    The rows are read on DBSession's connection, inside its transaction.
+    """
+    session = Session(bind=DBSession.connection())
+    try:
+        rows = session.query(cls).order_by(getattr(cls, cls._lookup_column)).all()
+        session.expunge_all()
+    finally:
+        session.close()
+    return rows, dict((getattr(row, cls._lookup_column), row) for row in rows)
+
+
+def _written_in_transaction(cls):
+    """Return True if DBSession's transaction has written to cls.
+
+    Rows of cls added but not yet flushed are flushed first, as a query
+    would. Such a transaction reads cls for itself: the other transactions
+    share lookup_cache's rows and must not see its uncommitted writes.
+    """
+    session = DBSession()
+    if any(isinstance(obj, cls) for obj in session.new):
+        session.flush()
+    return cls in session.info.get('lookup_tables', ())
+
+
+lookup_cache = LookupCache(_load_lookup_table, private=_written_in_transaction)
+
+
+class LookupTable(object):
+    """Mixin for small, rarely written reference tables read through lookup_cache.
+
+    _lookup_column names the natural key column. list() returns shared,
+    detached rows for display; get() returns a copy merged into DBSession so
+    it can be assigned to relationships and edited.
+    """
+    _lookup_column = None
+
+    @classmethod
+    def get(cls, name, default=None):
+        row = lookup_cache.lookup(cls, name)
+        if row is None:
+            return default
+        return DBSession.merge(row, load=False)
+
+    @classmethod
+    def list(cls):
+        return lookup_cache.rows(cls)
+
+
+def _invalidate_lookup_tables(session, instances):
+    classes = set(type(obj) for obj in instances if isinstance(obj, LookupTable))
+    for cls in classes:
+        lookup_cache.invalidate(cls)
+    session.info.setdefault('lookup_tables', set()).update(classes)
+
+
+def _count_writes(session, tables):
+    # imported here as versions imports this module
+    from .versions import bump
+    bump(session.connection(), set(tables) | session.info.pop('bulk_written_tables', set()))
+
+
+@event.listens_for(DBSession, 'after_flush')
+def _after_flush(session, flush_context):
+    instances = list(session.new) + list(session.dirty) + list(session.deleted)
+    _invalidate_lookup_tables(session, instances)
+    _count_writes(session, set(obj.__tablename__ for obj in instances))
+
+
+@event.listens_for(DBSession, 'after_bulk_update')
+@event.listens_for(DBSession, 'after_bulk_delete')
+def _after_bulk_write(context):
+    # counted with the next flush, or at the commit
+    if context.result.rowcount:
+        session = context.session
+        session.info.setdefault('bulk_written_tables', set()).update(
+            d['entity'].__tablename__ for d in context.query.column_descriptions)
+
+
+@event.listens_for(DBSession, 'before_commit')
+def _before_commit(session):
+    if session.info.get('bulk_written_tables'):
+        _count_writes(session, ())
+
+
+@event.listens_for(DBSession, 'after_transaction_end')
+def _after_transaction_end(session, session_transaction):
+    # invalidate again so rows cached by other threads before a commit are
+    # dropped, whether the transaction was committed, rolled back or closed
+    if session_transaction.parent is None:
+        for cls in session.info.pop('lookup_tables', ()):
+            lookup_cache.invalidate(cls)
+        session.info.pop('bulk_written_tables', None)
 
 
 class Book(Base):
     __tablename__ = 'books'
+    # also serves the publisher filter of page() in isbn13 order
+    __table_args__ = (Index('ix_books_publisher_id_isbn13', 'publisher_id', 'isbn13'),)
     book_id = Column(Integer, primary_key=True)
-    binding_id = Column(Integer, ForeignKey('bindings.binding_id'), nullable=False)
-    location_id = Column(Integer, ForeignKey('shelf_locations.location_id'), nullable=False)
+    binding_id = Column(Integer, ForeignKey('bindings.binding_id'), nullable=False, index=True)
+    location_id = Column(Integer, ForeignKey('shelf_locations.location_id'), nullable=False, index=True)
     publisher_id = Column(Integer, ForeignKey('publishers.publisher_id'), nullable=False)
     isbn13 = Column(String(13), unique=True)
-    title = Column(String)
-    author_name = Column(String)  # use format 'last1, first1; last2, first2; ...'
+    title = Column(String, index=True)
+    author_name = Column(String, index=True)  # use format 'last1, first1; last2, first2; ...'
     publisher = relationship("Publisher")
     shelf_location = relationship("ShelfLocation")
     binding = relationship("Binding")
@@ -60,6 +207,7 @@ class Book(Base):
         self.binding = binding
         self.shelf_location = shelf_location
         self.authors = authors
+        self.author_name = self.author_string()
 
     def author_lastname(self):
         if self.authors == []:
@@ -71,28 +219,129 @@ class Book(Base):
         return '; '.join([unicode(a) for a in self.authors])
 
     @classmethod
-    def get(cls, isbn13, default=None):
+    def load_profiles(cls):
+        listing = (
+            joinedload(Book.publisher),
+            joinedload(Book.binding),
+            joinedload(Book.shelf_location),
+            )
+        return {
+            'listing': listing,
+            'detail': listing + (subqueryload(Book.authors),),
+            }
+
+    @classmethod
+    def lite_query(cls):
+        """Return a query of the columns of the book lists, for the 'lite' loading profile.
+
+        publisher, binding and shelf_location are the names a Book's would print.
+        """
+        return DBSession.query(Book.book_id, Book.isbn13, Book.title, Book.author_name,
+                               Publisher.short_name.label('publisher'),
+                               Binding.binding,
+                               ShelfLocation.location.label('shelf_location'),
+                               ).join(Publisher, Publisher.publisher_id == Book.publisher_id
+                               ).join(Binding, Binding.binding_id == Book.binding_id
+                               ).join(ShelfLocation, ShelfLocation.location_id == Book.location_id)
+
+    @classmethod
+    def id_of(cls, isbn13):
+        """Return a scalar subquery for the book_id of isbn13, to use inside another statement."""
+        return DBSession.query(Book.book_id).filter(Book.isbn13 == isbn13).as_scalar()
+
+    @classmethod
+    def get(cls, isbn13, default=None, load=None):
+        query = _apply_load_profile(DBSession.query(Book), cls, load)
         try:
-            result = DBSession.query(Book).filter_by(isbn13=isbn13).one()
+            result = query.filter_by(isbn13=isbn13).one()
         except sqlexceptions.NoResultFound:
             result = default
         return result
 
     @classmethod
-    def list(cls):
-        return DBSession.query(Book).order_by(Book.isbn13).all()
+    def list(cls, load=None):
+        return _query(cls, load).order_by(Book.isbn13).all()
+
+    @classmethod
+    def delete(cls, isbn13):
+        """Delete the book isbn13 and its authors without loading them; return 1, or 0 if there is no such book.
+
+        Objects already loaded into DBSession are not told of the delete.
+        """
+        DBSession.query(Author).filter(
+            Author.book_id == cls.id_of(isbn13)).delete(synchronize_session=False)
+        return DBSession.query(Book).filter(Book.isbn13 == isbn13).delete(synchronize_session=False)
+
+    # sort keys accepted by page(); isbn13 is unique so it breaks ties
+    SORT_COLUMNS = {
+        'isbn13': 'isbn13',
+        'title': 'title',
+        'author': 'author_name',
+        }
+
+    @classmethod
+    def page(cls, sort='isbn13', after=None, limit=50,
+             publisher=None, binding=None, shelf_location=None, load=None):
+        """Return (books, next_cursor) for one page of the catalogue.
+
+        Pages are found by seeking past the (sort column, isbn13) key of the
+        last row of the previous page, as encoded in the after cursor, so
+        every page costs one index range scan however deep it is. sort may be
+        prefixed with '-' for descending order. Filters take the entity
+        objects to restrict to. next_cursor is None on the last page.
+        """
+        descending = sort.startswith('-')
+        try:
+            column = getattr(Book, cls.SORT_COLUMNS[sort.lstrip('-')])
+        except KeyError:
+            raise ValueError("'{}' is not a supported sort order".format(sort))
+        # a missing title or author sorts as '', first, as the
+        # ix_books_*_sort indexes have it
+        key = column if column is Book.isbn13 else func.coalesce(column, '')
+        query = _query(cls, load)
+        if publisher is not None:
+            query = query.filter(Book.publisher_id == publisher.publisher_id)
+        if binding is not None:
+            query = query.filter(Book.binding_id == binding.binding_id)
+        if shelf_location is not None:
+            query = query.filter(Book.location_id == shelf_location.location_id)
+        if after is not None:
+            value, isbn13 = decode_cursor(after)
+            # the outer bound lets the index be searched rather than scanned
+            if descending:
+                seek = and_(key <= value, or_(key < value, Book.isbn13 < isbn13))
+            else:
+                seek = and_(key >= value, or_(key > value, Book.isbn13 > isbn13))
+            query = query.filter(seek)
+        if descending:
+            query = query.order_by(key.desc(), Book.isbn13.desc())
+        else:
+            query = query.order_by(key, Book.isbn13)
+        books = query.limit(limit + 1).all()
+        next_cursor = None
+        if len(books) > limit:
+            books = books[:limit]
+            last = books[-1]
+            next_cursor = encode_cursor([getattr(last, column.key) or '', last.isbn13])
+        return books, next_cursor
+
+
+# the sort keys of Book.page(), with a missing title or author as ''
+Index('ix_books_title_sort', func.coalesce(Book.title, ''), Book.isbn13)
+Index('ix_books_author_name_sort', func.coalesce(Book.author_name, ''), Book.isbn13)
 
 
 class Author(Base):
     __tablename__ = 'authors'
     author_id = Column(Integer, primary_key=True)
-    book_id = Column(Integer, ForeignKey('books.book_id'), nullable=False)
-    lastname = Column(String)
+    book_id = Column(Integer, ForeignKey('books.book_id'), nullable=False, index=True)
+    lastname = Column(String, index=True)
     firstname = Column(String)
     book = relationship("Book", back_populates="authors")
 
     @classmethod
-    def parse_author_string(cls, string):
+    def split_author_string(cls, string):
+        """Return [(lastname, firstname), ...] from 'last1, first1; last2, first2; ...'."""
         result = []
         authors = string.split('; ')
         for a in authors:
@@ -102,9 +351,13 @@ class Author(Base):
                 except ValueError:
                     lname = a
                     fname = None
-                result.append(Author(lname, fname))
+                result.append((lname, fname))
         return result
 
+    @classmethod
+    def parse_author_string(cls, string):
+        return [Author(lname, fname) for lname, fname in cls.split_author_string(string)]
+
     @classmethod
     def create_author_string(cls, authors):
         return u'; '.join(map(lambda x: ', '.join(x.lastname, x.firstname), authors))
@@ -122,11 +375,12 @@ class Author(Base):
 
 class Order(Base):
     __tablename__ = 'orders'
+    __table_args__ = (Index('ix_orders_distributor_id_date', 'distributor_id', 'date'),)
     order_id = Column(Integer, primary_key=True)
     distributor_id = Column(Integer, ForeignKey('distributors.distributor_id'), nullable=False)
-    shipping_id = Column(Integer, ForeignKey('shipping_methods.shipping_id'), nullable=False)
+    shipping_id = Column(Integer, ForeignKey('shipping_methods.shipping_id'), nullable=False, index=True)
     po = Column(String, unique=True)
-    date = Column(Date)
+    date = Column(Date, index=True)
     comment = Column(Text)
     order_entries = relationship("OrderEntry", back_populates="order", cascade="all, delete-orphan")
     distributor = relationship("Distributor")
@@ -140,20 +394,149 @@ class Order(Base):
         self.comment = comment
 
     @classmethod
-    def get(cls, po, default=None):
+    def load_profiles(cls):
+        return {
+            'listing': (joinedload(Order.distributor),),
+            'detail': (
+                joinedload(Order.distributor),
+                joinedload(Order.shipping_method),
+                subqueryload(Order.order_entries).joinedload(OrderEntry.book).joinedload(Book.publisher),
+                ),
+            # everything generate_order_pdf reads
+            'print': (
+                joinedload(Order.distributor),
+                joinedload(Order.shipping_method),
+                subqueryload(Order.order_entries).joinedload(OrderEntry.book).joinedload(Book.publisher),
+                subqueryload(Order.order_entries).joinedload(OrderEntry.book).joinedload(Book.binding),
+                subqueryload(Order.order_entries).joinedload(OrderEntry.book).subqueryload(Book.authors),
+                ),
+            }
+
+    def add_entries(self, lines):
+        """Add a batch of (isbn13, quantity) lines to this order.
+
+        All the ISBNs are checked in one isbn.normalize_batch(), which also
+        takes ISBN-10s and hyphenated ISBNs, and their books found with one
+        query. A line for a book already on the order, or repeated in lines,
+        adds its quantity to that entry. Returns one dict per line with the
+        line's isbn13, as normalized, quantity and status: 'added', 'merged',
+        'invalid isbn', 'invalid quantity' or 'unknown isbn'.
+        """
+        checked = []
+        isbns, errors = isbn.normalize_batch([code for code, quantity in lines])
+        for (code, quantity), isbn13 in zip(lines, isbns):
+            if isbn13 is None:
+                isbn13 = code
+                status = 'invalid isbn'
+            elif not isinstance(quantity, int) or quantity <= 0:
+                status = 'invalid quantity'
+            else:
+                status = None
+            checked.append((isbn13, quantity, status))
+        wanted = set(isbn13 for isbn13, quantity, status in checked if status is None)
+        books = {}
+        if wanted:
+            books = dict((book.isbn13, book)
+                         for book in DBSession.query(Book).filter(Book.isbn13.in_(wanted)))
+        entries = dict((entry.book_id, entry) for entry in self.order_entries)
+        report = []
+        for isbn13, quantity, status in checked:
+            if status is None:
+                book = books.get(isbn13)
+                if book is None:
+                    status = 'unknown isbn'
+                elif book.book_id in entries:
+                    entries[book.book_id].quantity += quantity
+                    status = 'merged'
+                else:
+                    entries[book.book_id] = OrderEntry(self, book, quantity)
+                    status = 'added'
+            report.append(dict(isbn13=isbn13, quantity=quantity, status=status))
+        return report
+
+    @classmethod
+    def id_of(cls, po):
+        """Return a scalar subquery for the order_id of po, to use inside another statement."""
+        return DBSession.query(Order.order_id).filter(Order.po == po).as_scalar()
+
+    @classmethod
+    def get(cls, po, default=None, load=None):
+        query = _apply_load_profile(DBSession.query(Order), cls, load)
         try:
-            result = DBSession.query(Order).filter_by(po=po).one()
+            result = query.filter_by(po=po).one()
         except sqlexceptions.NoResultFound:
             result = default
         return result
 
     @classmethod
-    def list(cls):
-        return DBSession.query(Order).order_by(Order.po).all()
+    def lite_query(cls):
+        """Return a query of the columns of the order list, for the 'lite' loading profile."""
+        return DBSession.query(Order.po, Order.date,
+                               Distributor.short_name.label('distributor'),
+                               ShippingMethod.shipping_method,
+                               ).join(Distributor, Distributor.distributor_id == Order.distributor_id
+                               ).join(ShippingMethod, ShippingMethod.shipping_id == Order.shipping_id)
 
+    @classmethod
+    def list(cls, load=None):
+        return _query(cls, load).order_by(Order.po).all()
 
-class Distributor(Base):
+    @classmethod
+    def summaries(cls, load=None):
+        """Return [(order, lines, units), ...] for every order, by po, in one query.
+
+        The lines and units of each order are summed by the database in a
+        grouped subquery, so no order entries are loaded. With the 'lite'
+        profile each row is instead a named tuple of the columns of
+        lite_query() followed by lines and units.
+        """
+        totals = DBSession.query(OrderEntry.order_id,
+                                 func.count(OrderEntry.book_id).label('lines'),
+                                 func.sum(OrderEntry.quantity).label('units'),
+                                 ).group_by(OrderEntry.order_id).subquery()
+        lines = func.coalesce(totals.c.lines, 0).label('lines')
+        units = func.coalesce(totals.c.units, 0).label('units')
+        if load == 'lite':
+            query = cls.lite_query().add_columns(lines, units)
+        else:
+            query = _apply_load_profile(DBSession.query(Order, lines, units), cls, load)
+        query = query.outerjoin(totals, totals.c.order_id == Order.order_id).order_by(Order.po)
+        if load == 'lite':
+            return query.all()
+        return [tuple(row) for row in query]
+
+    def print_lines(self):
+        """Return [(quantity, isbn13, title, first author's lastname, publisher, binding), ...].
+
+        The lines are sorted by title and ISBN, as they are printed, and read
+        with their books, publishers, bindings and authors in one query.
+        """
+        first_author = DBSession.query(Author.lastname).filter(
+            Author.book_id == Book.book_id).order_by(Author.author_id).limit(1).as_scalar()
+        query = DBSession.query(OrderEntry.quantity, Book.isbn13, Book.title,
+                                func.coalesce(first_author, ''),
+                                Publisher.short_name, Binding.binding,
+                                ).join(Book, Book.book_id == OrderEntry.book_id
+                                ).join(Publisher, Publisher.publisher_id == Book.publisher_id
+                                ).join(Binding, Binding.binding_id == Book.binding_id
+                                ).filter(OrderEntry.order_id == self.order_id
+                                ).order_by(Book.title, Book.isbn13)
+        return [tuple(row) for row in query]
+
+    @classmethod
+    def delete(cls, po):
+        """Delete the order po and its lines without loading them; return 1, or 0 if there is no such order.
+
+        Objects already loaded into DBSession are not told of the delete.
+        """
+        DBSession.query(OrderEntry).filter(
+            OrderEntry.order_id == cls.id_of(po)).delete(synchronize_session=False)
+        return DBSession.query(Order).filter(Order.po == po).delete(synchronize_session=False)
+
+
+class Distributor(LookupTable, Base):
     __tablename__ = 'distributors'
+    _lookup_column = 'short_name'
     distributor_id = Column(Integer, primary_key=True)
     short_name = Column(String, unique=True, nullable=False)
     full_name = Column(String, unique=True, nullable=False)
@@ -205,20 +588,50 @@ class Distributor(Base):
         return '\n'.join(address_lines)
 
     @classmethod
-    def get(cls, name, default=None):
-        try:
-            result = DBSession.query(Distributor).filter_by(short_name=name).one()
-        except sqlexceptions.NoResultFound:
-            result = default
-        return result
+    def summaries(cls):
+        """Return [(short_name, orders, lines, units, last_order), ...] for every distributor, by name.
+
+        The rows are named tuples from one grouped query; distributors with
+        no orders have zeros and None.
+        """
+        query = DBSession.query(Distributor.short_name,
+                                func.count(func.distinct(Order.order_id)).label('orders'),
+                                func.count(OrderEntry.book_id).label('lines'),
+                                func.coalesce(func.sum(OrderEntry.quantity), 0).label('units'),
+                                func.max(Order.date).label('last_order'),
+                                ).outerjoin(Order, Order.distributor_id == Distributor.distributor_id
+                                ).outerjoin(OrderEntry, OrderEntry.order_id == Order.order_id
+                                ).group_by(Distributor.distributor_id, Distributor.short_name)
+        return query.order_by(Distributor.short_name).all()
 
     @classmethod
-    def list(cls):
-        return DBSession.query(Distributor).order_by(Distributor.short_name).all()
-
-
-class Publisher(Base):
+    def totals(cls):
+        """Return {short_name: (orders, lines, units, last order date)} for every distributor.
+
+        One grouped query; distributors with no orders have zeros and None.
+        """
+        return dict((row[0], tuple(row[1:])) for row in cls.summaries())
+
+    def monthly_totals(self):
+        """Return [(year, month, orders, titles, units), ...] of this distributor's orders, latest first.
+
+        titles counts the different books ordered in the month.
+        """
+        year = extract('year', Order.date)
+        month = extract('month', Order.date)
+        query = DBSession.query(year, month,
+                                func.count(func.distinct(Order.order_id)),
+                                func.count(func.distinct(OrderEntry.book_id)),
+                                func.coalesce(func.sum(OrderEntry.quantity), 0),
+                                ).select_from(Order).outerjoin(OrderEntry, OrderEntry.order_id == Order.order_id
+                                ).filter(Order.distributor_id == self.distributor_id
+                                ).group_by(year, month).order_by(year.desc(), month.desc())
+        return [tuple(row) for row in query]
+
+
+class Publisher(LookupTable, Base):
     __tablename__ = 'publishers'
+    _lookup_column = 'short_name'
     publisher_id = Column(Integer, primary_key=True)
     short_name = Column(Text, unique=True, nullable=False)
     full_name = Column(Text)
@@ -233,21 +646,10 @@ class Publisher(Base):
     def __repr__(self):
         return self.short_name
 
-    @classmethod
-    def get(cls, name, default=None):
-        try:
-            result = DBSession.query(Publisher).filter_by(short_name=name).one()
-        except sqlexceptions.NoResultFound:
-            result = default
-        return result
-
-    @classmethod
-    def list(cls):
-        return DBSession.query(Publisher).order_by(Publisher.short_name).all()
 
-
-class ShelfLocation(Base):
+class ShelfLocation(LookupTable, Base):
     __tablename__ = 'shelf_locations'
+    _lookup_column = 'location'
     location_id = Column(Integer, primary_key=True)
     location = Column(Text, unique=True, nullable=False)
 
@@ -257,21 +659,10 @@ class ShelfLocation(Base):
     def __repr__(self):
         return self.location
 
-    @classmethod
-    def get(cls, location, default=None):
-        try:
-            result = DBSession.query(ShelfLocation).filter_by(location=location).one()
-        except sqlexceptions.NoResultFound:
-            result = default
-        return result
 
-    @classmethod
-    def list(cls):
-        return DBSession.query(ShelfLocation).order_by(ShelfLocation.location).all()
-
-
-class Binding(Base):
+class Binding(LookupTable, Base):
     __tablename__ = 'bindings'
+    _lookup_column = 'binding'
     binding_id = Column(Integer, primary_key=True)
     binding = Column(Text, unique=True, nullable=False)
 
@@ -281,21 +672,10 @@ class Binding(Base):
     def __repr__(self):
         return self.binding
 
-    @classmethod
-    def get(cls, binding, default=None):
-        try:
-            result = DBSession.query(Binding).filter_by(binding=binding).one()
-        except sqlexceptions.NoResultFound:
-            result = default
-        return result
 
-    @classmethod
-    def list(cls):
-        return DBSession.query(Binding).order_by(Binding.binding).all()
-
-
-class ShippingMethod(Base):
+class ShippingMethod(LookupTable, Base):
     __tablename__ = 'shipping_methods'
+    _lookup_column = 'shipping_method'
     shipping_id = Column(Integer, primary_key=True)
     shipping_method = Column(Text, unique=True, nullable=False)
 
@@ -305,21 +685,11 @@ class ShippingMethod(Base):
     def __repr__(self):
         return self.shipping_method
 
-    @classmethod
-    def get(cls, method, default=None):
-        try:
-            result = DBSession.query(ShippingMethod).filter_by(shipping_method=method).one()
-        except sqlexceptions.NoResultFound:
-            result = default
-        return result
-
-    @classmethod
-    def list(cls):
-        return DBSession.query(ShippingMethod).order_by(ShippingMethod.shipping_method).all()
-
 
 class OrderEntry(Base):
     __tablename__ = 'order_entries'
+    # the primary key indexes (order_id, book_id); this finds the orders of a book
+    __table_args__ = (Index('ix_order_entries_book_id', 'book_id'),)
     order_id = Column(Integer, ForeignKey('orders.order_id'), primary_key=True)
     book_id = Column(Integer, ForeignKey('books.book_id'), primary_key=True)
     quantity = Column(Integer)
@@ -333,18 +703,22 @@ class OrderEntry(Base):
 
     @classmethod
     def get(cls, po, isbn13, default=None):
+        """Return the line for isbn13 on order po, with its order and book, in one query."""
+        query = DBSession.query(OrderEntry).join(OrderEntry.order).join(OrderEntry.book).options(
+            contains_eager(OrderEntry.order), contains_eager(OrderEntry.book))
         try:
-            order = DBSession.query(Order).filter_by(po=po).one()
-            book = DBSession.query(Book).filter_by(isbn13=isbn13).one()
-            result = DBSession.query(OrderEntry).filter_by(order=order, book=book).one()
+            result = query.filter(Order.po == po, Book.isbn13 == isbn13).one()
         except sqlexceptions.NoResultFound:
             result = default
         return result
 
+    @classmethod
+    def delete(cls, po, isbn13):
+        """Delete the line for isbn13 on order po with one statement; return 1, or 0 if there is none.
 
-class RootFactory(object):
-    __acl__ = [(Allow, Everyone, 'view'),
-               (Allow, 'group:editors', 'edit')]
+        Objects already loaded into DBSession are not told of the delete.
+        """
+        return DBSession.query(OrderEntry).filter(
+            OrderEntry.order_id == Order.id_of(po),
+            OrderEntry.book_id == Book.id_of(isbn13)).delete(synchronize_session=False)
 
-    def __init__(self, request):
-        pass
@@ -0,0 +1,235 @@
+"""Purchase order PDFs, archived on disk under a digest of everything they show.
+
+An archived PDF is read and served from memory. One that is not is
+queued by submit(), as a transient copy of its order, for a pool of worker
+threads to draw and archive, so the request that asked for it returns at
+once and the order page polls status() until it is done. With no
+directory nothing is written, and every PDF is drawn in the request that
+asks for it; store() archives bytes drawn that way when there is one.
+"""
+import datetime
+import hashlib
+import json
+import logging
+import os
+import threading
+from io import BytesIO
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+from .models import (
+    Author,
+    Binding,
+    Book,
+    Distributor,
+    Order,
+    OrderEntry,
+    Publisher,
+    ShippingMethod,
+    )
+
+log = logging.getLogger(__name__)
+
+# bump when the layout of generate_order_pdf changes so cached PDFs are redrawn
+RENDER_VERSION = 2
+
+DISTRIBUTOR_FIELDS = ('short_name', 'full_name', 'account_number', 'sales_rep', 'phone', 'fax',
+                      'email', 'address1', 'address2', 'city', 'province', 'postal_code', 'country')
+
+
+def order_data(order):
+    """Return plain, picklable data holding everything printed on order's PDF.
+
+    Lines are sorted by title and ISBN, the order they are printed in.
+    """
+    shipping_method = None
+    if order.shipping_method is not None:
+        shipping_method = order.shipping_method.shipping_method
+    entries = sorted([entry.book.title,
+                      entry.book.isbn13,
+                      entry.quantity,
+                      [[a.lastname, a.firstname] for a in entry.book.authors],
+                      entry.book.publisher.short_name,
+                      entry.book.publisher.full_name,
+                      entry.book.binding.binding,
+                      ] for entry in order.order_entries)
+    return {
+        'po': order.po,
+        'date': order.date.isoformat() if order.date is not None else None,
+        'comment': order.comment,
+        'distributor': [getattr(order.distributor, field) for field in DISTRIBUTOR_FIELDS],
+        'shipping_method': shipping_method,
+        'entries': entries,
+        }
+
+
+def data_digest(data):
+    """Return a hex digest of order_data(), which names the order's PDF."""
+    return hashlib.sha1(json.dumps([RENDER_VERSION, data], sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def order_digest(order):
+    return data_digest(order_data(order))
+
+
+def order_from_data(data):
+    """Return a transient Order, with distributor and lines, built from order_data().
+
+    It belongs to no session, so it can be rendered on another thread or in
+    another process after the request that made it has finished.
+    """
+    shipping_method = None
+    if data['shipping_method'] is not None:
+        shipping_method = ShippingMethod(data['shipping_method'])
+    order_date = None
+    if data['date'] is not None:
+        order_date = datetime.datetime.strptime(data['date'], '%Y-%m-%d').date()
+    order = Order(data['po'], order_date, Distributor(*data['distributor']),
+                  shipping_method, data['comment'])
+    for title, isbn13, quantity, authors, short_name, full_name, binding in data['entries']:
+        book = Book(isbn13, title, Publisher(short_name, full_name), Binding(binding), None,
+                    authors=[Author(lastname, firstname) for lastname, firstname in authors])
+        OrderEntry(order, book, quantity)
+    return order
+
+
+def render_pdf(order):
+    """Return the PDF of order as bytes, drawn in memory."""
+    # ReportLab is only loaded once a PDF is drawn
+    from .printing import generate_order_pdf
+    buf = BytesIO()
+    generate_order_pdf(order, buf)
+    return buf.getvalue()
+
+
+class OrderPdfCache(object):
+    """A directory of order PDFs named by digest, and the threads that fill it."""
+    def __init__(self, directory=None, workers=2):
+        self.directory = directory
+        self.workers = workers
+        self._jobs = {}  # digest -> 'queued', 'rendering' or 'failed'
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._threads = []
+
+    def configure(self, directory, workers=2):
+        """Archive PDFs in directory, creating it if need be; None archives nothing.
+
+        A directory that cannot be created, say on a read-only disk, is
+        logged and nothing is archived.
+        """
+        if directory is not None and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                log.warning('Cannot create %s; order PDFs will not be archived', directory, exc_info=True)
+                directory = None
+        self.directory = directory
+        self.workers = workers
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest + '.pdf')
+
+    def status(self, digest):
+        """Return 'done', 'queued', 'rendering', 'failed' or 'missing'.
+
+        Without a directory every PDF is drawn on request, so it is 'done'.
+        """
+        if self.directory is None or os.path.exists(self.path(digest)):
+            return 'done'
+        with self._lock:
+            return self._jobs.get(digest, 'missing')
+
+    def read(self, digest):
+        """Return the archived PDF named digest, or None."""
+        if self.directory is None:
+            return None
+        try:
+            with open(self.path(digest), 'rb') as f:
+                return f.read()
+        except IOError:
+            return None
+
+    def store(self, digest, pdf):
+        """Archive the PDF bytes under digest on a worker thread, unless they are there or on the way."""
+        if self.directory is None:
+            return
+        with self._lock:
+            if self._jobs.get(digest) in (None, 'failed') and not os.path.exists(self.path(digest)):
+                self._jobs[digest] = 'queued'
+                self._queue.put((digest, None, pdf))
+                self._start_workers()
+
+    def submit(self, order, retry=False):
+        """Queue order for rendering unless its PDF is cached or on the way.
+
+        Returns (digest, status). A render that failed is only queued again
+        if retry is true.
+        """
+        data = order_data(order)
+        digest = data_digest(data)
+        status = self.status(digest)
+        if status == 'missing' or (retry and status == 'failed'):
+            with self._lock:
+                if self._jobs.get(digest) in (None, 'failed'):
+                    self._jobs[digest] = 'queued'
+                    self._queue.put((digest, order_from_data(data), None))
+                    self._start_workers()
+                status = self._jobs[digest]
+        return digest, status
+
+    def render(self, order):
+        """Render order in this thread if it is not archived, and return its path."""
+        data = order_data(order)
+        digest = data_digest(data)
+        if not os.path.exists(self.path(digest)):
+            self._write(digest, render_pdf(order_from_data(data)))
+        return self.path(digest)
+
+    def join(self):
+        """Block until every queued order has been rendered."""
+        self._queue.join()
+
+    def _start_workers(self):
+        self._threads = [t for t in self._threads if t.is_alive()]
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name='order-pdf-{}'.format(len(self._threads)))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            digest, order, pdf = self._queue.get()
+            with self._lock:
+                self._jobs[digest] = 'rendering'
+            try:
+                if pdf is None:
+                    pdf = render_pdf(order)
+                self._write(digest, pdf)
+            except Exception:
+                log.exception('Could not archive the PDF %s', digest)
+                with self._lock:
+                    self._jobs[digest] = 'failed'
+            else:
+                with self._lock:
+                    self._jobs.pop(digest, None)
+            finally:
+                self._queue.task_done()
+
+    def _write(self, digest, pdf):
+        # write beside the final name and rename, so readers never see a partial file
+        partial = '{}.{}.partial'.format(self.path(digest), threading.current_thread().ident)
+        try:
+            with open(partial, 'wb') as f:
+                f.write(pdf)
+            os.rename(partial, self.path(digest))
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+
+
+order_pdfs = OrderPdfCache()
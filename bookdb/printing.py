@@ -1,6 +1,8 @@
 from reportlab.lib import pagesizes
 from reportlab.pdfgen import canvas
-from reportlab.platypus import BaseDocTemplate, PageTemplate, Frame, Table, NextPageTemplate, Paragraph, TableStyle, Spacer
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus import BaseDocTemplate, PageTemplate, Frame, Flowable, LongTable, NextPageTemplate, Paragraph, TableStyle, Spacer
 from reportlab.lib.styles import StyleSheet1, ParagraphStyle
 from reportlab.lib.units import cm
 
@@ -8,6 +10,15 @@ _default_filename = 'order.pdf'
 PAGESIZE = pagesizes.letter
 PAGE_WIDTH, PAGE_HEIGHT = PAGESIZE
 MARGIN = 2 * cm
+FRAME_PADDING = 6
+COLUMNS = [1.0 * cm, 2.75 * cm, 6 * cm, 3.25 * cm, 3 * cm, 1.5 * cm]
+COLUMN_HEADINGS = ['Qty', 'ISBN', 'Title', 'Author', 'Publisher', 'Binding']
+CELL_PADDING = 6
+CELL_TOP_PADDING = 3
+CELL_BOTTOM_PADDING = 0.5 * cm
+# lines per table; splitting a table across pages copies all the rows after
+# the split, so one table for a long order takes time quadratic in its lines
+TABLE_CHUNK = 100
 
 stylesheet = StyleSheet1()
 stylesheet.add(ParagraphStyle(name='normal',
@@ -44,45 +55,67 @@ GST Registration: R105197891
 ''')
 
 
+def order_lines(order):
+    """Return order's lines as (quantity, isbn13, title, lastname, publisher, binding) in print order.
+
+    A saved order's lines are read in one query; the lines of a transient
+    order, such as one from pdfcache.order_from_data, are sorted here.
+    """
+    if order.order_id is not None:
+        return order.print_lines()
+    entries = sorted(order.order_entries, key=lambda e: (e.book.title or '', e.book.isbn13 or ''))
+    return [(entry.quantity,
+             entry.book.isbn13,
+             entry.book.title,
+             entry.book.author_lastname(),
+             unicode(entry.book.publisher),
+             unicode(entry.book.binding),
+             ) for entry in entries]
+
+
+def _cell(text, width):
+    """Return text as a plain table cell, broken into lines that fit in a column width wide."""
+    text = unicode(text) if text is not None else u''
+    width -= 2 * CELL_PADDING
+    if stringWidth(text, styleTR.fontName, styleTR.fontSize) <= width:
+        return text
+    return '\n'.join(simpleSplit(text, styleTR.fontName, styleTR.fontSize, width))
+
+
 def generate_order_pdf(order, filename=_default_filename):
+    """Draw order's PDF into filename, a path or a binary file object such as a BytesIO."""
     firstpage = FirstPageTemplate(order=order)
     laterpages = LaterPageTemplate(order=order)
     doc = BaseDocTemplate(filename, pagesize=PAGESIZE, pageTemplates=[firstpage, laterpages])
     story = [NextPageTemplate('later')]
 
-    columns = [1.0 * cm, 2.75 * cm, 6 * cm, 3.25 * cm, 3 * cm, 1.5 * cm]
-    data = [[
-        Paragraph('Qty', styleTH),
-        Paragraph('ISBN', styleTH),
-        Paragraph('Title', styleTH),
-        Paragraph('Author', styleTH),
-        Paragraph('Publisher', styleTH),
-        Paragraph('Binding', styleTH),
-        ]]
-
-    def compare_titles(a, b):
-        return cmp(a.book.title, b.book.title)
-
-    for entry in sorted(order.order_entries, compare_titles):
-        row = [
-            Paragraph(unicode(entry.quantity), styleTR),
-            Paragraph(unicode(entry.book.isbn13), styleTR),
-            Paragraph(unicode(entry.book.title), styleTR),
-            Paragraph(unicode(entry.book.author_lastname()), styleTR),
-            Paragraph(unicode(entry.book.publisher), styleTR),
-            Paragraph(unicode(entry.book.binding), styleTR),
-            ]
-        data.append(row)
-    table = Table(data, colWidths=columns, repeatRows=1)
-    table.setStyle(TableStyle([('BOTTOMPADDING', (0, 0), (-1, -1), 0.5 * cm),
-                               ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                               #('FONT', (0, 0), (-1, 0), styleTH.fontName, styleTH.fontSize),
-                               #('LEADING', (0, 0), (-1, 0), styleTH.leading),
-                               #('FONT', (0, 1), (-1, -1), styleTR.fontName, styleTR.fontSize),
-                               #('LEADING', (0, 1), (-1, -1), styleTR.leading),
-                               ]))
-
-    if len(order.order_entries) > 1:
+    lines = order_lines(order)
+    # plain strings in the fonts set by the TableStyle; a Paragraph per cell is
+    # wrapped again every time the table is measured or split, which is slow
+    cells = {}  # most authors, publishers and bindings repeat; measure each once
+
+    def cell(text, column):
+        key = (text, column)
+        if key not in cells:
+            cells[key] = _cell(text, COLUMNS[column])
+        return cells[key]
+    rows = [[unicode(quantity),
+             unicode(isbn13),
+             _cell(title, COLUMNS[2]),
+             cell(lastname, 3),
+             cell(publisher, 4),
+             cell(binding, 5),
+             ] for quantity, isbn13, title, lastname, publisher, binding in lines]
+    style = [('TOPPADDING', (0, 0), (-1, -1), CELL_TOP_PADDING),
+             ('BOTTOMPADDING', (0, 0), (-1, -1), CELL_BOTTOM_PADDING),
+             ('LEFTPADDING', (0, 0), (-1, -1), CELL_PADDING),
+             ('RIGHTPADDING', (0, 0), (-1, -1), CELL_PADDING),
+             ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+             ('FONT', (0, 0), (-1, -1), styleTR.fontName, styleTR.fontSize),
+             ('LEADING', (0, 0), (-1, -1), styleTR.leading),
+             ]
+
+    if len(lines) > 1:
         plural = 's'
     else:
         plural = ''
@@ -91,10 +124,58 @@ def generate_order_pdf(order, filename=_default_filename):
     story.append(Paragraph("ATTENTION: ORDER DEPARTMENT", styleN))
     story.append(Paragraph("<i>Special Instructions</i>:<b>" + order.comment + "</b>", styleN))
     story.append(Paragraph('<i>Please send the following title' + plural + ':</i>', styleN))
-    story.append(table)
+    # The lines go in tables of TABLE_CHUNK rows. Only the first has a heading
+    # row: LaterPageTemplate draws the headings at the top of every later page,
+    # so they are not repeated where one table follows another mid-page.
+    story.append(LongTable([COLUMN_HEADINGS] + rows[:TABLE_CHUNK], colWidths=COLUMNS, splitByRow=1,
+                           hAlign='LEFT', style=TableStyle(style + [
+                               ('FONT', (0, 0), (-1, 0), styleTH.fontName, styleTH.fontSize),
+                               ('LEADING', (0, 0), (-1, 0), styleTH.leading)])))
+    for start in range(TABLE_CHUNK, len(rows), TABLE_CHUNK):
+        story.append(LazyTable(rows[start:start + TABLE_CHUNK], colWidths=COLUMNS, splitByRow=1,
+                               hAlign='LEFT', style=TableStyle(style)))
     doc.build(story, canvasmaker=NumberedCanvas)
 
 
+class LazyTable(Flowable):
+    """A LongTable that is only made when it is laid out.
+
+    A table keeps a style object for every cell, so making every table of
+    a long document up front takes memory in proportion to its length.
+    """
+    def __init__(self, data, **kwargs):
+        Flowable.__init__(self)
+        self.hAlign = kwargs.get('hAlign', 'CENTER')
+        self._data = data
+        self._kwargs = kwargs
+        self._table = None
+
+    def table(self):
+        if self._table is None:
+            self._table = LongTable(self._data, **self._kwargs)
+            self._data = self._kwargs = None
+        return self._table
+
+    def wrap(self, availWidth, availHeight):
+        self.width, self.height = self.table().wrap(availWidth, availHeight)
+        return self.width, self.height
+
+    def split(self, availWidth, availHeight):
+        return self.table().split(availWidth, availHeight)
+
+    def draw(self):
+        self.table().drawOn(self.canv, 0, 0)
+
+
+def draw_column_headings(canv, top, headings=COLUMN_HEADINGS, widths=COLUMNS):
+    """Draw the headings of a table's columns, by default an order's, in a row whose top is at top."""
+    canv.setFont(styleTH.fontName, styleTH.fontSize)
+    x = MARGIN + FRAME_PADDING
+    for heading, width in zip(headings, widths):
+        canv.drawString(x + CELL_PADDING, top - CELL_TOP_PADDING - styleTH.fontSize, heading)
+        x += width
+
+
 class FirstPageTemplate(PageTemplate):
     """docstring for FirstPageTemplate"""
     def __init__(self, order=None):
@@ -214,10 +295,13 @@ class FirstPageTemplate(PageTemplate):
 
 class LaterPageTemplate(PageTemplate):
     """docstring for LaterPageTemplate"""
+    # the column headings, drawn above the frame by afterDrawPage
+    HEADING_HEIGHT = CELL_TOP_PADDING + styleTH.leading + CELL_BOTTOM_PADDING
+
     def __init__(self, order=None):
         frames = [Frame(MARGIN, MARGIN,
             PAGE_WIDTH - (2 * MARGIN),
-            PAGE_HEIGHT - (2 * MARGIN) - (1.5 * cm))]
+            PAGE_HEIGHT - (2 * MARGIN) - (1.5 * cm) - self.HEADING_HEIGHT)]
         self.order = order
         PageTemplate.__init__(self, id='later', frames=frames)
 
@@ -235,38 +319,45 @@ class LaterPageTemplate(PageTemplate):
         canvas.drawText(tx)
         canvas.setFont(styleN.fontName, styleN.fontSize)
         canvas.drawRightString(PAGE_WIDTH - 2 * cm, PAGE_HEIGHT - 2 * cm, right_text)
+        draw_column_headings(canvas, PAGE_HEIGHT - MARGIN - (1.5 * cm) - FRAME_PADDING)
         canvas.restoreState()
 
 
 class NumberedCanvas(canvas.Canvas):
-    def __init__(self, *args, **kwargs):
-        canvas.Canvas.__init__(self, *args, **kwargs)
-        self._codes = []
+    """A canvas that writes "Page x of y" at the top right of every page.
+
+    Each page draws a form that save() fills in once y is known, so pages
+    are finished as they are drawn rather than all held until the end.
+    """
+    def page_number_origin(self, number):
+        """Return where the right end of page number's "Page x of y" goes."""
+        X, Y = (PAGE_WIDTH - 2 * cm, PAGE_HEIGHT - 2 * cm)
+        if number != 1:  # offset so distributor name is above, except page 1
+            Y = Y - styleN.leading
+        return X, Y
 
     def showPage(self):
-        self._codes.append({'code': self._code, 'stack': self._codeStack})
-        self._startPage()
+        self.saveState()
+        self.translate(*self.page_number_origin(self._pageNumber))
+        self.doForm(self._page_number_form(self._pageNumber))
+        self.restoreState()
+        canvas.Canvas.showPage(self)
 
     def save(self):
-        """add page info to each page (page x of y)"""
-        # reset page counter
-        self._pageNumber = 0
-        for code in self._codes:
-            # recall saved page
-            self._code = code['code']
-            self._codeStack = code['stack']
+        """Define the page number forms now that the total is known, and write the file."""
+        total = self._pageNumber - 1
+        for number in range(1, total + 1):
+            # the text is right aligned on the form's origin
+            self.beginForm(self._page_number_form(number), lowerx=-PAGE_WIDTH / 2.0, upperx=0,
+                           lowery=-styleN.leading, uppery=styleN.leading)
             self.setFont(styleN.fontName, styleN.fontSize)
-            X, Y = (PAGE_WIDTH - 2 * cm, PAGE_HEIGHT - 2 * cm)
-            if self._pageNumber != 0:  # offset so distributor name is above, except page 1
-                Y = Y - styleN.leading
-            self.drawRightString(X, Y,
-                "Page %(this)i of %(total)i" % {
-                   'this': self._pageNumber + 1,
-                   'total': len(self._codes),
-                }
-            )
-            canvas.Canvas.showPage(self)
-        self._doc.SaveToFile(self._filename, self)
+            self.drawRightString(0, 0, "Page %(this)i of %(total)i" % {'this': number, 'total': total})
+            self.endForm()
+        canvas.Canvas.save(self)
+
+    @staticmethod
+    def _page_number_form(number):
+        return 'page-number-{}'.format(number)
 
 
 def create_text_object(canv, x, y, text, style, align='left'):
@@ -0,0 +1,210 @@
+"""Printed catalogue reports: shelf lists, catalogues by publisher and inventory sheets.
+
+A report's books are read with a yield_per query and made into tables of
+TABLE_CHUNK rows only as the pages are laid out, by ReportDocTemplate, so
+the rows, tables and cell styles in memory at once do not depend on the
+size of the catalogue. ReportLab still keeps each finished page's content
+until the file is written.
+"""
+import datetime
+from collections import namedtuple
+from io import BytesIO
+from itertools import islice
+from xml.sax.saxutils import escape
+
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import cm
+from reportlab.platypus import (
+    BaseDocTemplate,
+    CondPageBreak,
+    Frame,
+    LongTable,
+    PageTemplate,
+    Paragraph,
+    TableStyle,
+    )
+
+from .models import (
+    Binding,
+    Book,
+    DBSession,
+    Publisher,
+    ShelfLocation,
+    )
+from .printing import (
+    CELL_BOTTOM_PADDING,
+    CELL_PADDING,
+    CELL_TOP_PADDING,
+    FRAME_PADDING,
+    MARGIN,
+    PAGE_HEIGHT,
+    PAGE_WIDTH,
+    PAGESIZE,
+    NumberedCanvas,
+    TABLE_CHUNK,
+    _cell,
+    create_text_object,
+    draw_column_headings,
+    styleB,
+    styleN,
+    styleTH,
+    styleTR,
+    )
+
+# rows fetched from the database at a time
+YIELD_PER = 1000
+
+# title, the column the books are grouped and filtered by, and the headings,
+# widths and columns of the table; headings without a column are left blank
+Report = namedtuple('Report', 'title group headings widths columns')
+
+REPORTS = {
+    'shelf-list': Report(
+        'Shelf List', ShelfLocation.location,
+        ['ISBN', 'Title', 'Author', 'Publisher', 'Binding'],
+        [2.75 * cm, 6.25 * cm, 3.5 * cm, 3 * cm, 1.5 * cm],
+        [Book.isbn13, Book.title, Book.author_name, Publisher.short_name, Binding.binding]),
+    'catalogue': Report(
+        'Catalogue', Publisher.short_name,
+        ['ISBN', 'Title', 'Author', 'Binding', 'Location'],
+        [2.75 * cm, 6.25 * cm, 3.5 * cm, 1.5 * cm, 3 * cm],
+        [Book.isbn13, Book.title, Book.author_name, Binding.binding, ShelfLocation.location]),
+    'inventory': Report(
+        'Inventory', ShelfLocation.location,
+        ['ISBN', 'Title', 'Author', 'Publisher', 'Count'],
+        [2.75 * cm, 6.25 * cm, 3.5 * cm, 3 * cm, 1.5 * cm],
+        [Book.isbn13, Book.title, Book.author_name, Publisher.short_name]),
+    }
+
+styleGroup = ParagraphStyle(name='report-group', parent=styleB, spaceBefore=0.5 * cm, spaceAfter=0.25 * cm)
+
+# rows are packed closer than an order's lines
+ROW_BOTTOM_PADDING = 0.15 * cm
+
+# a group's heading starts a new page unless this much room is left under it
+GROUP_MIN_HEIGHT = 3 * cm
+
+
+def get_report(name):
+    try:
+        return REPORTS[name]
+    except KeyError:
+        raise ValueError("'{}' is not a report".format(name))
+
+
+def report_rows(name, group=None):
+    """Return an iterator of (group, column, ...) for report name's books, in print order.
+
+    The books are those of one group if group is given, say one shelf
+    location of a shelf list. They are fetched YIELD_PER at a time.
+    """
+    report = get_report(name)
+    query = DBSession.query(report.group, *report.columns).select_from(Book).join(
+        Publisher, Publisher.publisher_id == Book.publisher_id).join(
+        Binding, Binding.binding_id == Book.binding_id).join(
+        ShelfLocation, ShelfLocation.location_id == Book.location_id)
+    if group is not None:
+        query = query.filter(report.group == group)
+    return iter(query.order_by(report.group, Book.title, Book.isbn13).yield_per(YIELD_PER))
+
+
+def report_story(report, rows):
+    """Yield the flowables of report: a heading per group and tables of its rows."""
+    style = TableStyle([('TOPPADDING', (0, 0), (-1, -1), CELL_TOP_PADDING),
+                        ('BOTTOMPADDING', (0, 0), (-1, -1), ROW_BOTTOM_PADDING),
+                        ('LEFTPADDING', (0, 0), (-1, -1), CELL_PADDING),
+                        ('RIGHTPADDING', (0, 0), (-1, -1), CELL_PADDING),
+                        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+                        ('FONT', (0, 0), (-1, -1), styleTR.fontName, styleTR.fontSize),
+                        ('LEADING', (0, 0), (-1, -1), styleTR.leading),
+                        ])
+    blanks = [''] * (len(report.headings) - len(report.columns))
+
+    def table(batch):
+        return LongTable(batch, colWidths=report.widths, splitByRow=1, hAlign='LEFT', style=style)
+
+    group = batch = None
+    for row in rows:
+        if batch is None or row[0] != group:
+            if batch:
+                yield table(batch)
+            group = row[0]
+            batch = []
+            yield CondPageBreak(GROUP_MIN_HEIGHT)
+            yield Paragraph(escape(group or '(none)'), styleGroup)
+        batch.append([_cell(value, width) for value, width in zip(row[1:], report.widths)] + blanks)
+        if len(batch) == TABLE_CHUNK:
+            yield table(batch)
+            batch = []
+    if batch:
+        yield table(batch)
+    elif batch is None:
+        yield Paragraph('There are no books in this report.', styleN)
+
+
+class ReportPageTemplate(PageTemplate):
+    """The report's title and date, and its column headings, above a frame for its tables."""
+    HEADING_HEIGHT = CELL_TOP_PADDING + styleTH.leading + CELL_BOTTOM_PADDING
+
+    def __init__(self, report, subtitle, date):
+        frames = [Frame(MARGIN, MARGIN,
+            PAGE_WIDTH - (2 * MARGIN),
+            PAGE_HEIGHT - (2 * MARGIN) - (1.5 * cm) - self.HEADING_HEIGHT)]
+        self.report = report
+        self.subtitle = subtitle
+        self.date = date
+        PageTemplate.__init__(self, id='report', frames=frames)
+
+    def afterDrawPage(self, canvas, doc):
+        canvas.saveState()
+        left_text = "The Bob Miller Book Room\n{}".format(self.report.title)
+        tx = create_text_object(canvas, MARGIN, PAGE_HEIGHT - MARGIN, left_text, styleN, align='left')
+        canvas.drawText(tx)
+        center_text = "{}\n{}".format(self.subtitle, self.date.isoformat())
+        tx = create_text_object(canvas, PAGE_WIDTH / 2.0, PAGE_HEIGHT - MARGIN, center_text, styleN,
+                                align='center')
+        canvas.drawText(tx)
+        draw_column_headings(canvas, PAGE_HEIGHT - MARGIN - (1.5 * cm) - FRAME_PADDING,
+                             self.report.headings, self.report.widths)
+        canvas.restoreState()
+
+
+class ReportCanvas(NumberedCanvas):
+    def page_number_origin(self, number):
+        return PAGE_WIDTH - MARGIN, PAGE_HEIGHT - MARGIN
+
+
+class ReportDocTemplate(BaseDocTemplate):
+    """A document whose flowables are drawn from an iterator as the pages are laid out.
+
+    build() takes any iterable. The story handed to ReportLab is topped up
+    from it a flowable at a time, so it only holds what is being laid out.
+    """
+    def build(self, flowables, canvasmaker=ReportCanvas):
+        self._more = iter(flowables)
+        self._story = list(islice(self._more, 1))
+        BaseDocTemplate.build(self, self._story, canvasmaker=canvasmaker)
+
+    def handle_flowable(self, flowables):
+        # also called on lists of its own, e.g. for flowables left hanging at a page break
+        if flowables is self._story and len(flowables) == 1:
+            flowables.extend(islice(self._more, 1))
+        BaseDocTemplate.handle_flowable(self, flowables)
+
+
+def generate_report_pdf(name, filename, group=None, date=None):
+    """Draw report name, of one group if given, into filename, a path or a binary file object."""
+    report = get_report(name)
+    if date is None:
+        date = datetime.date.today()
+    subtitle = group if group is not None else 'All'
+    doc = ReportDocTemplate(filename, pagesize=PAGESIZE, title=report.title,
+                            pageTemplates=[ReportPageTemplate(report, subtitle, date)])
+    doc.build(report_story(report, report_rows(name, group)))
+
+
+def render_report(name, group=None):
+    """Return report name as PDF bytes."""
+    buf = BytesIO()
+    generate_report_pdf(name, buf, group)
+    return buf.getvalue()
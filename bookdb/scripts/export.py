@@ -0,0 +1,35 @@
+import argparse
+import sys
+
+from pyramid.paster import (
+    get_appsettings,
+    setup_logging,
+    )
+
+from ..database import engine_from_settings
+
+from .. import exporter
+
+
+def main(argv=sys.argv):
+    parser = argparse.ArgumentParser(
+        description='Write a table of the book database as CSV or JSON Lines.',
+        epilog='example: %(prog)s development.ini books csv books.csv')
+    parser.add_argument('config_uri')
+    parser.add_argument('table', choices=sorted(exporter.EXPORTS))
+    parser.add_argument('format', choices=sorted(exporter.FORMATS))
+    parser.add_argument('output', nargs='?', help='file to write (default: standard output)')
+    args = parser.parse_args(argv[1:])
+    setup_logging(args.config_uri)
+    settings = get_appsettings(args.config_uri)
+    engine = engine_from_settings(settings)
+    if args.output is None:
+        out = getattr(sys.stdout, 'buffer', sys.stdout)
+    else:
+        out = open(args.output, 'wb')
+    try:
+        for chunk in exporter.export(engine, args.table, args.format):
+            out.write(chunk)
+    finally:
+        if args.output is not None:
+            out.close()
@@ -0,0 +1,59 @@
+import argparse
+import sys
+
+from dateutil.parser import parse as parse_date
+
+from pyramid.paster import (
+    get_appsettings,
+    setup_logging,
+    )
+
+from ..database import engine_from_settings
+
+from ..models import (
+    DBSession,
+    Distributor,
+    )
+from ..pdfcache import order_pdfs
+from ..bulkpdf import (
+    select_orders,
+    render_orders,
+    zip_stream,
+    )
+
+
+def main(argv=sys.argv):
+    parser = argparse.ArgumentParser(
+        description='Write the PDFs of the selected purchase orders to a ZIP file.',
+        epilog='example: %(prog)s development.ini orders.zip --start 2012-01-01 --end 2012-01-31')
+    parser.add_argument('config_uri')
+    parser.add_argument('output', help='ZIP file to write')
+    parser.add_argument('--start', type=lambda s: parse_date(s).date(), help='first order date')
+    parser.add_argument('--end', type=lambda s: parse_date(s).date(), help='last order date')
+    parser.add_argument('--distributor', help='short name of the distributor')
+    parser.add_argument('--processes', type=int, help='rendering processes (default: one per CPU)')
+    args = parser.parse_args(argv[1:])
+    setup_logging(args.config_uri)
+    settings = get_appsettings(args.config_uri)
+    engine = engine_from_settings(settings)
+    DBSession.configure(bind=engine)
+    if 'order_pdf.directory' in settings:
+        order_pdfs.configure(settings['order_pdf.directory'])
+    distributor = None
+    if args.distributor is not None:
+        distributor = Distributor.get(args.distributor)
+        if distributor is None:
+            parser.error('no such distributor: {}'.format(args.distributor))
+    orders = select_orders(args.start, args.end, distributor)
+    pdfs = render_orders(orders, processes=args.processes)
+    DBSession.remove()
+
+    def report(pdfs):
+        for count, (po, pdf) in enumerate(pdfs, 1):
+            sys.stderr.write('\r{}/{} {}'.format(count, len(orders), po))
+            yield po, pdf
+        sys.stderr.write('\n')
+
+    with open(args.output, 'wb') as f:
+        for chunk in zip_stream(report(pdfs)):
+            f.write(chunk)
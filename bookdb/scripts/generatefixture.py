@@ -0,0 +1,61 @@
+import argparse
+import sys
+import time
+
+from pyramid.paster import (
+    get_appsettings,
+    setup_logging,
+    )
+
+from ..database import engine_from_settings
+
+from ..models import Base
+
+from .. import (
+    fixtures,
+    migrations,
+    search,
+    versions,
+    )
+
+
+def main(argv=sys.argv):
+    parser = argparse.ArgumentParser(
+        description='Fill an empty book database with synthetic books, distributors and orders.',
+        epilog='example: %(prog)s development.ini --books 100000 --orders 5000')
+    parser.add_argument('config_uri')
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--orders', type=int, default=1000)
+    parser.add_argument('--distributors', type=int, default=50)
+    parser.add_argument('--publishers', type=int, default=200)
+    parser.add_argument('--mean-lines', type=int, default=12,
+                        help='average number of lines on an order (default: %(default)s)')
+    parser.add_argument('--max-lines', type=int, default=100,
+                        help='most lines on one order (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv[1:])
+    setup_logging(args.config_uri)
+    settings = get_appsettings(args.config_uri)
+    engine = engine_from_settings(settings)
+    with engine.connect() as connection:
+        new = not engine.dialect.has_table(connection, 'books')
+    Base.metadata.create_all(engine)
+    if new:
+        migrations.stamp(engine)
+    started = time.time()
+
+    def progress(table, rows):
+        sys.stderr.write('{:>16} {:10} rows {:8.1f} s\n'.format(table, rows, time.time() - started))
+
+    with engine.connect() as connection:
+        try:
+            fixtures.generate(connection, books=args.books, orders=args.orders,
+                              distributors=args.distributors, publishers=args.publishers,
+                              mean_lines=args.mean_lines, max_lines=args.max_lines,
+                              seed=args.seed, progress=progress)
+        except ValueError as e:
+            parser.error(str(e))
+    # indexing the books once at the end is much quicker than through the triggers
+    search.install(engine)
+    progress('book_search', args.books)
+    versions.install(engine)
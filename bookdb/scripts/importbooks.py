@@ -0,0 +1,68 @@
+import argparse
+import csv
+import sys
+
+from pyramid.paster import (
+    get_appsettings,
+    setup_logging,
+    )
+
+from ..database import engine_from_settings
+
+from ..importer import (
+    BookImporter,
+    read_csv,
+    read_onix,
+    )
+
+
+def report_progress(importer):
+    sys.stderr.write('\r{} read, {} added, {} updated, {} rejected ({:.0f} rows/s)'.format(
+        importer.read, importer.inserted, importer.updated, len(importer.rejected),
+        importer.rows_per_second))
+
+
+def main(argv=sys.argv):
+    parser = argparse.ArgumentParser(
+        description='Add or update books from a CSV or ONIX 3.0 file.',
+        epilog='CSV files need a header row with the columns isbn13, title, author, '
+               'publisher, binding and shelf_location.')
+    parser.add_argument('config_uri')
+    parser.add_argument('filename')
+    parser.add_argument('--format', choices=('csv', 'onix'),
+                        help='file format (default: from the file extension)')
+    parser.add_argument('--shelf-location', help='shelf location for books read from ONIX')
+    parser.add_argument('--create-publishers', action='store_true',
+                        help='add publishers that are not in the database yet')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--rejects', help='write rejected records to this CSV file')
+    args = parser.parse_args(argv[1:])
+    file_format = args.format
+    if file_format is None:
+        file_format = 'onix' if args.filename.lower().endswith('.xml') else 'csv'
+    setup_logging(args.config_uri)
+    settings = get_appsettings(args.config_uri)
+    engine = engine_from_settings(settings)
+    with open(args.filename, 'rb') as f:
+        if file_format == 'onix':
+            records = read_onix(f, args.shelf_location)
+        else:
+            records = read_csv(f)
+        connection = engine.connect()
+        try:
+            importer = BookImporter(connection,
+                                    batch_size=args.batch_size,
+                                    create_missing=args.create_publishers,
+                                    progress=report_progress).run(records)
+        finally:
+            connection.close()
+    report_progress(importer)
+    sys.stderr.write('\n')
+    if args.rejects is not None:
+        with open(args.rejects, 'w') as f:
+            writer = csv.writer(f)
+            writer.writerow(('record', 'isbn13', 'reason'))
+            writer.writerows(importer.rejected)
+    else:
+        for number, isbn13, reason in importer.rejected:
+            sys.stderr.write('record {}: {} {}\n'.format(number, isbn13, reason))
@@ -4,13 +4,13 @@ import transaction
 
 from datetime import date
 
-from sqlalchemy import engine_from_config
-
 from pyramid.paster import (
     get_appsettings,
     setup_logging,
     )
 
+from ..database import engine_from_settings
+
 from ..models import (
     DBSession,
     Base,
@@ -24,6 +24,11 @@ from ..models import (
     OrderEntry,
     Author,
     )
+from .. import (
+    migrations,
+    search,
+    versions,
+    )
 
 
 def usage(argv):
@@ -39,9 +44,12 @@ def main(argv=sys.argv):
     config_uri = argv[1]
     setup_logging(config_uri)
     settings = get_appsettings(config_uri)
-    engine = engine_from_config(settings, 'sqlalchemy.')
+    engine = engine_from_settings(settings)
     DBSession.configure(bind=engine)
     Base.metadata.create_all(engine)
+    migrations.stamp(engine)
+    search.install(engine)
+    versions.install(engine)
     with transaction.manager:
         distributor = Distributor('Oxford')
         DBSession.add(distributor)
@@ -0,0 +1,42 @@
+import argparse
+import sys
+
+from pyramid.paster import (
+    get_appsettings,
+    setup_logging,
+    )
+
+from ..database import engine_from_settings
+
+from .. import migrations
+
+
+def main(argv=sys.argv):
+    parser = argparse.ArgumentParser(
+        description='Bring the schema of the book database up to date.',
+        epilog='example: %(prog)s development.ini')
+    parser.add_argument('config_uri')
+    parser.add_argument('--version', type=int, default=migrations.HEAD,
+                        help='schema version to move to (default: %(default)s, the latest); '
+                             'an earlier version undoes later migrations')
+    parser.add_argument('--show', action='store_true',
+                        help='print the current version and the migrations, and change nothing')
+    args = parser.parse_args(argv[1:])
+    setup_logging(args.config_uri)
+    settings = get_appsettings(args.config_uri)
+    engine = engine_from_settings(settings)
+    with engine.connect() as connection:
+        current = migrations.current_version(connection)
+    if args.show:
+        for m in migrations.MIGRATIONS:
+            print('{} {} {}'.format('*' if m.version <= current else ' ', m.version, m.description))
+        return
+    try:
+        done = migrations.upgrade(engine, args.version)
+    except ValueError as e:
+        parser.error(str(e))
+    if not done:
+        print('already at version {}'.format(current))
+    for m in done:
+        print('{} {}: {}'.format('upgraded' if m.version > current else 'downgraded',
+                                 m.version, m.description))
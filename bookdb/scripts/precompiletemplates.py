@@ -0,0 +1,34 @@
+import argparse
+import sys
+
+from pyramid.paster import (
+    get_appsettings,
+    setup_logging,
+    )
+
+from .. import (
+    main as make_app,
+    templating,
+    )
+
+
+def main(argv=sys.argv):
+    parser = argparse.ArgumentParser(
+        description='Compile the page templates into the template cache, for the app to import '
+                    'when it starts.',
+        epilog='example: %(prog)s production.ini')
+    parser.add_argument('config_uri')
+    parser.add_argument('--directory',
+                        help='cache directory to compile into (default: templates.cache_directory)')
+    args = parser.parse_args(argv[1:])
+    setup_logging(args.config_uri)
+    settings = get_appsettings(args.config_uri)
+    if args.directory:
+        settings['templates.cache_directory'] = args.directory
+    if not settings.get('templates.cache_directory'):
+        parser.error('{} sets no templates.cache_directory; give --directory'.format(args.config_uri))
+    settings['templates.precompile'] = 'false'
+    app = make_app({}, **settings)
+    for name, seconds in templating.precompile(app.registry):
+        print('{:24} {:7.3f} s'.format(name, seconds))
+    print('compiled into {}'.format(settings['templates.cache_directory']))
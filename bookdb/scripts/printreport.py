@@ -0,0 +1,35 @@
+import argparse
+import sys
+
+from pyramid.paster import (
+    get_appsettings,
+    setup_logging,
+    )
+
+from ..database import engine_from_settings
+
+from ..models import DBSession
+
+from ..reports import (
+    REPORTS,
+    generate_report_pdf,
+    )
+
+
+def main(argv=sys.argv):
+    parser = argparse.ArgumentParser(
+        description='Print a shelf list, catalogue or inventory sheet of the books to a PDF.',
+        epilog='example: %(prog)s development.ini shelf-list shelves.pdf --group Fiction')
+    parser.add_argument('config_uri')
+    parser.add_argument('report', choices=sorted(REPORTS))
+    parser.add_argument('output', help='PDF file to write')
+    parser.add_argument('--group', help='only this shelf location, or publisher for the catalogue')
+    args = parser.parse_args(argv[1:])
+    setup_logging(args.config_uri)
+    settings = get_appsettings(args.config_uri)
+    engine = engine_from_settings(settings)
+    DBSession.configure(bind=engine)
+    try:
+        generate_report_pdf(args.report, args.output, group=args.group)
+    finally:
+        DBSession.remove()
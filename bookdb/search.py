@@ -0,0 +1,153 @@
+"""Catalogue search over book titles, author names and publishers.
+
+On SQLite the catalogue is indexed by an FTS5 table, book_search, whose rowid
+is the book_id. Triggers on books, authors and publishers keep it up to date,
+so anything that writes those tables (the views, bulk imports, raw SQL) is
+searchable straight away. Other backends, or a SQLite database without the
+index, fall back to case-insensitive LIKE matching of the same words: the
+title, the authors' names and the publisher's names are scanned for a word
+starting with each search term.
+"""
+import re
+
+from sqlalchemy import (
+    or_,
+    text,
+    )
+
+from .models import (
+    DBSession,
+    Book,
+    Author,
+    Publisher,
+    _query,
+    )
+
+SEARCH_TABLE = 'book_search'
+
+_REFRESH = '''
+INSERT OR REPLACE INTO book_search (rowid, title, authors, publisher)
+SELECT b.book_id,
+       b.title,
+       (SELECT group_concat(a.lastname || ' ' || coalesce(a.firstname, ''), ' ')
+        FROM authors a WHERE a.book_id = b.book_id),
+       (SELECT p.short_name || ' ' || coalesce(p.full_name, '')
+        FROM publishers p WHERE p.publisher_id = b.publisher_id)
+FROM books b WHERE {where};
+'''
+
+_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS book_search USING fts5("
+    "title, authors, publisher, prefix='2 3', tokenize='unicode61 remove_diacritics 1')",
+    "CREATE TRIGGER IF NOT EXISTS book_search_books_ai AFTER INSERT ON books BEGIN"
+    + _REFRESH.format(where='b.book_id = new.book_id') + "END",
+    "CREATE TRIGGER IF NOT EXISTS book_search_books_au AFTER UPDATE OF title, publisher_id ON books BEGIN"
+    + _REFRESH.format(where='b.book_id = new.book_id') + "END",
+    "CREATE TRIGGER IF NOT EXISTS book_search_books_ad AFTER DELETE ON books BEGIN "
+    "DELETE FROM book_search WHERE rowid = old.book_id; END",
+    "CREATE TRIGGER IF NOT EXISTS book_search_authors_ai AFTER INSERT ON authors BEGIN"
+    + _REFRESH.format(where='b.book_id = new.book_id') + "END",
+    "CREATE TRIGGER IF NOT EXISTS book_search_authors_au AFTER UPDATE ON authors BEGIN"
+    + _REFRESH.format(where='b.book_id IN (old.book_id, new.book_id)') + "END",
+    "CREATE TRIGGER IF NOT EXISTS book_search_authors_ad AFTER DELETE ON authors BEGIN"
+    + _REFRESH.format(where='b.book_id = old.book_id') + "END",
+    "CREATE TRIGGER IF NOT EXISTS book_search_publishers_au AFTER UPDATE ON publishers BEGIN"
+    + _REFRESH.format(where='b.publisher_id = new.publisher_id') + "END",
+    ]
+
+
+def fts_available(bind):
+    """True if bind is a SQLite database with the book_search index installed."""
+    if bind.dialect.name != 'sqlite':
+        return False
+    found = bind.execute(text("SELECT 1 FROM sqlite_master WHERE name = :name"),
+                         {'name': SEARCH_TABLE}).first()
+    return found is not None
+
+
+def install(bind):
+    """Create the search index and its triggers, and index existing books.
+
+    Safe to run on a database that already has the index. Does nothing on
+    backends other than SQLite.
+    """
+    if bind.dialect.name != 'sqlite':
+        return
+    created = not fts_available(bind)
+    for statement in _DDL:
+        bind.execute(text(statement))
+    if created:
+        rebuild(bind)
+
+
+def uninstall(bind):
+    """Drop the search index and its triggers."""
+    if bind.dialect.name != 'sqlite':
+        return
+    triggers = bind.execute(text("SELECT name FROM sqlite_master "
+                                 "WHERE type = 'trigger' AND name LIKE 'book_search_%'"))
+    for name in [row[0] for row in triggers]:
+        bind.execute(text('DROP TRIGGER IF EXISTS {}'.format(name)))
+    bind.execute(text('DROP TABLE IF EXISTS book_search'))
+
+
+def rebuild(bind):
+    """Reindex every book."""
+    bind.execute(text('DELETE FROM book_search'))
+    bind.execute(text(_REFRESH.format(where='1')))
+
+
+def search_terms(query):
+    """Split a user's query into the words to search for."""
+    return re.findall(r'\w+', query, re.UNICODE)
+
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _word_prefix(columns, term):
+    """Return a clause true if a word of any of columns starts with term, in any case."""
+    prefix = _escape_like(term) + '%'
+    return or_(*[clause for column in columns
+                 for clause in (column.ilike(prefix, escape='\\'),
+                                column.ilike('% ' + prefix, escape='\\'))])
+
+
+def search_books(phrase, page=0, per_page=25, load='listing'):
+    """Return (books, more) for one page of books matching every word of phrase.
+
+    Each word matches as a prefix of a word in the title, an author's name
+    or the publisher's name. Results are ranked by relevance when the full
+    text index is available and by title otherwise. more is True if there
+    are further pages.
+    """
+    terms = search_terms(phrase)
+    if not terms:
+        return [], False
+    bind = DBSession.connection()
+    if fts_available(bind):
+        match = ' '.join('"{}"*'.format(term) for term in terms)
+        rows = DBSession.execute(
+            text('SELECT rowid FROM book_search WHERE book_search MATCH :match '
+                 'ORDER BY rank LIMIT :limit OFFSET :offset'),
+            {'match': match, 'limit': per_page + 1, 'offset': page * per_page})
+        ids = [row[0] for row in rows]
+        more = len(ids) > per_page
+        ids = ids[:per_page]
+        if not ids:
+            return [], False
+        query = _query(Book, load)
+        by_id = dict((book.book_id, book) for book in query.filter(Book.book_id.in_(ids)))
+        return [by_id[i] for i in ids if i in by_id], more
+    query = _query(Book, load)
+    for term in terms:
+        authors = DBSession.query(Author.book_id).filter(
+            _word_prefix((Author.lastname, Author.firstname), term))
+        publishers = DBSession.query(Publisher.publisher_id).filter(
+            _word_prefix((Publisher.short_name, Publisher.full_name), term))
+        query = query.filter(_word_prefix((Book.title,), term)
+                             | Book.book_id.in_(authors)
+                             | Book.publisher_id.in_(publishers))
+    books = query.order_by(Book.title, Book.isbn13).offset(page * per_page).limit(per_page + 1).all()
+    return books[:per_page], len(books) > per_page
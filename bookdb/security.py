@@ -1,3 +1,8 @@
+from pyramid.security import (
+    Allow,
+    Everyone,
+    )
+
 USERS = {'editor': 'editor',
          'viewer': 'viewer'}
 GROUPS = {'editor': ['group:editors']}
@@ -6,3 +11,11 @@ GROUPS = {'editor': ['group:editors']}
 def groupfinder(userid, request):
     if userid in USERS:
         return GROUPS.get(userid, [])
+
+
+class RootFactory(object):
+    __acl__ = [(Allow, Everyone, 'view'),
+               (Allow, 'group:editors', 'edit')]
+
+    def __init__(self, request):
+        pass
@@ -0,0 +1,85 @@
+"""Templates compiled ahead of time, and cached fragments of the edit pages.
+
+Chameleon compiles a template to Python the first time it is rendered,
+and each page's master.pt again for that page, keeping the code only in
+memory, so every worker pays for it on its first requests after a
+restart. configure_cache() sets CHAMELEON_CACHE, Chameleon's own setting
+for a directory it writes the compiled modules to and imports them from
+whenever the template is unchanged; precompile() compiles or imports every
+template in bookdb/templates at startup, through the same renderers the
+views use, so no request waits for it.
+
+datalist_options() renders the <option> elements of a lookup table's
+datalist once per lookup_cache snapshot of the table, so a write to it,
+or the snapshot running out, renders them again.
+"""
+import logging
+import os
+import sys
+import time
+from xml.sax.saxutils import escape
+
+from pyramid.renderers import RendererHelper
+
+from .models import lookup_cache
+
+log = logging.getLogger(__name__)
+
+TEMPLATE_DIRECTORY = os.path.join(os.path.dirname(__file__), 'templates')
+
+
+def configure_cache(directory):
+    """Keep compiled templates as modules in directory, made if missing; return whether they will be.
+
+    Chameleon reads CHAMELEON_CACHE once, when it is first imported, so this
+    has to run before anything imports it, as main() does. A directory that
+    cannot be created, say on a read-only disk, is logged and the templates
+    are compiled in memory instead.
+    """
+    directory = os.path.abspath(directory)
+    if 'chameleon.config' in sys.modules:
+        from chameleon.config import CACHE_DIRECTORY
+        if CACHE_DIRECTORY != directory:
+            log.warning('Chameleon is already loaded; templates will not be cached in %s', directory)
+        return CACHE_DIRECTORY == directory
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            log.warning('Cannot create %s; templates will not be cached', directory, exc_info=True)
+            return False
+    os.environ['CHAMELEON_CACHE'] = directory
+    return True
+
+
+def template_names():
+    return sorted(name for name in os.listdir(TEMPLATE_DIRECTORY) if name.endswith('.pt'))
+
+
+def precompile(registry):
+    """Compile every template as the views render it; return [(name, seconds), ...].
+
+    With a cache configured, templates compiled before are imported from it
+    instead, and so are the templates a page loads, such as master.pt, when
+    the page first loads them; without one, each page compiles those again
+    on its first render.
+    """
+    import bookdb
+    timings = []
+    for name in template_names():
+        started = time.time()
+        helper = RendererHelper(name='templates/' + name, package=bookdb, registry=registry)
+        helper.renderer.implementation().cook_check()
+        timings.append((name, time.time() - started))
+    log.info('compiled %d templates in %.3f s', len(timings), sum(seconds for name, seconds in timings))
+    return timings
+
+
+def _options(rows):
+    return u''.join(u'<option value="{}" />'.format(escape(getattr(row, row._lookup_column), {'"': '&quot;'}))
+                    for row in rows)
+
+
+def datalist_options(cls):
+    """Return the <option> elements of a datalist of cls's names, for tal:content="structure ..."."""
+    return lookup_cache.derived(cls, 'datalist_options', _options)
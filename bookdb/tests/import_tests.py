@@ -0,0 +1,182 @@
+import unittest
+from io import BytesIO
+
+from bookdb.tests.view_tests import (
+    _initTestingDB,
+    _make_isbn13,
+    _StatementCounter,
+    )
+
+CSV = u'''isbn13,title,author,publisher,binding,shelf_location
+{new1},Little Dorrit,"Dickens, Charles",Penguin,Paper,Fiction
+{new2},Ethics,Spinoza,Oxford,Cloth,Philosophy
+{old},Tale of Two Cities,"Dickens, Charles; Brown, Dan",Penguin,Paper,Fiction
+9780000000000,Bad Checksum,,Penguin,Paper,Fiction
+{new3},No Such Binding,,Penguin,Vellum,Fiction
+{new4},New Publisher,,Verso,Paper,Fiction
+'''.format(new1=_make_isbn13(101), new2=_make_isbn13(102), new3=_make_isbn13(103),
+           new4=_make_isbn13(104), old=_make_isbn13(0)).encode('utf-8')
+
+ONIX = u'''<?xml version="1.0" encoding="UTF-8"?>
+<ONIXMessage release="3.0" xmlns="http://ns.editeur.org/onix/3.0/reference">
+  <Header><Sender><SenderName>Penguin</SenderName></Sender></Header>
+  <Product>
+    <RecordReference>1</RecordReference>
+    <ProductIdentifier><ProductIDType>15</ProductIDType><IDValue>{isbn}</IDValue></ProductIdentifier>
+    <DescriptiveDetail>
+      <ProductForm>BB</ProductForm>
+      <TitleDetail><TitleType>01</TitleType>
+        <TitleElement><TitleElementLevel>01</TitleElementLevel>
+          <TitlePrefix>The</TitlePrefix><TitleWithoutPrefix>Pickwick Papers</TitleWithoutPrefix>
+        </TitleElement>
+      </TitleDetail>
+      <Contributor><ContributorRole>A01</ContributorRole>
+        <NamesBeforeKey>Charles</NamesBeforeKey><KeyNames>Dickens</KeyNames></Contributor>
+      <Contributor><ContributorRole>B01</ContributorRole><KeyNames>Editor</KeyNames></Contributor>
+    </DescriptiveDetail>
+    <PublishingDetail><Publisher><PublisherName>Penguin</PublisherName></Publisher></PublishingDetail>
+  </Product>
+</ONIXMessage>
+'''.format(isbn=_make_isbn13(200)).encode('utf-8')
+
+
+class BookImporterTests(unittest.TestCase):
+    def setUp(self):
+        self.session, self.engine = _initTestingDB()
+
+    def tearDown(self):
+        self.session.remove()
+
+    def _import(self, records, **kw):
+        from bookdb.importer import BookImporter
+        connection = self.engine.connect()
+        try:
+            return BookImporter(connection, **kw).run(records)
+        finally:
+            connection.close()
+
+    def test_csv(self):
+        from bookdb.importer import read_csv
+        from bookdb.models import Book
+        importer = self._import(read_csv(BytesIO(CSV)))
+        self.assertEqual((importer.read, importer.inserted, importer.updated), (6, 2, 1))
+        self.assertEqual([(n, reason) for n, isbn13, reason in importer.rejected],
+                         [(5, 'invalid ISBN'), (6, 'unknown binding'), (7, 'unknown publisher')])
+        book = Book.get(_make_isbn13(0))
+        self.assertEqual(book.title, 'TALE OF TWO CITIES')
+        self.assertEqual(book.author_name, 'Dickens, Charles; Brown, Dan')
+        self.assertEqual(len(book.authors), 2)
+        self.assertEqual(repr(Book.get(_make_isbn13(102)).binding), 'Cloth')
+
+    def test_create_publishers(self):
+        from bookdb.importer import read_csv
+        from bookdb.models import Book, Publisher
+        self.assertEqual(Publisher.get('Verso'), None)
+        importer = self._import(read_csv(BytesIO(CSV)), create_missing=True)
+        self.assertEqual(importer.inserted, 3)
+        self.assertEqual(repr(Book.get(_make_isbn13(104)).publisher), 'Verso')
+        # the cached publishers were dropped
+        self.assertEqual(Publisher.get('Verso').short_name, 'Verso')
+
+    def test_normalized_isbns(self):
+        from bookdb.models import Book
+        hyphenated = _make_isbn13(105)[:3] + '-' + _make_isbn13(105)[3:]
+        records = [(1, dict(isbn13=hyphenated, title='Hyphenated', publisher='Penguin',
+                            binding='Paper', shelf_location='Fiction')),
+                   (2, dict(isbn13='0-306-40615-2', title='Ten Digits', publisher='Penguin',
+                            binding='Paper', shelf_location='Fiction')),
+                   (3, dict(isbn13='0306406153', title='Bad Check Digit', publisher='Penguin',
+                            binding='Paper', shelf_location='Fiction'))]
+        importer = self._import(records)
+        self.assertEqual(importer.inserted, 2)
+        self.assertEqual(importer.rejected, [(3, '0306406153', 'invalid ISBN')])
+        self.assertEqual(Book.get(_make_isbn13(105)).title, 'HYPHENATED')
+        self.assertEqual(Book.get('9780306406157').title, 'TEN DIGITS')
+
+    def test_batches(self):
+        from bookdb.importer import read_csv
+        records = list(read_csv(BytesIO(CSV)))
+        from bookdb.versions import table_versions
+        many = [(n, dict(record, isbn13=_make_isbn13(1000 + n)))
+                for n, (line, record) in enumerate(records[:2] * 50)]
+        before = table_versions()
+        with _StatementCounter(self.engine) as counter:
+            importer = self._import(many, batch_size=25)
+        self.assertEqual(importer.inserted, 100)
+        self.assertEqual(table_versions()['books'][0], before['books'][0] + 4)
+        # three lookup maps, then a lookup, insert, id lookup, author insert and
+        # change count per batch
+        self.assertEqual(counter.count, 3 + 4 * 5)
+
+    def test_onix(self):
+        from bookdb.importer import read_onix
+        from bookdb.models import Book
+        records = list(read_onix(BytesIO(ONIX), shelf_location='Fiction'))
+        self.assertEqual(records[0][1]['author'], 'Dickens, Charles')
+        importer = self._import(records)
+        self.assertEqual(importer.inserted, 1)
+        book = Book.get(_make_isbn13(200))
+        self.assertEqual(book.title, 'THE PICKWICK PAPERS')
+        self.assertEqual(repr(book.binding), 'Cloth')
+
+    def test_search_index(self):
+        from bookdb.importer import read_csv
+        from bookdb.search import search_books
+        self._import(read_csv(BytesIO(CSV)))
+        books, more = search_books('spinoza')
+        self.assertEqual([b.isbn13 for b in books], [_make_isbn13(102)])
+
+
+class ExporterTests(unittest.TestCase):
+    def setUp(self):
+        self.session, self.engine = _initTestingDB()
+
+    def tearDown(self):
+        self.session.remove()
+
+    def test_books_csv(self):
+        import csv
+        import io
+        from bookdb.exporter import export
+        chunks = list(export(self.engine, 'books', 'csv', batch_size=3))
+        # the header and first batch, then three more batches
+        self.assertEqual(len(chunks), 4)
+        rows = list(csv.reader(io.StringIO(b''.join(chunks).decode('utf-8'))))
+        self.assertEqual(rows[0], ['isbn13', 'title', 'authors', 'publisher', 'binding', 'shelf_location'])
+        self.assertEqual(rows[1], [_make_isbn13(0), 'TITLE 0', 'Author0, First', 'Fordham', 'Paper', 'Fiction'])
+        self.assertEqual(len(rows), 11)
+
+    def test_books_from_before_author_names(self):
+        import csv
+        import io
+        from bookdb import migrations
+        from bookdb.exporter import export
+        with self.engine.begin() as conn:
+            conn.execute('UPDATE books SET author_name = NULL')
+        migrations.stamp(self.engine, 3)
+        migrations.upgrade(self.engine)
+        rows = list(csv.reader(io.StringIO(b''.join(export(self.engine, 'books', 'csv')).decode('utf-8'))))
+        self.assertEqual(rows[1][2], 'Author0, First')
+
+    def test_orders_jsonl(self):
+        import json
+        from bookdb.exporter import export
+        lines = b''.join(export(self.engine, 'orders', 'jsonl')).decode('utf-8').splitlines()
+        self.assertEqual(json.loads(lines[0]), {'po': '1A1000', 'date': '2012-01-01',
+                                                'distributor': 'Oxford', 'shipping_method': 'Usual Means',
+                                                'comment': 'No Backorders'})
+        self.assertEqual(len(lines), 2)
+
+    def test_unknown(self):
+        from bookdb.exporter import export
+        self.assertRaises(ValueError, export, self.engine, 'users', 'csv')
+        self.assertRaises(ValueError, export, self.engine, 'books', 'xml')
+
+    def test_view(self):
+        from pyramid import testing
+        from bookdb.views import export
+        request = testing.DummyRequest()
+        request.matchdict = {'table': 'order_entries', 'format': 'csv'}
+        response = export(request)
+        self.assertEqual(response.content_type, 'text/csv')
+        self.assertEqual(len(b''.join(response.app_iter).splitlines()), 11)
@@ -0,0 +1,112 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from sqlalchemy import inspect
+
+from bookdb import (
+    fixtures,
+    migrations,
+    )
+from bookdb.benchmarks.indexes import plans
+
+
+def _indexes(engine):
+    inspector = inspect(engine)
+    return set((table, index['name'], tuple(index['column_names']))
+               for table in inspector.get_table_names()
+               for index in inspector.get_indexes(table))
+
+
+class MigrationTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.engine = fixtures.make_database('sqlite:///' + os.path.join(self.directory, 'test.db'),
+                                             books=500, orders=10)
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.directory)
+
+    def test_upgrade_matches_create_all(self):
+        created = _indexes(self.engine)
+        self.assertEqual(len(migrations.upgrade(self.engine, 0)), migrations.HEAD)
+        self.assertTrue(len(_indexes(self.engine)) < len(created))
+        self.assertEqual([m.version for m in migrations.upgrade(self.engine)],
+                         list(range(1, migrations.HEAD + 1)))
+        self.assertEqual(_indexes(self.engine), created)
+        with self.engine.connect() as conn:
+            self.assertEqual(migrations.current_version(conn), migrations.HEAD)
+        self.assertEqual(migrations.upgrade(self.engine), [])
+
+    def test_plans_use_indexes(self):
+        migrations.upgrade(self.engine, 0)
+        with self.engine.connect() as conn:
+            before = plans(conn)
+        migrations.upgrade(self.engine)
+        with self.engine.connect() as conn:
+            after = plans(conn)
+        self.assertIn('SCAN', before['orders of a book'])
+        self.assertIn('ix_order_entries_book_id', after['orders of a book'])
+        self.assertIn('ix_authors_book_id', after['authors of a book'])
+        self.assertIn('ix_books_publisher_id_isbn13', after['books of a publisher'])
+        self.assertIn('ix_orders_distributor_id_date', after['orders of a distributor'])
+        self.assertIn('ix_books_title', after['books by title'])
+
+    def test_missing_schema_version_is_version_0(self):
+        with self.engine.begin() as conn:
+            conn.execute('DROP TABLE schema_version')
+            self.assertEqual(migrations.current_version(conn), 0)
+        # the indexes already there are left alone
+        self.assertEqual(len(migrations.upgrade(self.engine)), migrations.HEAD)
+
+    def test_author_names_filled_in(self):
+        with self.engine.begin() as conn:
+            names = [row[0] for row in conn.execute('SELECT author_name FROM books WHERE book_id <= 3 '
+                                                    'ORDER BY book_id')]
+            conn.execute("UPDATE books SET author_name = NULL WHERE book_id <= 2")
+            conn.execute("DELETE FROM authors WHERE book_id = 2")
+            conn.execute("INSERT INTO authors (book_id, lastname) VALUES (1, 'OTHER')")
+        migrations.upgrade(self.engine, 3)
+        migrations.upgrade(self.engine)
+        with self.engine.connect() as conn:
+            filled = [row[0] for row in conn.execute('SELECT author_name FROM books WHERE book_id <= 3 '
+                                                     'ORDER BY book_id')]
+            indexes = set(row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'"))
+        self.assertEqual(filled, ['; '.join(name for name in (names[0], 'OTHER') if name), '', names[2]])
+        self.assertTrue(set(['ix_books_title_sort', 'ix_books_author_name_sort']) <= indexes)
+
+    def test_search_index_filled_in(self):
+        from bookdb import search
+        migrations.upgrade(self.engine, 4)
+        with self.engine.connect() as conn:
+            self.assertFalse(search.fts_available(conn))
+            self.assertEqual(conn.execute("SELECT count(*) FROM sqlite_master WHERE type = 'trigger' "
+                                          "AND name LIKE 'book_search_%'").scalar(), 0)
+            title = conn.execute('SELECT title FROM books WHERE book_id = 7').scalar()
+        migrations.upgrade(self.engine)
+        with self.engine.connect() as conn:
+            self.assertTrue(search.fts_available(conn))
+            self.assertEqual(conn.execute('SELECT count(*) FROM book_search').scalar(),
+                             conn.execute('SELECT count(*) FROM books').scalar())
+            found = [row[0] for row in conn.execute(
+                'SELECT rowid FROM book_search WHERE book_search MATCH ?',
+                ('"{}"'.format(search.search_terms(title)[-1]),))]
+        self.assertIn(7, found)
+
+    def test_version_triggers_dropped(self):
+        def triggers():
+            with self.engine.connect() as conn:
+                return conn.execute("SELECT count(*) FROM sqlite_master WHERE type = 'trigger' "
+                                    "AND name LIKE 'table_versions_%'").scalar()
+        migrations.upgrade(self.engine, 5)
+        self.assertEqual(triggers(), 27)
+        migrations.upgrade(self.engine)
+        self.assertEqual(triggers(), 0)
+        migrations.upgrade(self.engine, 2)
+        self.assertEqual(triggers(), 0)
+
+    def test_unknown_version(self):
+        self.assertRaises(ValueError, migrations.upgrade, self.engine, migrations.HEAD + 1)
+        self.assertRaises(ValueError, migrations.stamp, self.engine, -1)
@@ -0,0 +1,97 @@
+import subprocess
+import sys
+import unittest
+
+from bookdb import isbn
+from bookdb.benchmarks.isbn import codes
+
+# the batch tests in an interpreter where NumPy cannot be imported, as if it
+# were not installed; fails unless they pass with normalize() on each code
+_WITHOUT_NUMPY = '''import sys, unittest
+sys.modules['numpy'] = None
+from bookdb import isbn
+from bookdb.tests import isbn_tests
+tests = unittest.defaultTestLoader.loadTestsFromNames(
+    ['NormalizeTests.test_batch', 'NormalizeTests.test_batch_matches_normalize'], isbn_tests)
+result = unittest.TextTestRunner().run(tests)
+sys.exit(not result.wasSuccessful() or isbn.numpy is not None)
+'''
+
+
+class NormalizeTests(unittest.TestCase):
+    # (code, isbn13, error)
+    CASES = (
+        ('9780306406157', '9780306406157', isbn.OK),
+        ('978-0-306-40615-7', '9780306406157', isbn.OK),
+        ('978 0 306 40615 7', '9780306406157', isbn.OK),
+        ('0306406152', '9780306406157', isbn.OK),
+        ('0-306-40615-2', '9780306406157', isbn.OK),
+        ('080442957X', '9780804429573', isbn.OK),
+        ('080442957x', '9780804429573', isbn.OK),
+        ('979-10-90636-07-1', '9791090636071', isbn.OK),
+        ('9780306406158', None, isbn.BAD_CHECK_DIGIT),
+        ('0306406153', None, isbn.BAD_CHECK_DIGIT),
+        ('97803064O6157', None, isbn.BAD_CHARACTER),
+        ('X306406152', None, isbn.BAD_CHARACTER),
+        ('978030640615X', None, isbn.BAD_CHARACTER),
+        (u'\xe9' * 13, None, isbn.BAD_CHARACTER),
+        ('', None, isbn.BAD_LENGTH),
+        ('97803064061', None, isbn.BAD_LENGTH),
+        ('99999999999999', None, isbn.BAD_LENGTH),
+        ('9-7-8-0-3-0-6-4-0-6-1-5-7', None, isbn.BAD_LENGTH),
+        ('x' * 30, None, isbn.BAD_LENGTH),
+        )
+
+    def test_normalize(self):
+        for code, isbn13, error in self.CASES:
+            self.assertEqual(isbn.normalize(code), (isbn13, error), code)
+
+    def test_batch(self):
+        codes = [code for code, isbn13, error in self.CASES]
+        self.assertEqual(isbn.normalize_batch(codes),
+                         ([isbn13 for code, isbn13, error in self.CASES],
+                          [error for code, isbn13, error in self.CASES]))
+        self.assertEqual(isbn.normalize_batch([]), ([], []))
+
+    def test_batch_matches_normalize(self):
+        forms = codes(2000)
+        mixed = [forms[form][n] for n in range(2000) for form in ('bare', 'hyphenated', 'ISBN-10')]
+        # wrong check digits, in every position
+        mixed += [code[:n % 13] + str((int(code[n % 13]) + 1) % 10) + code[n % 13 + 1:]
+                  for n, code in enumerate(forms['bare'])]
+        isbns, errors = isbn.normalize_batch(mixed)
+        self.assertEqual(list(zip(isbns, errors)), [isbn.normalize(code) for code in mixed])
+        self.assertEqual(isbns[:6000], [code for code in forms['bare'] for form in range(3)])
+
+    def test_blocks(self):
+        block = isbn.BLOCK
+        isbn.BLOCK = 7
+        try:
+            codes = [code for code, isbn13, error in self.CASES]
+            self.assertEqual(isbn.normalize_batch(codes),
+                             ([isbn13 for code, isbn13, error in self.CASES],
+                              [error for code, isbn13, error in self.CASES]))
+        finally:
+            isbn.BLOCK = block
+
+    def test_without_numpy(self):
+        numpy = isbn._import_numpy()
+        isbn.numpy = None
+        try:
+            codes = [code for code, isbn13, error in self.CASES]
+            self.assertEqual(isbn.normalize_batch(codes),
+                             ([isbn13 for code, isbn13, error in self.CASES],
+                              [error for code, isbn13, error in self.CASES]))
+        finally:
+            isbn.numpy = numpy
+
+    def test_numpy_not_installed(self):
+        self.assertEqual(subprocess.call([sys.executable, '-c', _WITHOUT_NUMPY]), 0)
+
+    def test_valid_isbn13(self):
+        from bookdb.models import valid_isbn13
+        self.assertTrue(valid_isbn13('9780306406157'))
+        # only a bare ISBN-13 is one
+        self.assertFalse(valid_isbn13('978-0-306-40615-7'))
+        self.assertFalse(valid_isbn13('0306406152'))
+        self.assertFalse(valid_isbn13('9780306406158'))
@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine
+
+from bookdb import fixtures
+from bookdb.benchmarks.load import run
+from bookdb.database import engine_from_settings
+
+
+class GenerateTests(unittest.TestCase):
+    def setUp(self):
+        from bookdb.models import Base
+        self.engine = create_engine('sqlite://')
+        Base.metadata.create_all(self.engine)
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def test_keeps_lookups(self):
+        from sqlalchemy.orm import Session
+        from bookdb.models import Binding, Distributor, Publisher, ShelfLocation, ShippingMethod
+        # as initialize_bookdb_db leaves them, with its book and order deleted since
+        session = Session(bind=self.engine)
+        session.add_all([Publisher('Fordham'), Publisher('Oxford'), Publisher('Penguin'),
+                         Distributor('Oxford'), Binding('Paper'), Binding('Cloth'),
+                         ShelfLocation('Fiction'), ShelfLocation('Philosophy'),
+                         ShippingMethod('Usual Means'), ShippingMethod('UPS')])
+        session.commit()
+        session.close()
+        with self.engine.connect() as connection:
+            counts = fixtures.generate(connection, books=50, orders=5, distributors=3, publishers=4)
+        # Penguin, Oxford and Fordham are there already; only Vintage is new
+        self.assertEqual(counts['publishers'], 1)
+        self.assertEqual(counts['bindings'], 0)
+        self.assertEqual(counts['shelf_locations'], len(fixtures.SHELF_LOCATIONS) - 2)
+        self.assertEqual(self.engine.execute('SELECT COUNT(*) FROM publishers').scalar(), 4)
+        self.assertEqual(self.engine.execute('SELECT COUNT(*) FROM distributors').scalar(), 4)
+        # every book and order refers to a lookup row
+        self.assertEqual(self.engine.execute(
+            'SELECT COUNT(*) FROM books JOIN publishers USING (publisher_id) JOIN bindings USING (binding_id) '
+            'JOIN shelf_locations USING (location_id)').scalar(), 50)
+        self.assertEqual(self.engine.execute(
+            'SELECT COUNT(*) FROM orders JOIN distributors USING (distributor_id) '
+            'JOIN shipping_methods USING (shipping_id)').scalar(), 5)
+
+    def test_not_empty(self):
+        with self.engine.connect() as connection:
+            fixtures.generate(connection, books=5, orders=1, distributors=1, publishers=1)
+            self.engine.execute('DELETE FROM order_entries')
+            self.engine.execute('DELETE FROM books')
+            with self.assertRaises(ValueError) as raised:
+                fixtures.generate(connection, books=5, orders=1, distributors=1, publishers=1)
+        self.assertEqual(str(raised.exception), 'the database already has orders')
+
+
+class DatabaseTuningTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_sqlite_pragmas(self):
+        url = 'sqlite:///' + os.path.join(self.directory, 'test.db')
+        engine = engine_from_settings({'sqlalchemy.url': url, 'sqlite.busy_timeout': '1234'})
+        with engine.connect() as conn:
+            self.assertEqual(conn.execute('PRAGMA journal_mode').scalar().lower(), 'wal')
+            self.assertEqual(conn.execute('PRAGMA synchronous').scalar(), 1)
+            self.assertEqual(conn.execute('PRAGMA busy_timeout').scalar(), 1234)
+        engine.dispose()
+
+    def test_concurrent_reads_and_writes(self):
+        url = 'sqlite:///' + os.path.join(self.directory, 'load.db')
+        fixtures.make_database(url, books=500, orders=0).dispose()
+        engine = engine_from_settings({'sqlalchemy.url': url})
+        reads, writes, locked = run(engine, 500, 4, 0.5)
+        engine.dispose()
+        self.assertEqual(locked, 0)
+        self.assertTrue(reads > 0 and writes > 0)
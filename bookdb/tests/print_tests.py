@@ -1,15 +1,22 @@
-from bookdb.printing import generate_order_pdf
-from bookdb.models import Book, Distributor, Order, OrderEntry, ShippingMethod, Binding, Publisher, ShelfLocation
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from bookdb.printing import generate_order_pdf, order_lines
+from bookdb.models import Author, Book, Distributor, Order, OrderEntry, ShippingMethod, Binding, Publisher, ShelfLocation
 
 from dateutil.parser import parse as parse_date
 
 _default_filename = 'test.pdf'
 
 
-def make_test_pdf(filename=_default_filename):
-    dummy_order = Order(
+def make_order(lines, comment='Extra nonsense is free of charge!'):
+    """Return a transient order of lines lines, every seventh with a title too long for one row."""
+    order = Order(
         '1A1000',
-        parse_date('2012-1-1'),
+        parse_date('2012-1-1').date(),
         Distributor(
             'Warehouse Co.',
             account_number='42',
@@ -22,32 +29,62 @@ def make_test_pdf(filename=_default_filename):
             postal_code="ABC123",
             country="The Moon"),
         ShippingMethod("Rocket"),
-        'Extra nonsense is free of charge!')
+        comment)
     paperback = Binding('Paper')
     penguin = Publisher('Penguin')
     location = ShelfLocation('Dreamspace')
-    for x in xrange(10, 35):
-            OrderEntry(
-            dummy_order,
+    for x in range(lines):
+        title = 'BOOK {}'.format(x)
+        if x % 7 == 0:
+            title += ' OR THE HISTORY OF A VERY LONG TITLE THAT WRAPS'
+        OrderEntry(
+            order,
             Book(
-                '97811122233' + str(x),
-                'BOOK' + str(x),
+                '97811{:08d}'.format(x),
+                title,
                 penguin,
                 paperback,
                 location,
-                [('Seneca',), ('Brown', 'Dan')]),
-            x)
-    OrderEntry(
-        dummy_order,
-        Book(
-            '9781112223399',
-            'AWESOME',
-            penguin,
-            paperback,
-            location,
-            [('Seneca',), ('Brown', 'Dan')]),
-        9)
-    generate_order_pdf(dummy_order, filename)
+                [Author('Seneca'), Author('Brown', 'Dan')]),
+            x % 10 + 1)
+    return order
+
+
+def make_test_pdf(filename=_default_filename):
+    generate_order_pdf(make_order(26), filename)
+
+
+def _pages(pdf):
+    return pdf.count(b'/Type /Page\n')
+
+
+class PrintTests(unittest.TestCase):
+    def test_lines_sorted_by_title(self):
+        lines = order_lines(make_order(12))
+        self.assertEqual([line[2] for line in lines], sorted(line[2] for line in lines))
+        self.assertEqual(lines[0][3:], ('Seneca', 'Penguin', 'Paper'))
+
+    def test_sample(self):
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, _default_filename)
+            make_test_pdf(filename)
+            with open(filename, 'rb') as f:
+                self.assertTrue(f.read().startswith(b'%PDF'))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_large_order(self):
+        buf = io.BytesIO()
+        generate_order_pdf(make_order(2000), buf)
+        pdf = buf.getvalue()
+        self.assertTrue(pdf.startswith(b'%PDF'))
+        # no more than 25 lines fit on a page
+        pages = _pages(pdf)
+        self.assertTrue(pages > 2000 // 25)
+        # one page number form per page
+        self.assertEqual(pdf.count(b'/Subtype /Form'), pages)
+
 
 if __name__ == '__main__':
     make_test_pdf()
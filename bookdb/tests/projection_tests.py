@@ -0,0 +1,27 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from bookdb.benchmarks.projection import (
+    compare,
+    make_database,
+    )
+
+
+class ProjectionTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        from bookdb.models import DBSession
+        DBSession.remove()
+        shutil.rmtree(self.directory)
+
+    def test_lite_rows_are_lighter(self):
+        engine = make_database(os.path.join(self.directory, 'lists.db'), 300, 100)
+        results = compare(engine, repeat=1)
+        engine.dispose()
+        for current, lite in zip(results[::2], results[1::2]):
+            self.assertEqual(current[2], lite[2])
+            self.assertTrue(lite[3] < current[3], (current, lite))
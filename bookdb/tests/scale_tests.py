@@ -0,0 +1,239 @@
+"""Latency, statement counts and peak memory of every view at several catalogue sizes.
+
+Each size is a database filled by bookdb.fixtures and served by the whole
+application through WebTest, logged in as the editor. Needs pytest-benchmark
+and WebTest; run it with:
+
+    py.test bookdb/tests/scale_tests.py [--benchmark-columns=min,median,max]
+
+BOOKDB_BENCHMARK_SIZES sets the sizes as books:orders pairs, by default
+"1000:100,10000:1000", and BOOKDB_BENCHMARK_ROUNDS the requests timed per
+view. Each result's extra_info has the p50/p90/p99 latency in milliseconds,
+the statements one request runs and the peak memory it allocates.
+"""
+import io
+import os
+import shutil
+import tempfile
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+webtest = pytest.importorskip('webtest')
+
+from bookdb.tests.view_tests import _StatementCounter
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+SIZES = [tuple(int(n) for n in size.split(':'))
+         for size in os.environ.get('BOOKDB_BENCHMARK_SIZES', '1000:100,10000:1000').split(',')]
+ROUNDS = int(os.environ.get('BOOKDB_BENCHMARK_ROUNDS', 20))
+
+# (view, url); the keys in braces are filled from Site. Only the POST of
+# book_add is timed: its blank form passes '' for the publisher, binding and
+# location relationships and fails.
+GET_VIEWS = (
+    ('front_page', '/'),
+    ('login', '/login'),
+    ('book_list', '/book/list'),
+    ('book_list_json', '/book/list.json?sort=title'),
+    ('book_search', '/book/search?q=river'),
+    ('book_view', '/book/{isbn13}'),
+    ('book_edit', '/book/{isbn13}/edit'),
+    ('book_delete', '/book/{isbn13}/delete'),
+    ('order_list', '/order/list'),
+    ('order_add', '/order/add'),
+    ('order_view', '/order/{po}'),
+    ('order_edit', '/order/{po}/edit'),
+    ('order_delete', '/order/{po}/delete'),
+    ('order_pdf', '/order/{po}/pdf'),
+    ('order_pdf_status', '/order/{po}/pdf/status'),
+    ('order_pdf_export', '/order/pdfs.zip?distributor={distributor}&start={start}&end={end}'),
+    ('distributor_list', '/distributor/list'),
+    ('distributor_add', '/distributor/add'),
+    ('distributor_view', '/distributor/{distributor}'),
+    ('distributor_edit', '/distributor/{distributor}/edit'),
+    ('publisher_list', '/publisher/list'),
+    ('publisher_add', '/publisher/add'),
+    ('publisher_edit', '/publisher/{publisher}/edit'),
+    ('export', '/export/books.csv'),
+    ('report', '/report/shelf-list.pdf'),
+    ('api_books', '/api/books'),
+    ('api_books_batch', '/api/books?isbn={isbns}&include=authors'),
+    ('api_book', '/api/books/{isbn13}?include=authors,publisher'),
+    ('api_orders', '/api/orders?include=distributor'),
+    ('api_order', '/api/orders/{po}?include=entries'),
+    ('api_distributor', '/api/distributors/{distributor}?include=orders'),
+    ('api_publishers', '/api/publishers'),
+    ('metrics', '/_metrics'),
+    )
+
+
+class Site(object):
+    """The application on a generated database, and the keys of typical rows in it."""
+    def __init__(self, books, orders):
+        import bookdb
+        from bookdb import fixtures
+        from bookdb.models import DBSession
+        self.directory = tempfile.mkdtemp()
+        self.url = 'sqlite:///' + os.path.join(self.directory, 'bench.db')
+        fixtures.make_database(self.url, books=books, orders=orders).dispose()
+        includes = ['pyramid_tm']
+        try:
+            import pyramid_chameleon
+            includes.append('pyramid_chameleon')
+        except ImportError:  # Pyramid before 1.5 renders .pt templates itself
+            pass
+        self.app = webtest.TestApp(bookdb.main({}, **{
+            'sqlalchemy.url': self.url,
+            'pyramid.includes': '\n'.join(includes),
+            'develop': 'true',
+            'order_pdf.directory': os.path.join(self.directory, 'pdfs'),
+            }))
+        self.engine = DBSession.bind
+        self.login()
+        # a mid-list book, the order with the most lines, the busiest distributor and 50 books
+        row = self.engine.execute(
+            'SELECT o.po, o.date, d.short_name FROM orders o JOIN distributors d USING (distributor_id) '
+            'JOIN order_entries e USING (order_id) GROUP BY o.order_id ORDER BY COUNT(*) DESC LIMIT 1').first()
+        self.keys = dict(isbn13=fixtures.make_isbn13(books // 2),
+                         po=row[0], start=row[1], end=row[1], distributor=row[2],
+                         publisher=fixtures.PUBLISHER_NAMES[0],
+                         isbns=','.join(fixtures.make_isbn13(n * books // 50) for n in range(50)))
+        self.added = 0
+
+    def login(self):
+        self.app.post('/login', {'login': 'editor', 'password': 'editor', 'form.submitted': '1'})
+
+    def close(self):
+        from bookdb.pdfcache import order_pdfs
+        order_pdfs.join()
+        self.engine.dispose()
+        shutil.rmtree(self.directory)
+
+
+@pytest.fixture(scope='module', params=SIZES, ids=['{}x{}'.format(*size) for size in SIZES])
+def site(request):
+    site = Site(*request.param)
+    yield site
+    site.close()
+
+
+def _measure(benchmark, site, request, setup=None):
+    """Benchmark request(), recording percentiles, statements and peak memory.
+
+    The statements and memory are those of one request after a first one
+    has loaded the templates and caches.
+    """
+    for i in range(2):
+        if setup is not None:
+            setup()
+        if i == 0:
+            request()
+    with _StatementCounter(site.engine) as statements:
+        if tracemalloc is not None:
+            tracemalloc.start()
+        request()
+        if tracemalloc is not None:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    benchmark.pedantic(request, setup=setup, rounds=ROUNDS, iterations=1)
+    times = sorted(benchmark.stats.stats.data)
+    benchmark.extra_info.update(
+        statements=statements.count,
+        peak_kib=peak // 1024 if tracemalloc is not None else None,
+        p50_ms=times[len(times) // 2] * 1000,
+        p90_ms=times[int(len(times) * 0.9)] * 1000,
+        p99_ms=times[min(int(len(times) * 0.99), len(times) - 1)] * 1000,
+        )
+
+
+@pytest.mark.parametrize('view,url', GET_VIEWS, ids=[view for view, url in GET_VIEWS])
+def test_get(benchmark, site, view, url):
+    url = url.format(**site.keys)
+    if view in ('order_pdf', 'order_pdf_status'):
+        # time serving the cached PDF, not queueing its first render
+        site.app.get('/order/{}/pdf'.format(site.keys['po']))
+        from bookdb.pdfcache import order_pdfs
+        order_pdfs.join()
+    _measure(benchmark, site, lambda: site.app.get(url, status='*'))
+    response = site.app.get(url)
+    assert response.status_int == 200
+
+
+CONDITIONAL_VIEWS = ('book_list', 'book_view', 'order_list', 'order_view', 'distributor_view')
+
+
+@pytest.mark.parametrize('view', CONDITIONAL_VIEWS)
+def test_not_modified(benchmark, site, view):
+    url = dict(GET_VIEWS)[view].format(**site.keys)
+    etag = site.app.get(url).headers['ETag']
+    _measure(benchmark, site, lambda: site.app.get(url, headers={'If-None-Match': etag}, status=304))
+
+
+def test_book_add(benchmark, site):
+    from bookdb.fixtures import make_isbn13
+
+    def add():
+        site.added += 1
+        site.app.post('/book/add', {'form.submitted': '1', 'isbn13': make_isbn13(10 ** 8 + site.added),
+                                    'title': 'New Title', 'author_string': 'Writer, A',
+                                    'publisher': site.keys['publisher'], 'binding': 'Paper',
+                                    'shelf_location': 'Fiction'}, status=302)
+    _measure(benchmark, site, add)
+
+
+def test_book_edit_post(benchmark, site):
+    isbn13 = site.keys['isbn13']
+    form = {'form.submitted': '1', 'isbn13': isbn13, 'title': 'Edited Title',
+            'author_string': 'Writer, A; Other, B', 'publisher': site.keys['publisher'],
+            'binding': 'Cloth', 'shelf_location': 'Poetry'}
+    _measure(benchmark, site,
+             lambda: site.app.post('/book/{}/edit'.format(isbn13), form, status=302))
+
+
+def test_order_entries_add(benchmark, site):
+    from bookdb.fixtures import make_isbn13
+    entries = '\n'.join('{} 1'.format(make_isbn13(n)) for n in range(20))
+    _measure(benchmark, site,
+             lambda: site.app.post('/order/{}/entries'.format(site.keys['po']), {'entries': entries}))
+
+
+def test_order_entry_delete(benchmark, site):
+    from bookdb.fixtures import make_isbn13
+    po = site.keys['po']
+    isbn13 = make_isbn13(1)
+
+    def setup():
+        site.app.post('/order/{}/entries'.format(po), {'entries': isbn13})
+    _measure(benchmark, site,
+             lambda: site.app.get('/order/{}/delete_entry/{}'.format(po, isbn13), status=302),
+             setup=setup)
+
+
+def test_distributor_delete(benchmark, site):
+    def setup():
+        fields = ('short_name', 'full_name', 'account_number', 'sales_rep', 'phone', 'fax',
+                  'email', 'address1', 'address2', 'city', 'province', 'postal_code', 'country')
+        form = dict((field, '') for field in fields)
+        form.update({'form.submitted': '1', 'short_name': 'Doomed', 'full_name': 'Doomed'})
+        site.app.post('/distributor/add', form, status=302)
+    _measure(benchmark, site,
+             lambda: site.app.get('/distributor/Doomed/delete', status=302), setup=setup)
+
+
+def test_logout(benchmark, site):
+    _measure(benchmark, site, lambda: site.app.get('/logout', status=302), setup=site.login)
+    site.login()
+
+
+def test_generate_order_pdf(benchmark, site):
+    from bookdb.models import DBSession, Order
+    from bookdb.printing import generate_order_pdf
+    order = Order.get(site.keys['po'], load='print')
+    benchmark.extra_info['lines'] = len(order.order_entries)
+    _measure(benchmark, site, lambda: generate_order_pdf(order, io.BytesIO()))
+    DBSession.remove()
@@ -0,0 +1,33 @@
+import unittest
+
+from bookdb.benchmarks.startup import (
+    TARGETS,
+    import_times,
+    start,
+    )
+
+
+class StartupTests(unittest.TestCase):
+    def _modules(self, name):
+        return start(dict(TARGETS)[name])[2]
+
+    def test_app_loads_no_pdf_stack(self):
+        modules = self._modules('bookdb:main')
+        self.assertTrue('bookdb.views' in modules)
+        self.assertFalse('reportlab' in modules)
+        # imported by the first isbn.normalize_batch()
+        self.assertFalse('numpy' in modules)
+
+    def test_scripts_load_only_what_they_use(self):
+        modules = self._modules('initialize_bookdb_db')
+        self.assertFalse('reportlab' in modules)
+        self.assertFalse('chameleon' in modules)
+        self.assertFalse('bookdb.views' in modules)
+        self.assertTrue('reportlab' in self._modules('print_bookdb_report'))
+
+    def test_import_times(self):
+        report = ('import time: self [us] | cumulative | imported package\n'
+                  'import time:       100 |        100 |     reportlab.lib\n'
+                  'import time:       250 |        350 |   reportlab\n'
+                  'import time:        50 |        400 | bookdb.printing\n')
+        self.assertEqual(import_times(report), {'reportlab': 350e-6, 'bookdb': 50e-6})
@@ -0,0 +1,55 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from bookdb.benchmarks.templates import (
+    make_database,
+    make_settings,
+    run,
+    )
+
+# Chameleon reads its cache directory when it is imported, so the app is
+# started in new processes
+_MAIN = 'import bookdb, json, sys; bookdb.main({}, **json.loads(sys.argv[1]))'
+
+
+class TemplateCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _main(self, settings):
+        subprocess.check_call([sys.executable, '-c', _MAIN, json.dumps(settings)])
+
+    def test_pages_are_compiled_at_startup(self):
+        try:
+            import webtest
+        except ImportError:
+            raise unittest.SkipTest('needs WebTest')
+        from bookdb import templating
+        keys = make_database(os.path.join(self.directory, 'pages.db'), 30, 5)
+        cache = os.path.join(self.directory, 'template_cache')
+        self._main(make_settings(self.directory, 'true', True))
+        compiled = sorted(os.listdir(cache))
+        # one module for each template; the masters the pages load are all the same
+        self.assertEqual(len([name for name in compiled if name.endswith('.py')]),
+                         len(templating.template_names()))
+        # serving every page, after a restart, compiles nothing more
+        run(self.directory, keys, 'warm cache')
+        self.assertEqual(sorted(os.listdir(cache)), compiled)
+
+    def test_cache_directory_cannot_be_made(self):
+        make_database(os.path.join(self.directory, 'pages.db'), 3, 1)
+        with open(os.path.join(self.directory, 'template_cache'), 'w'):
+            pass
+        settings = make_settings(self.directory, 'true', False)
+        settings['templates.cache_directory'] = os.path.join(self.directory, 'template_cache', 'cache')
+        # the templates are compiled in memory instead
+        self._main(settings)
+        self.assertFalse(os.path.isdir(settings['templates.cache_directory']))
@@ -0,0 +1,958 @@
+import shutil
+import tempfile
+import unittest
+import transaction
+from datetime import date
+
+from sqlalchemy import event
+
+from pyramid import testing
+
+
+def _make_isbn13(n):
+    stem = '978{:09d}'.format(n)
+    total = sum([int(num) * weight for num, weight in zip(stem, (1, 3) * 6)])
+    return stem + str((10 - (total % 10)) % 10)
+
+
+def _initTestingDB(books=10):
+    from sqlalchemy import create_engine
+    from bookdb import search, versions
+    from bookdb.models import (
+        DBSession,
+        Base,
+        Book,
+        Order,
+        Distributor,
+        Binding,
+        Publisher,
+        ShelfLocation,
+        ShippingMethod,
+        OrderEntry,
+        Author,
+        )
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    search.install(engine)
+    versions.install(engine)
+    DBSession.configure(bind=engine)
+    with transaction.manager:
+        distributors = [Distributor('Oxford'), Distributor('Ingram')]
+        DBSession.add_all(distributors)
+        publishers = [Publisher('Fordham'), Publisher('Oxford'), Publisher('Penguin')]
+        DBSession.add_all(publishers)
+        bindings = [Binding('Paper'), Binding('Cloth')]
+        DBSession.add_all(bindings)
+        locations = [ShelfLocation('Fiction'), ShelfLocation('Philosophy')]
+        DBSession.add_all(locations)
+        shipping = [ShippingMethod('Usual Means'), ShippingMethod('UPS')]
+        DBSession.add_all(shipping)
+        order = Order('1A1000',
+                      date(2012, 1, 1),
+                      distributors[0],
+                      shipping[0],
+                      'No Backorders'
+                      )
+        DBSession.add(order)
+        DBSession.add(Order('1A1001', date(2012, 2, 1), distributors[1], shipping[1], ''))
+        for n in range(books):
+            book = Book(_make_isbn13(n),
+                        'Title {}'.format(n),
+                        publishers[n % len(publishers)],
+                        bindings[n % len(bindings)],
+                        locations[n % len(locations)],
+                        authors=[Author('Author{}'.format(n), 'First')],
+                        )
+            DBSession.add(book)
+            DBSession.add(OrderEntry(order, book, n + 1))
+    return DBSession, engine
+
+
+class _StatementCounter(object):
+    """Count the SQL statements executed on engine inside a with block."""
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _callback(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._callback)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'before_cursor_execute', self._callback)
+
+
+class ViewTestCase(unittest.TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+        self.config.add_route('book_list', '/book/list')
+        self.config.add_route('order_add', '/order/add')
+        self.config.add_route('book_list_json', '/book/list.json')
+        self.config.add_route('book_search', '/book/search')
+        self.config.add_route('book_view', '/book/{isbn13}')
+        self.config.add_route('order_view', '/order/{po}')
+        self.config.add_route('order_edit', '/order/{po}/edit')
+        self.config.add_route('order_pdf', '/order/{po}/pdf')
+        self.config.add_route('order_pdf_status', '/order/{po}/pdf/status')
+        self.config.add_route('distributor_view', '/distributor/{short_name}')
+        self.config.add_route('publisher_edit', '/publisher/{short_name}/edit')
+        self.session, self.engine = _initTestingDB()
+        from bookdb.models import lookup_cache
+        lookup_cache.clear()
+
+    def tearDown(self):
+        self.session.remove()
+        testing.tearDown()
+
+    def _request(self, params=None, **matchdict):
+        request = testing.DummyRequest(params=params)
+        request.matchdict = matchdict
+        return request
+
+
+class ListStatementCountTests(ViewTestCase):
+    """Each list view must render in a fixed number of statements."""
+
+    def test_book_list(self):
+        from bookdb.views import book_list
+        with _StatementCounter(self.engine) as counter:
+            info = book_list(self._request())
+            for book in info['books']:
+                (book.publisher, book.binding, book.shelf_location)
+        self.assertEqual(len(info['books']), 10)
+        self.assertEqual(counter.count, 1)
+        # rows, not Books
+        self.assertEqual(len(self.session.identity_map), 0)
+
+    def test_order_list(self):
+        from bookdb.views import order_list
+        with _StatementCounter(self.engine) as counter:
+            info = order_list(self._request())
+            for order in info['orders']:
+                (order.po, order.distributor, order.date, order.lines, order.units)
+        self.assertEqual(len(info['orders']), 2)
+        # the orders with their totals, and the totals by distributor
+        self.assertEqual(counter.count, 2)
+        self.assertEqual(len(self.session.identity_map), 0)
+
+    def test_order_view(self):
+        from bookdb.views import order_view
+        with _StatementCounter(self.engine) as counter:
+            info = order_view(self._request(po='1A1000'))
+            order = info['order']
+            (order.distributor, order.shipping_method)
+            for entry in order.order_entries:
+                (entry.book.isbn13, entry.book.publisher)
+        self.assertEqual(len(order.order_entries), 10)
+        self.assertEqual(counter.count, 2)
+
+    def test_distributor_list(self):
+        from bookdb.views import distributor_list
+        with _StatementCounter(self.engine) as counter:
+            info = distributor_list(self._request())
+            [(d.short_name, d.orders, d.units, d.last_order) for d in info['distributors']]
+        self.assertEqual(counter.count, 1)
+        self.assertEqual(len(self.session.identity_map), 0)
+
+    def test_publisher_list(self):
+        from bookdb.views import publisher_list
+        with _StatementCounter(self.engine) as counter:
+            info = publisher_list(self._request())
+            [(p.short_name, p.full_name) for p in info['publishers']]
+        self.assertEqual(counter.count, 1)
+
+    def test_unknown_profile(self):
+        from bookdb.models import Book
+        self.assertRaises(ValueError, Book.list, load='nonsense')
+
+
+class OrderTotalsTests(ViewTestCase):
+    def test_order_summaries(self):
+        from bookdb.models import Order
+        with _StatementCounter(self.engine) as counter:
+            summaries = [(order.po, order.distributor.short_name, lines, units)
+                         for order, lines, units in Order.summaries(load='listing')]
+        self.assertEqual(counter.count, 1)
+        self.assertEqual(summaries, [('1A1000', 'Oxford', 10, 55), ('1A1001', 'Ingram', 0, 0)])
+
+    def test_lite_order_summaries(self):
+        from bookdb.models import Order
+        summaries = Order.summaries(load='lite')
+        self.assertEqual([tuple(row) for row in summaries], [
+            ('1A1000', date(2012, 1, 1), 'Oxford', 'Usual Means', 10, 55),
+            ('1A1001', date(2012, 2, 1), 'Ingram', 'UPS', 0, 0)])
+        self.assertEqual(summaries[0].distributor, 'Oxford')
+        self.assertEqual(summaries[0].units, 55)
+
+    def test_distributor_totals(self):
+        from bookdb.models import Distributor
+        with transaction.manager:
+            self.session.add(Distributor('Idle'))
+        self.assertEqual(Distributor.totals(), {
+            'Oxford': (1, 10, 55, date(2012, 1, 1)),
+            'Ingram': (1, 0, 0, date(2012, 2, 1)),
+            'Idle': (0, 0, 0, None),
+            })
+
+    def test_monthly_totals(self):
+        from bookdb.models import Distributor, Order, OrderEntry, Book, ShippingMethod
+        with transaction.manager:
+            order = Order('1A1002', date(2012, 1, 20), Distributor.get('Oxford'), ShippingMethod.get('UPS'), '')
+            self.session.add(order)
+            for n in range(3):
+                self.session.add(OrderEntry(order, Book.get(_make_isbn13(n)), 2))
+        self.assertEqual(Distributor.get('Oxford').monthly_totals(), [(2012, 1, 2, 10, 61)])
+        self.assertEqual(Distributor.get('Ingram').monthly_totals(), [(2012, 2, 1, 0, 0)])
+
+    def test_distributor_view(self):
+        from bookdb.views import distributor_view
+        self.config.add_route('distributor_edit', '/distributor/{short_name}/edit')
+        info = distributor_view(self._request(short_name='Oxford'))
+        self.assertEqual(info['monthly_totals'], [(2012, 1, 1, 10, 55)])
+        self.assertEqual(distributor_view(self._request(short_name='Nobody')).status_int, 404)
+
+
+class BookPageTests(ViewTestCase):
+    def _pages(self, **kw):
+        from bookdb.models import Book
+        seen = []
+        after = None
+        while True:
+            books, after = Book.page(after=after, limit=3, **kw)
+            seen.extend(books)
+            if after is None:
+                return seen
+
+    def test_walk_isbn13(self):
+        books = self._pages()
+        isbns = [b.isbn13 for b in books]
+        self.assertEqual(len(isbns), 10)
+        self.assertEqual(isbns, sorted(isbns))
+
+    def test_walk_descending_title(self):
+        titles = [b.title for b in self._pages(sort='-title')]
+        self.assertEqual(titles, sorted(titles, reverse=True))
+        self.assertEqual(len(titles), 10)
+
+    def test_walk_author(self):
+        names = [b.author_name for b in self._pages(sort='author')]
+        self.assertEqual(names, sorted(names))
+
+    def test_walk_missing_author_names(self):
+        # books made before author_name was kept have it NULL
+        self.session.execute("UPDATE books SET author_name = NULL WHERE book_id % 3 = 0")
+        for sort in ('author', '-author'):
+            books = self._pages(sort=sort)
+            self.assertEqual(len(books), 10)
+            names = [b.author_name or '' for b in books]
+            self.assertEqual(names, sorted(names, reverse=sort.startswith('-')))
+
+    def test_walk_lite_title(self):
+        books = self._pages(sort='title', load='lite')
+        self.assertEqual([b.title for b in books], sorted(b.title for b in books))
+        self.assertEqual(len(books), 10)
+        self.assertEqual((books[0].publisher, books[0].binding, books[0].shelf_location),
+                         ('Fordham', 'Paper', 'Fiction'))
+
+    def test_filter(self):
+        from bookdb.models import Publisher
+        penguin = Publisher.get('Penguin')
+        books = self._pages(publisher=penguin)
+        self.assertEqual(len(books), 3)
+        self.assertTrue(all(b.publisher is penguin for b in books))
+
+    def test_bad_arguments(self):
+        from bookdb.models import Book, encode_cursor
+        self.assertRaises(ValueError, Book.page, sort='price')
+        self.assertRaises(ValueError, Book.page, after='not-a-cursor')
+        for key in ([None, 'x'], [[1], 2], ['x']):
+            self.assertRaises(ValueError, Book.page, after=encode_cursor(key))
+
+    def test_json_view(self):
+        from bookdb.views import book_list_json
+        info = book_list_json(self._request(params={'limit': '4', 'binding': 'Cloth'}))
+        self.assertEqual(len(info['books']), 4)
+        self.assertEqual(info['books'][0]['binding'], 'Cloth')
+        self.assertTrue('after=' in info['next_url'])
+        info = book_list_json(self._request(params={'after': info['next_cursor'], 'binding': 'Cloth'}))
+        self.assertEqual(len(info['books']), 1)
+        self.assertEqual(info['next_url'], None)
+
+    def test_unknown_filter_is_empty(self):
+        from bookdb.views import book_list
+        info = book_list(self._request(params={'publisher': 'Nobody'}))
+        self.assertEqual(info['books'], [])
+        self.assertEqual(info['next_url'], None)
+
+    def test_bad_cursor_view(self):
+        from pyramid.httpexceptions import HTTPBadRequest
+        from bookdb.views import book_list
+        self.assertRaises(HTTPBadRequest, book_list, self._request(params={'after': '!!'}))
+
+
+class SearchTests(ViewTestCase):
+    def _search(self, phrase, **kw):
+        from bookdb.search import search_books
+        books, more = search_books(phrase, **kw)
+        return [b.isbn13 for b in books], more
+
+    def test_title_prefix(self):
+        isbns, more = self._search('tit 7')
+        self.assertEqual(isbns, [_make_isbn13(7)])
+        self.assertFalse(more)
+
+    def test_author_and_publisher(self):
+        isbns, more = self._search('author4 oxf')
+        self.assertEqual(isbns, [_make_isbn13(4)])
+        isbns, more = self._search('penguin')
+        self.assertEqual(sorted(isbns), [_make_isbn13(n) for n in (2, 5, 8)])
+
+    def test_lite(self):
+        from bookdb.search import search_books
+        books, more = search_books('author4', load='lite')
+        self.assertEqual([(b.isbn13, b.publisher) for b in books], [(_make_isbn13(4), 'Oxford')])
+
+    def test_paging(self):
+        first, more = self._search('title', per_page=6)
+        self.assertTrue(more)
+        second, more = self._search('title', page=1, per_page=6)
+        self.assertFalse(more)
+        self.assertEqual(sorted(first + second), [_make_isbn13(n) for n in range(10)])
+
+    def test_index_follows_edits(self):
+        from bookdb.models import Book, Publisher
+        with transaction.manager:
+            book = Book.get(_make_isbn13(3))
+            book.title = 'Middlemarch'
+            publisher = Publisher.get('Fordham')
+            publisher.short_name = publisher.full_name = 'Gollancz'
+        self.assertEqual(self._search('middlemarch')[0], [_make_isbn13(3)])
+        self.assertEqual(len(self._search('gollancz')[0]), 4)
+        self.assertEqual(self._search('fordham')[0], [])
+
+    def test_like_fallback(self):
+        from bookdb import search, versions
+        original = search.fts_available
+        search.fts_available = lambda bind: False
+        try:
+            isbns, more = self._search('title')
+            self.assertEqual(len(isbns), 10)
+            self.assertEqual(self._search('author5')[0], [_make_isbn13(5)])
+            self.assertEqual(len(self._search('penguin')[0]), 3)
+            # any case, and the start of any word, as with the index
+            self.assertEqual(self._search('tItLe 7')[0], [_make_isbn13(7)])
+            self.assertEqual(self._search('AUTHOR5 fIrSt')[0], [_make_isbn13(5)])
+            self.assertEqual(len(self._search('PenGuin')[0]), 3)
+            self.assertEqual(self._search('itle')[0], [])
+        finally:
+            search.fts_available = original
+        from sqlalchemy.dialects import postgresql
+        from bookdb.models import Book
+        clause = str(search._word_prefix((Book.title,), 'Tit').compile(dialect=postgresql.dialect()))
+        self.assertEqual(clause.count('ILIKE'), 2)
+
+    def test_view(self):
+        from bookdb.views import book_search
+        info = book_search(self._request(params={'q': 'title', 'page': '0'}))
+        self.assertEqual(len(info['books']), 10)
+        self.assertEqual(info['next_url'], None)
+        self.assertEqual(info['prev_url'], None)
+
+
+class LookupCacheTests(ViewTestCase):
+    def test_warm_form_has_no_queries(self):
+        from bookdb.views import order_add
+        order_add(self._request())
+        with _StatementCounter(self.engine) as counter:
+            info = order_add(self._request())
+        self.assertEqual(counter.count, 0)
+        self.assertEqual(info['distributor_options'], '<option value="Ingram" /><option value="Oxford" />')
+
+    def test_options_follow_writes(self):
+        from bookdb.models import Distributor
+        from bookdb.templating import datalist_options
+        options = datalist_options(Distributor)
+        self.assertTrue(datalist_options(Distributor) is options)
+        with transaction.manager:
+            self.session.add(Distributor('Ash & "Co"'))
+        self.assertEqual(datalist_options(Distributor),
+                         '<option value="Ash &amp; &quot;Co&quot;" />' + options)
+
+    def test_get_is_attached(self):
+        from bookdb.models import Binding, Book
+        with transaction.manager:
+            book = Book.get(_make_isbn13(0))
+            book.binding = Binding.get('Cloth')
+        self.assertEqual(repr(Book.get(_make_isbn13(0)).binding), 'Cloth')
+        self.assertEqual(Binding.get('Leather'), None)
+
+    def test_write_invalidates(self):
+        from bookdb.models import Publisher, lookup_cache
+        self.assertEqual(len(Publisher.list()), 3)
+        with transaction.manager:
+            self.session.add(Publisher('Verso'))
+        self.assertEqual(len(Publisher.list()), 4)
+        with transaction.manager:
+            Publisher.get('Verso').full_name = 'Verso Books'
+        self.assertEqual(Publisher.get('Verso').full_name, 'Verso Books')
+        stats = lookup_cache.stats()['Publisher']
+        self.assertEqual(stats['misses'], 3)
+
+    def test_reads_own_writes(self):
+        from bookdb.models import Publisher, lookup_cache
+        self.assertEqual(len(Publisher.list()), 3)
+        txn = transaction.begin()
+        try:
+            self.session.add(Publisher('Verso'))
+            self.assertEqual(Publisher.get('Verso').short_name, 'Verso')
+            self.assertEqual(len(Publisher.list()), 4)
+        finally:
+            txn.abort()
+        self.assertEqual(Publisher.get('Verso'), None)
+        self.assertEqual(len(Publisher.list()), 3)
+        # the rows read inside the transaction were never shared
+        stats = lookup_cache.stats()['Publisher']
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+
+    def test_ttl(self):
+        from bookdb.models import Binding, lookup_cache
+        now = [1000.0]
+        original = lookup_cache.clock
+        lookup_cache.clock = lambda: now[0]
+        try:
+            Binding.list()
+            Binding.list()
+            now[0] += lookup_cache.ttl + 1
+            Binding.list()
+        finally:
+            lookup_cache.clock = original
+        stats = lookup_cache.stats()['Binding']
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+
+
+class OrderPdfCacheTests(ViewTestCase):
+    def setUp(self):
+        ViewTestCase.setUp(self)
+        from bookdb.pdfcache import order_pdfs
+        self.directory = tempfile.mkdtemp()
+        order_pdfs.configure(self.directory)
+
+    def tearDown(self):
+        from bookdb.pdfcache import order_pdfs
+        order_pdfs.join()
+        order_pdfs.directory = None
+        shutil.rmtree(self.directory)
+        ViewTestCase.tearDown(self)
+
+    def test_digest_tracks_contents(self):
+        from bookdb.models import Order
+        from bookdb.pdfcache import order_digest
+        order = Order.get('1A1000', load='print')
+        digest = order_digest(order)
+        self.assertEqual(digest, order_digest(Order.get('1A1000')))
+        order.order_entries[0].quantity += 1
+        self.assertNotEqual(digest, order_digest(order))
+
+    def test_print_lines(self):
+        from bookdb.models import Order
+        from bookdb.pdfcache import order_data, order_from_data
+        from bookdb.printing import order_lines
+        order = Order.get('1A1000', load='print')
+        with _StatementCounter(self.engine) as counter:
+            lines = order.print_lines()
+        self.assertEqual(counter.count, 1)
+        self.assertEqual(lines[0], (1, _make_isbn13(0), 'TITLE 0', 'Author0', 'Fordham', 'Paper'))
+        self.assertEqual(lines, order_lines(order_from_data(order_data(order))))
+
+    def test_render_queued(self):
+        import os
+        from bookdb.pdfcache import order_digest, order_pdfs
+        from bookdb.models import Order
+        from bookdb.views import order_pdf, order_view
+        # a miss is drawn on the worker threads while the order page polls
+        response = order_pdf(self._request(po='1A1000'))
+        self.assertEqual(response.status_int, 302)
+        self.assertTrue(response.location.endswith('/order/1A1000?pdf=queued'), response.location)
+        page = order_view(self._request(params={'pdf': 'queued'}, po='1A1000'))
+        self.assertTrue(page['pdf_pending'])
+        self.assertTrue(page['pdf_status_url'].endswith('/order/1A1000/pdf/status'))
+        order_pdfs.join()
+        digest = order_digest(Order.get('1A1000'))
+        self.assertEqual(os.listdir(self.directory), [digest + '.pdf'])
+        response = order_pdf(self._request(po='1A1000'))
+        self.assertEqual(response.content_type, 'application/pdf')
+        self.assertTrue(response.body.startswith(b'%PDF'))
+        self.assertEqual(response.content_length, len(response.body))
+        self.assertEqual(response.etag, digest)
+        self.assertEqual(order_pdfs.read(digest), response.body)
+
+    def test_no_archive(self):
+        import os
+        from bookdb.pdfcache import order_pdfs
+        from bookdb.views import order_pdf, order_pdf_status
+        from bookdb.models import Order
+        order_pdfs.configure(None)
+        with _StatementCounter(self.engine) as counter:
+            Order.get('1A1000', load='print')
+        loaded = counter.count
+        self.session.expunge_all()
+        # drawn in the request, as there is nowhere to archive it, from the
+        # order as loaded without reading its lines again
+        with _StatementCounter(self.engine) as counter:
+            self.assertTrue(order_pdf(self._request(po='1A1000')).body.startswith(b'%PDF'))
+        self.assertEqual(counter.count, loaded)
+        self.assertEqual(order_pdf_status(self._request(po='1A1000'))['status'], 'done')
+        order_pdfs.join()
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_status(self):
+        from bookdb.pdfcache import order_pdfs
+        from bookdb.views import order_pdf_status
+        self.assertEqual(order_pdf_status(self._request(po='1A1000'))['status'], 'queued')
+        order_pdfs.join()
+        self.assertEqual(order_pdf_status(self._request(po='1A1000'))['status'], 'done')
+
+
+class BulkPdfTests(ViewTestCase):
+    def test_select_orders(self):
+        from bookdb.bulkpdf import select_orders
+        from bookdb.models import Distributor
+        self.assertEqual([o.po for o in select_orders()], ['1A1000', '1A1001'])
+        self.assertEqual([o.po for o in select_orders(start=date(2012, 1, 15))], ['1A1001'])
+        self.assertEqual([o.po for o in select_orders(end=date(2012, 1, 15))], ['1A1000'])
+        ingram = Distributor.get('Ingram')
+        self.assertEqual([o.po for o in select_orders(distributor=ingram)], ['1A1001'])
+
+    def test_prefetch(self):
+        from bookdb.bulkpdf import select_orders
+        from bookdb.pdfcache import order_data
+        with _StatementCounter(self.engine) as counter:
+            [order_data(order) for order in select_orders()]
+        self.assertTrue(counter.count <= 4)
+
+    def test_zip(self):
+        import zipfile
+        from io import BytesIO
+        from bookdb.views import order_pdf_export
+        response = order_pdf_export(self._request(params={'distributor': 'Oxford'}))
+        archive = zipfile.ZipFile(BytesIO(b''.join(response.app_iter)))
+        self.assertEqual(archive.namelist(), ['1A1000.pdf'])
+        self.assertTrue(archive.read('1A1000.pdf').startswith(b'%PDF'))
+
+    def test_pool_is_shared(self):
+        from bookdb import bulkpdf
+        list(bulkpdf.render_orders(bulkpdf.select_orders(), processes=1))
+        pool = bulkpdf._pool
+        # more orders than are queued ahead at once, still in order
+        pdfs = list(bulkpdf.render_orders(bulkpdf.select_orders() * 4, processes=1))
+        self.assertTrue(bulkpdf._pool is pool)
+        self.assertEqual([po for po, pdf in pdfs], ['1A1000', '1A1001'] * 4)
+
+    def test_failed_order(self):
+        import zipfile
+        from io import BytesIO
+        from bookdb import bulkpdf
+        from bookdb.pdfcache import order_data
+        jobs = [(order_data(order), None) for order in bulkpdf.select_orders()]
+        broken = dict(jobs[0][0], po='1A9999', date='not a date')
+        jobs.insert(1, (broken, None))
+        archive = zipfile.ZipFile(BytesIO(b''.join(bulkpdf.zip_stream(bulkpdf._render_jobs(jobs, 1)))))
+        self.assertEqual(archive.namelist(), ['1A1000.pdf', '1A9999.error.txt', '1A1001.pdf'])
+        self.assertIn(b'1A9999 could not be made', archive.read('1A9999.error.txt'))
+        self.assertTrue(archive.read('1A1001.pdf').startswith(b'%PDF'))
+
+
+class ReportTests(ViewTestCase):
+    def test_rows(self):
+        from bookdb.reports import report_rows
+        rows = list(report_rows('shelf-list'))
+        self.assertEqual([row[0] for row in rows], ['Fiction'] * 5 + ['Philosophy'] * 5)
+        self.assertEqual([row[2] for row in rows[:5]], ['TITLE 0', 'TITLE 2', 'TITLE 4', 'TITLE 6', 'TITLE 8'])
+        self.assertEqual(rows[0][1:], (_make_isbn13(0), 'TITLE 0', 'Author0, First', 'Fordham', 'Paper'))
+        rows = list(report_rows('catalogue', group='Oxford'))
+        self.assertEqual([row[2] for row in rows], ['TITLE 1', 'TITLE 4', 'TITLE 7'])
+
+    def test_unknown(self):
+        from bookdb.reports import get_report
+        from bookdb.views import report
+        from pyramid.httpexceptions import HTTPNotFound
+        self.assertRaises(ValueError, get_report, 'nonsense')
+        self.assertTrue(isinstance(report(self._request(name='nonsense')), HTTPNotFound))
+
+    def test_pdf(self):
+        from bookdb.views import report
+        for name in ('shelf-list', 'catalogue', 'inventory'):
+            response = report(self._request(name=name))
+            self.assertEqual(response.content_type, 'application/pdf')
+            self.assertTrue(response.body.startswith(b'%PDF'))
+        response = report(self._request(params={'group': 'Nowhere'}, name='shelf-list'))
+        self.assertTrue(response.body.startswith(b'%PDF'))
+
+    def test_story_pulled_as_laid_out(self):
+        from io import BytesIO
+        from reportlab.platypus import Paragraph
+        from bookdb.printing import PAGESIZE, styleN
+        from bookdb.reports import ReportDocTemplate, ReportPageTemplate, get_report
+        doc = ReportDocTemplate(BytesIO(), pagesize=PAGESIZE,
+                                pageTemplates=[ReportPageTemplate(get_report('shelf-list'), 'All', date(2012, 1, 1))])
+        pulled_on = []
+
+        def story():
+            for n in range(500):
+                pulled_on.append(getattr(doc, 'page', 0))
+                yield Paragraph('Line {}'.format(n), styleN)
+        doc.build(story())
+        self.assertEqual(len(pulled_on), 500)
+        self.assertTrue(doc.page > 5)
+        # the last flowables are only asked for once the pages before them are done
+        self.assertEqual(pulled_on[-1], doc.page)
+
+
+class OrderEntriesAddTests(ViewTestCase):
+    def test_parse(self):
+        from bookdb.views import _parse_entry_lines
+        self.assertEqual(_parse_entry_lines('978-0-19-921976-6 3\n\n9780199219766,2\n9780199219766\nx y\n'),
+                         [('9780199219766', 3), ('9780199219766', 2), ('9780199219766', 1), ('x', None)])
+
+    def test_add_entries(self):
+        from bookdb.models import Order
+        lines = [(_make_isbn13(0), 2),      # already on the order
+                 (_make_isbn13(1), 0),
+                 ('9780000000000', 1),
+                 (_make_isbn13(500), 1),    # not in the catalogue
+                 (_make_isbn13(5), 1),
+                 (_make_isbn13(5), 4)]
+        with transaction.manager:
+            order = Order.get('1A1001', load='detail')
+            order.add_entries([(_make_isbn13(n), 1) for n in range(3)])
+        with transaction.manager:
+            order = Order.get('1A1001', load='detail')
+            with _StatementCounter(self.engine) as counter:
+                report = order.add_entries(lines)
+                self.session.flush()
+        self.assertEqual([line['status'] for line in report],
+                         ['merged', 'invalid quantity', 'invalid isbn', 'unknown isbn', 'added', 'merged'])
+        # the books, one insert and one update, and one change count for the flush
+        self.assertEqual(counter.count, 4)
+        order = Order.get('1A1001')
+        quantities = dict((e.book.isbn13, e.quantity) for e in order.order_entries)
+        self.assertEqual(quantities, {_make_isbn13(0): 3, _make_isbn13(1): 1, _make_isbn13(2): 1,
+                                      _make_isbn13(5): 5})
+
+    def test_view(self):
+        from bookdb.views import order_entries_add
+        text = '\n'.join(_make_isbn13(n) for n in range(4)) + '\n9780000000000 1\n'
+        with transaction.manager:
+            info = order_entries_add(self._request(params={'entries': text}, po='1A1001'))
+        self.assertEqual((info['added'], info['merged'], info['rejected']), (4, 0, 1))
+
+
+class NaturalKeyTests(ViewTestCase):
+    """Entities named by po and isbn13 are found or deleted without lookups by key first."""
+
+    def test_order_entry_get(self):
+        from bookdb.models import OrderEntry
+        with _StatementCounter(self.engine) as counter:
+            entry = OrderEntry.get('1A1000', _make_isbn13(3))
+            (entry.order.po, entry.book.title)
+        self.assertEqual(counter.count, 1)
+        self.assertEqual(entry.quantity, 4)
+        self.assertEqual(entry.book.isbn13, _make_isbn13(3))
+        self.assertTrue(OrderEntry.get('1A1001', _make_isbn13(3)) is None)
+        self.assertTrue(OrderEntry.get('9Z9999', _make_isbn13(3), 'none') == 'none')
+
+    def test_order_entry_delete(self):
+        from bookdb.models import Order, OrderEntry
+        from bookdb.views import order_entry_delete
+        self.config.add_route('order_entry_delete', '/order/{po}/delete_entry/{isbn13}')
+        request = self._request(po='1A1000', isbn13=_make_isbn13(3))
+        with transaction.manager:
+            with _StatementCounter(self.engine) as counter:
+                response = order_entry_delete(request)
+        self.assertEqual(counter.count, 1)
+        self.assertEqual(response.status_int, 302)
+        self.assertEqual(len(Order.get('1A1000').order_entries), 9)
+        with transaction.manager:
+            self.assertEqual(order_entry_delete(request).status_int, 404)
+            self.assertEqual(OrderEntry.delete('1A1001', _make_isbn13(4)), 0)
+
+    def test_order_delete(self):
+        from bookdb.models import Book, Order, OrderEntry
+        from bookdb.views import order_delete
+        self.config.add_route('order_list', '/order/list')
+        self.config.add_route('order_delete', '/order/{po}/delete')
+        with transaction.manager:
+            with _StatementCounter(self.engine) as counter:
+                response = order_delete(self._request(params={'form.submitted': '1'}, po='1A1000'))
+        self.assertEqual(counter.count, 2)
+        self.assertEqual(response.status_int, 302)
+        self.assertTrue(Order.get('1A1000') is None)
+        self.assertEqual(self.session.query(OrderEntry).count(), 0)
+        self.assertEqual(len(Book.list()), 10)
+
+    def test_book_delete(self):
+        from bookdb.models import Author, Book
+        from bookdb.search import search_books
+        from bookdb.views import book_delete
+        self.config.add_route('book_delete', '/book/{isbn13}/delete')
+        request = self._request(params={'form.submitted': '1'}, isbn13=_make_isbn13(0))
+        with transaction.manager:
+            with _StatementCounter(self.engine) as counter:
+                response = book_delete(request)
+        self.assertEqual(counter.count, 2)
+        self.assertEqual(response.status_int, 302)
+        self.assertTrue(Book.get(_make_isbn13(0)) is None)
+        self.assertEqual(self.session.query(Author).count(), 9)
+        self.assertEqual(search_books('author0')[0], [])
+        with transaction.manager:
+            self.assertEqual(book_delete(request).status_int, 404)
+
+
+class ConditionalGetTests(ViewTestCase):
+    def setUp(self):
+        super(ConditionalGetTests, self).setUp()
+        self.rendered = 0
+
+    def _view(self, context, request):
+        from pyramid.response import Response
+        self.rendered += 1
+        return Response('page')
+
+    def _get(self, url='/publisher/list', **headers):
+        from pyramid.request import Request
+        from bookdb.versions import conditional
+        request = Request.blank(url, headers=headers)
+        request.registry = self.config.registry
+        return conditional('publishers')(self._view)(None, request)
+
+    def test_counters(self):
+        from bookdb.models import Book, Order, Publisher
+        from bookdb.versions import bump, table_versions
+        before = table_versions()
+        with transaction.manager:
+            self.session.add(Publisher('Verso'))
+        with transaction.manager:
+            self.session.query(Book).filter(Book.isbn13 == _make_isbn13(0)).update(
+                {'title': 'RETITLED'}, synchronize_session=False)
+        # one count for a flush, however many rows it writes
+        with transaction.manager:
+            Order.get('1A1001').add_entries([(_make_isbn13(n), 1) for n in range(8)])
+        # raw SQL counts its own writes
+        with self.engine.begin() as connection:
+            connection.execute("UPDATE books SET title = 'AGAIN' WHERE isbn13 = ?", _make_isbn13(1))
+            bump(connection, ['books', 'no_such_table'])
+        after = table_versions()
+        self.assertEqual(after['publishers'][0], before['publishers'][0] + 1)
+        self.assertEqual(after['books'][0], before['books'][0] + 2)
+        self.assertEqual(after['order_entries'][0], before['order_entries'][0] + 1)
+        self.assertEqual(after['distributors'], before['distributors'])
+        self.assertTrue(after['books'][1] >= before['books'][1])
+
+    def test_not_modified(self):
+        from bookdb.models import Publisher
+        response = self._get()
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(response.cache_control.no_cache, '*')
+        etag = response.headers['ETag']
+        response = self._get(**{'If-None-Match': etag})
+        self.assertEqual(response.status_int, 304)
+        self.assertEqual(response.headers['ETag'], etag)
+        self.assertEqual(self.rendered, 1)
+        # another page, or another user, has another tag
+        self.assertNotEqual(self._get('/publisher/list?sort=name').headers['ETag'], etag)
+        self.config.testing_securitypolicy(userid='editor')
+        self.assertNotEqual(self._get().headers['ETag'], etag)
+        self.config.testing_securitypolicy(userid=None)
+        with transaction.manager:
+            self.session.add(Publisher('Verso'))
+        self.assertEqual(self._get(**{'If-None-Match': etag}).status_int, 200)
+
+    def test_last_modified(self):
+        import datetime
+        from bookdb.versions import last_modified
+        now = datetime.datetime(2012, 1, 1, 12, 0, 0)
+        written = (now - datetime.datetime(1970, 1, 1)).total_seconds()
+        versions = {'books': (3, written - 10.25), 'authors': (1, written - 100)}
+        self.assertEqual(last_modified(versions, now), datetime.datetime(2012, 1, 1, 11, 59, 50))
+        # not until the second of the last write is over
+        self.assertTrue(last_modified({'books': (4, written - 0.5)}, now - datetime.timedelta(seconds=0.25)) is None)
+        self.assertTrue(last_modified({}, now) is None)
+
+    def test_views_without_table_versions(self):
+        from bookdb import versions
+        versions.uninstall(self.engine)
+        response = self._get()
+        self.assertEqual(response.status_int, 200)
+        self.assertTrue('ETag' not in response.headers)
+
+
+class ApiTests(ViewTestCase):
+    def setUp(self):
+        super(ApiTests, self).setUp()
+        self.config.add_route('api_books', '/api/books')
+        self.config.add_route('api_orders', '/api/orders')
+
+    def _api(self, route, params=None, **matchdict):
+        request = self._request(params=params, **matchdict)
+        request.matched_route = testing.DummyResource(name=route)
+        return request
+
+    def test_batch(self):
+        from bookdb.views import api_collection
+        isbns = [_make_isbn13(7), _make_isbn13(2), '9780000000000', _make_isbn13(4)]
+        request = self._api('api_books', {'isbn': ','.join(isbns), 'fields': 'title', 'include': 'authors'})
+        with _StatementCounter(self.engine) as counter:
+            info = api_collection(request)
+        # the books, and the authors of all of them
+        self.assertEqual(counter.count, 2)
+        self.assertEqual([book['isbn13'] for book in info['books']], [isbns[0], isbns[1], isbns[3]])
+        self.assertEqual(info['books'][0], {'isbn13': isbns[0], 'title': 'TITLE 7',
+                                            'authors': [{'lastname': 'Author7', 'firstname': 'First'}]})
+        self.assertEqual(info['missing'], ['9780000000000'])
+
+    def test_pages(self):
+        from bookdb.views import api_collection
+        info = api_collection(self._api('api_books', {'limit': '4', 'include': 'publisher'}))
+        self.assertEqual([book['isbn13'] for book in info['books']], [_make_isbn13(n) for n in range(4)])
+        self.assertEqual(info['books'][0]['publisher'], {'short_name': 'Fordham', 'full_name': 'Fordham'})
+        self.assertTrue('after={}'.format(_make_isbn13(3)) in info['next_url'])
+        info = api_collection(self._api('api_books', {'limit': '4', 'after': _make_isbn13(7)}))
+        self.assertEqual([book['isbn13'] for book in info['books']], [_make_isbn13(8), _make_isbn13(9)])
+        self.assertTrue(info['next_url'] is None)
+
+    def test_order(self):
+        from bookdb.views import api_item
+        request = self._api('api_order', {'include': 'entries,distributor'}, key='1A1000')
+        with _StatementCounter(self.engine) as counter:
+            order = api_item(request)
+        self.assertEqual(counter.count, 2)
+        self.assertEqual(order['date'], '2012-01-01')
+        self.assertEqual(order['distributor']['short_name'], 'Oxford')
+        self.assertEqual(len(order['entries']), 10)
+        self.assertEqual(order['entries'][0], {'isbn13': _make_isbn13(0), 'title': 'TITLE 0', 'quantity': 1})
+
+    def test_errors(self):
+        from pyramid.httpexceptions import HTTPBadRequest, HTTPNotFound
+        from bookdb.views import api_collection, api_item
+        self.assertTrue(isinstance(api_item(self._api('api_publisher', key='Nobody')), HTTPNotFound))
+        self.assertRaises(HTTPBadRequest, api_collection, self._api('api_books', {'fields': 'price'}))
+        self.assertRaises(HTTPBadRequest, api_collection, self._api('api_orders', {'include': 'authors'}))
+        self.assertRaises(HTTPBadRequest, api_collection, self._api('api_books', {'limit': '0'}))
+
+
+class MetricsTests(ViewTestCase):
+    def setUp(self):
+        super(MetricsTests, self).setUp()
+        from bookdb import metrics
+        metrics.instrument(self.engine)
+        metrics.request_metrics.clear()
+        self.registry = self.config.registry
+        self.registry.settings = {'metrics.n_plus_one_threshold': '5'}
+
+    def tearDown(self):
+        from bookdb import metrics
+        metrics.request_metrics.n_plus_one_threshold = metrics.N_PLUS_ONE_THRESHOLD
+        super(MetricsTests, self).tearDown()
+
+    def _call(self, route, handler):
+        from bookdb.metrics import metrics_tween_factory
+        request = self._request()
+        request.matched_route = testing.DummyResource(name=route)
+        return metrics_tween_factory(handler, self.registry)(request)
+
+    def test_counts_statements(self):
+        from bookdb.metrics import request_metrics
+        from bookdb.models import Book
+        self._call('book_list', lambda request: Book.page(load='listing'))
+        self._call('book_list', lambda request: Book.page(load='listing'))
+        totals = request_metrics.snapshot()['book_list']
+        self.assertEqual(totals['requests'], 2)
+        self.assertEqual(totals['statements'], 2)
+        self.assertEqual(totals['n_plus_one'], 0)
+        self.assertTrue(totals['sql_seconds'] > 0)
+        self.assertTrue(totals['seconds'] >= totals['sql_seconds'])
+        self.assertEqual(totals['buckets'][-1], 2)
+
+    def test_n_plus_one(self):
+        from bookdb.metrics import request_metrics, statement_shape
+        from bookdb.models import Book
+
+        def handler(request):
+            # the lazy load of each book's authors is one query per book
+            return [book.authors for book in Book.list()]
+        self._call('book_list', handler)
+        self.assertEqual(request_metrics.snapshot()['book_list']['n_plus_one'], 1)
+        self.assertEqual(statement_shape('SELECT a FROM t WHERE b IN (?, ?, ?) AND c = ?'),
+                         'SELECT a FROM t WHERE b IN (?) AND c = ?')
+
+    def test_render_ends_with_response(self):
+        import time
+        from bookdb.metrics import _end_render, _mark_render, request_metrics
+
+        def handler(request):
+            _mark_render(None)
+            time.sleep(0.01)
+            _end_render(None)
+            # the commit and the tweens after the response are not rendering
+            time.sleep(0.05)
+        self._call('book_list', handler)
+        totals = request_metrics.snapshot()['book_list']
+        self.assertTrue(0.01 <= totals['render_seconds'] < 0.05, totals)
+        self.assertTrue(totals['seconds'] >= 0.06, totals)
+
+    def test_exposition(self):
+        from bookdb.metrics import metrics
+        from bookdb.models import Book, Publisher
+        self._call('book_view', lambda request: Book.get(_make_isbn13(1)))
+        Publisher.get('Penguin')
+        response = metrics(self._request())
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        text = response.text
+        self.assertIn('# TYPE bookdb_request_seconds histogram', text)
+        self.assertIn('bookdb_requests_total{route="book_view"} 1', text)
+        self.assertIn('bookdb_request_seconds_bucket{route="book_view",le="+Inf"} 1', text)
+        self.assertIn('bookdb_sql_statements_total{route="book_view"} 1', text)
+        self.assertIn('bookdb_lookup_cache_misses_total{table="Publisher"} 1', text)
+
+    def test_scrape_needs_editor_or_token(self):
+        from pyramid.httpexceptions import HTTPForbidden
+        from bookdb.metrics import metrics
+        self.config.testing_securitypolicy(userid='viewer', permissive=False)
+        self.registry.settings['metrics.bearer_token'] = 's3cret'
+        self.assertRaises(HTTPForbidden, metrics, self._request())
+        request = self._request()
+        request.headers['Authorization'] = 'Bearer wrong'
+        self.assertRaises(HTTPForbidden, metrics, request)
+        request.headers['Authorization'] = 'Bearer s3cret'
+        self.assertEqual(metrics(request).status_int, 200)
+        self.config.testing_securitypolicy(userid='editor', permissive=True)
+        self.assertEqual(metrics(self._request()).status_int, 200)
+
+    def test_scrape_with_token(self):
+        try:
+            import webtest
+        except ImportError:
+            raise unittest.SkipTest('needs WebTest')
+        import bookdb
+        includes = ['pyramid_tm']
+        try:
+            import pyramid_chameleon
+            includes.append('pyramid_chameleon')
+        except ImportError:  # Pyramid before 1.5 renders .pt templates itself
+            pass
+        app = webtest.TestApp(bookdb.main({}, **{
+            'sqlalchemy.url': 'sqlite://',
+            'pyramid.includes': '\n'.join(includes),
+            'order_pdf.directory': '',
+            'metrics.bearer_token': 's3cret',
+            }))
+        # no session cookie: the token alone lets the scraper in
+        response = app.get('/_metrics', headers={'Authorization': 'Bearer s3cret'})
+        self.assertTrue(response.headers['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn('# TYPE bookdb_request_seconds histogram', response.text)
+        # without it, the login form as for any other editors' page
+        response = app.get('/_metrics')
+        self.assertTrue(response.content_type.startswith('text/html'))
@@ -0,0 +1,182 @@
+"""Change counters per table, and ETags for the pages read from them.
+
+On SQLite, table_versions holds a version and the time of the last write
+for each table in TABLES. bump() counts a write to some tables with one
+UPDATE. DBSession calls it once per flush and once per bulk query update or
+delete, for the tables they wrote. The importer and the fixtures, which
+write through Core, call it once per batch. Raw SQL has to call it itself.
+
+conditional(*tables) is a view decorator: it answers a GET whose
+If-None-Match or If-Modified-Since still holds with 304 Not Modified, from
+one query of table_versions and before the view runs, and otherwise adds
+an ETag and Last-Modified to the page. The ETag covers the page's URL, the
+logged in user, the templates and the versions of tables, which must be
+every table the page is drawn from. On other backends, or a database
+without table_versions, pages are served as before.
+"""
+import datetime
+import hashlib
+import os
+
+from pyramid.httpexceptions import HTTPNotModified
+from pyramid.security import authenticated_userid
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from .models import DBSession
+
+VERSIONS_TABLE = 'table_versions'
+
+TABLES = (
+    'authors',
+    'bindings',
+    'books',
+    'distributors',
+    'order_entries',
+    'orders',
+    'publishers',
+    'shelf_locations',
+    'shipping_methods',
+    )
+
+# the tables behind pages about books, and about orders
+CATALOGUE = ('authors', 'bindings', 'books', 'publishers', 'shelf_locations')
+ORDERS = ('distributors', 'order_entries', 'orders', 'shipping_methods')
+
+# seconds since the epoch, to the millisecond
+_NOW = "(julianday('now') - 2440587.5) * 86400.0"
+
+_DDL = ["CREATE TABLE IF NOT EXISTS table_versions ("
+        "table_name TEXT PRIMARY KEY, version INTEGER NOT NULL, modified REAL NOT NULL)"]
+for _table in TABLES:
+    _DDL.append("INSERT OR IGNORE INTO table_versions (table_name, version, modified) "
+                "VALUES ('{}', 0, {})".format(_table, _NOW))
+
+
+def install(bind):
+    """Create table_versions.
+
+    Safe to run on a database that already has it. Does nothing on
+    backends other than SQLite.
+    """
+    if bind.dialect.name != 'sqlite':
+        return
+    for statement in _DDL:
+        bind.execute(text(statement))
+
+
+def uninstall(bind):
+    if bind.dialect.name != 'sqlite':
+        return
+    # the per-row triggers of schema versions 3 to 5 write to the table
+    for table in TABLES:
+        for suffix in ('ai', 'au', 'ad'):
+            bind.execute(text('DROP TRIGGER IF EXISTS table_versions_{}_{}'.format(table, suffix)))
+    bind.execute(text('DROP TABLE IF EXISTS table_versions'))
+
+
+def bump(bind, tables):
+    """Count one write to each of tables, in bind's transaction."""
+    tables = sorted(set(tables) & set(TABLES))
+    if not tables or bind.dialect.name != 'sqlite':
+        return
+    try:
+        bind.execute(text(
+            'UPDATE table_versions SET version = version + 1, modified = {} WHERE table_name IN ({})'.format(
+                _NOW, ', '.join("'{}'".format(table) for table in tables))))
+    except OperationalError:  # no such table
+        pass
+
+
+def table_versions(tables=TABLES):
+    """Return {table: (version, modified)} for tables, or None if they are not tracked.
+
+    modified is the time of the table's last write in seconds since the epoch.
+    """
+    bind = DBSession.bind
+    if bind is None or bind.dialect.name != 'sqlite':
+        return None
+    try:
+        rows = DBSession.execute(
+            text('SELECT table_name, version, modified FROM table_versions WHERE table_name IN ({})'.format(
+                ', '.join("'{}'".format(table) for table in tables))))
+        return dict((row[0], (row[1], row[2])) for row in rows)
+    except OperationalError:  # no such table
+        return None
+
+
+_templates_digest = None
+
+
+def templates_digest():
+    """Return a digest of the names, sizes and times of the templates, read once."""
+    global _templates_digest
+    if _templates_digest is None:
+        directory = os.path.join(os.path.dirname(__file__), 'templates')
+        h = hashlib.sha1()
+        for name in sorted(os.listdir(directory)):
+            stat = os.stat(os.path.join(directory, name))
+            h.update('{} {} {}\n'.format(name, stat.st_size, stat.st_mtime).encode('utf-8'))
+        _templates_digest = h.hexdigest()
+    return _templates_digest
+
+
+def page_etag(request, versions):
+    """Return the strong ETag of the page request asks for, while tables are at versions."""
+    h = hashlib.sha1()
+    h.update(templates_digest().encode('ascii'))
+    h.update(request.path_qs.encode('utf-8'))
+    h.update(repr(authenticated_userid(request)).encode('utf-8'))
+    for table in sorted(versions):
+        h.update('{} {}\n'.format(table, versions[table][0]).encode('ascii'))
+    return h.hexdigest()
+
+
+def last_modified(versions, now=None):
+    """Return the Last-Modified time of a page drawn from tables at versions, or None.
+
+    Writes are timed to the millisecond but HTTP dates to the second, so the
+    time given is the end of the second of the last write, and only once it
+    has passed; a later write is then always after it.
+    """
+    if not versions:
+        return None
+    modified = datetime.datetime.utcfromtimestamp(int(max(m for v, m in versions.values())) + 1)
+    if modified > (now or datetime.datetime.utcnow()):
+        return None
+    return modified
+
+
+def _not_modified(request, etag, modified):
+    if request.if_none_match:
+        return etag in request.if_none_match
+    since = request.if_modified_since
+    return modified is not None and since is not None and modified <= since.replace(tzinfo=None)
+
+
+def conditional(*tables):
+    """Return a view decorator answering conditional GETs of a page drawn from tables."""
+    def decorator(view):
+        def conditional_view(context, request):
+            if request.method not in ('GET', 'HEAD'):
+                return view(context, request)
+            versions = table_versions(tables)
+            if versions is None:
+                return view(context, request)
+            etag = page_etag(request, versions)
+            modified = last_modified(versions)
+            if _not_modified(request, etag, modified):
+                response = HTTPNotModified()
+            else:
+                response = view(context, request)
+                if response.status_int != 200:
+                    return response
+            response.etag = etag
+            if modified is not None:
+                response.last_modified = modified
+            # ask every time, and never reuse a page across logins
+            response.cache_control = 'private, no-cache'
+            response.vary = ('Cookie',)
+            return response
+        return conditional_view
+    return decorator
@@ -1,8 +1,9 @@
 from dateutil.parser import parse as parse_date
 
-import os
+import re
 
 from pyramid.httpexceptions import (
+    HTTPBadRequest,
     HTTPFound,
     HTTPNotFound,
     )
@@ -10,7 +11,7 @@ from pyramid.view import (
     view_config,
     forbidden_view_config,
     )
-from pyramid.response import FileResponse
+from pyramid.response import Response
 
 from pyramid.security import (
     remember,
@@ -32,7 +33,34 @@ from .models import (
     valid_isbn13,
     )
 
-from .printing import generate_order_pdf
+from .pdfcache import (
+    data_digest,
+    order_data,
+    order_from_data,
+    order_pdfs,
+    render_pdf,
+    )
+
+from . import (
+    api,
+    exporter,
+    )
+
+from .bulkpdf import (
+    select_orders,
+    render_orders,
+    zip_stream,
+    )
+
+from .search import search_books
+
+from .templating import datalist_options
+
+from .versions import (
+    CATALOGUE,
+    ORDERS,
+    conditional,
+    )
 
 from .security import USERS
 
@@ -43,10 +71,10 @@ def front_page(request):
                 )
 
 
-@view_config(route_name='book_view', renderer='templates/book_view.pt')
+@view_config(route_name='book_view', renderer='templates/book_view.pt', decorator=conditional(*CATALOGUE))
 def book_view(request):
     isbn13 = request.matchdict['isbn13']
-    book = Book.get(isbn13)
+    book = Book.get(isbn13, load='detail')
     if book is None:
         return HTTPNotFound('No such book')
     edit_url = request.route_url('book_edit', isbn13=isbn13)
@@ -85,9 +113,9 @@ def book_add(request):
     return dict(theme=Theme(request),
                 book=book,
                 save_url=save_url,
-                bindings=Binding.list(),
-                locations=ShelfLocation.list(),
-                publishers=Publisher.list(),
+                binding_options=datalist_options(Binding),
+                location_options=datalist_options(ShelfLocation),
+                publisher_options=datalist_options(Publisher),
                 )
 
 
@@ -104,70 +132,208 @@ def book_edit(request):
         book.binding = Binding.get(request.params['binding'])
         book.shelf_location = ShelfLocation.get(request.params['shelf_location'])
         book.authors = Author.parse_author_string(author_string)
+        book.author_name = book.author_string()
         return HTTPFound(location=request.route_url('book_view', isbn13=book.isbn13))
     return dict(theme=Theme(request),
                 book=book,
                 save_url=request.route_url('book_edit', isbn13=isbn13),
-                bindings=Binding.list(),
-                locations=ShelfLocation.list(),
-                publishers=Publisher.list(),
+                binding_options=datalist_options(Binding),
+                location_options=datalist_options(ShelfLocation),
+                publisher_options=datalist_options(Publisher),
                 )
 
 
 @view_config(route_name='book_delete', renderer='templates/book_delete.pt', permission='edit')
 def book_delete(request):
     isbn13 = request.matchdict['isbn13']
-    book = Book.get(isbn13)
     if 'form.submitted' in request.params:
-        DBSession.delete(book)
+        if not Book.delete(isbn13):
+            return HTTPNotFound('No such book')
         return HTTPFound(location=request.route_url('book_list'))
+    book = Book.get(isbn13)
     return dict(theme=Theme(request),
                 book=book,
                 delete_url=request.route_url('book_delete', isbn13=isbn13),
                 )
 
 
-@view_config(route_name='book_list', renderer='templates/book_list.pt')
+BOOK_PAGE_SIZE = 50
+MAX_BOOK_PAGE_SIZE = 500
+
+
+def _book_page(request):
+    """Return (books, next_cursor, filters) for the paging parameters of request.
+
+    Raises HTTPBadRequest for a malformed cursor, sort or limit, and returns
+    an empty page when a filter names an unknown publisher, binding or location.
+    """
+    params = request.params
+    try:
+        limit = min(int(params.get('limit', BOOK_PAGE_SIZE)), MAX_BOOK_PAGE_SIZE)
+        assert limit > 0
+    except (AssertionError, ValueError):
+        raise HTTPBadRequest('limit must be a positive integer')
+    filters = dict((key, params[key]) for key in ('publisher', 'binding', 'shelf_location')
+                   if params.get(key))
+    lookups = dict(publisher=Publisher, binding=Binding, shelf_location=ShelfLocation)
+    entities = {}
+    for key, name in filters.items():
+        entities[key] = lookups[key].get(name)
+        if entities[key] is None:
+            return [], None, filters
+    try:
+        books, next_cursor = Book.page(sort=params.get('sort', 'isbn13'),
+                                       after=params.get('after'),
+                                       limit=limit,
+                                       load='lite',
+                                       **entities)
+    except ValueError as e:
+        raise HTTPBadRequest(str(e))
+    return books, next_cursor, filters
+
+
+def _next_page_url(request, route_name, next_cursor):
+    if next_cursor is None:
+        return None
+    query = dict(request.params)
+    query['after'] = next_cursor
+    return request.route_url(route_name, _query=query)
+
+
+@view_config(route_name='book_list', renderer='templates/book_list.pt', decorator=conditional(*CATALOGUE))
 def book_list(request):
-    books = Book.list()
+    books, next_cursor, filters = _book_page(request)
     return dict(theme=Theme(request),
                 books=books,
+                filters=filters,
+                sort=request.params.get('sort', 'isbn13'),
+                next_url=_next_page_url(request, 'book_list', next_cursor),
+                sort_url=lambda sort: request.route_url('book_list', _query=dict(filters, sort=sort)),
                 book_url=lambda isbn13: request.route_url('book_view', isbn13=isbn13)
                 )
 
 
-@view_config(route_name='order_list', renderer='templates/order_list.pt')
+@view_config(route_name='book_list_json', renderer='json', decorator=conditional(*CATALOGUE))
+def book_list_json(request):
+    books, next_cursor, filters = _book_page(request)
+    return dict(books=[dict(isbn13=book.isbn13,
+                            title=book.title,
+                            author_name=book.author_name,
+                            publisher=book.publisher,
+                            binding=book.binding,
+                            shelf_location=book.shelf_location,
+                            ) for book in books],
+                next_cursor=next_cursor,
+                next_url=_next_page_url(request, 'book_list_json', next_cursor),
+                )
+
+
+SEARCH_PAGE_SIZE = 25
+
+
+@view_config(route_name='book_search', renderer='templates/book_search.pt', decorator=conditional(*CATALOGUE))
+def book_search(request):
+    phrase = request.params.get('q', '')
+    try:
+        page = int(request.params.get('page', 0))
+        assert page >= 0
+    except (AssertionError, ValueError):
+        raise HTTPBadRequest('page must be a non-negative integer')
+    books, more = search_books(phrase, page=page, per_page=SEARCH_PAGE_SIZE, load='lite')
+    page_url = lambda page: request.route_url('book_search', _query={'q': phrase, 'page': page})
+    return dict(theme=Theme(request),
+                books=books,
+                q=phrase,
+                prev_url=page_url(page - 1) if page > 0 else None,
+                next_url=page_url(page + 1) if more else None,
+                book_url=lambda isbn13: request.route_url('book_view', isbn13=isbn13)
+                )
+
+
+@view_config(route_name='order_list', renderer='templates/order_list.pt', decorator=conditional(*ORDERS))
 def order_list(request):
-    orders = Order.list()
+    orders = Order.summaries(load='lite')
+    totals = Distributor.totals()
     return dict(theme=Theme(request),
                 orders=orders,
+                distributor_totals=sorted((name, row) for name, row in totals.items() if row[0]),
                 order_url=lambda po: request.route_url('order_view', po=po)
                 )
 
 
-@view_config(route_name='order_view', renderer='templates/order_view.pt')
+@view_config(route_name='order_view', renderer='templates/order_view.pt',
+             decorator=conditional(*(CATALOGUE + ORDERS)))
 def order_view(request):
     po = request.matchdict['po']
-    order = Order.get(po)
+    order = Order.get(po, load='detail')
     return dict(theme=Theme(request),
                 order=order,
                 edit_url=request.route_url('order_edit', po=po),
                 pdf_url=request.route_url('order_pdf', po=po),
+                pdf_pending='pdf' in request.params,
+                pdf_status_url=request.route_url('order_pdf_status', po=po),
                 )
 
 
 @view_config(route_name='order_pdf')
 def order_pdf(request):
     po = request.matchdict['po']
-    order = Order.get(po)
-    here = os.path.dirname(__file__)
-    if request.registry.settings['develop']:
-        filename = os.path.join(here, 'orders', '{}.pdf'.format(po))
-    else:
-        filename = '/Users/bmbr/Orders/{}.pdf'.format(po)
-    generate_order_pdf(order, filename)
-    # return HTTPFound(location=request.route_url('order_view', po=po))
-    return FileResponse(filename, request=request)
+    order = Order.get(po, load='print')
+    if order is None:
+        return HTTPNotFound('No such order')
+    # the digest covers everything printed, so it is a strong ETag
+    data = order_data(order)
+    digest = data_digest(data)
+    pdf = order_pdfs.read(digest)
+    if pdf is None and order_pdfs.directory is not None:
+        # drawn on the worker threads; the order page polls until it is archived
+        digest, status = order_pdfs.submit(order, retry=True)
+        if status != 'done':
+            return HTTPFound(location=request.route_url('order_view', po=po, _query={'pdf': status}))
+        pdf = order_pdfs.read(digest)
+    if pdf is None:
+        # with no archive there is nowhere to leave it for a later request;
+        # drawn from the data already read rather than reading the lines again
+        pdf = render_pdf(order_from_data(data))
+        order_pdfs.store(digest, pdf)
+    response = Response(body=pdf, content_type='application/pdf', conditional_response=True)
+    response.etag = digest
+    response.content_disposition = 'inline; filename="{}.pdf"'.format(po)
+    return response
+
+
+@view_config(route_name='order_pdf_status', renderer='json')
+def order_pdf_status(request):
+    po = request.matchdict['po']
+    order = Order.get(po, load='print')
+    if order is None:
+        return HTTPNotFound('No such order')
+    digest, status = order_pdfs.submit(order)
+    return dict(status=status,
+                pdf_url=request.route_url('order_pdf', po=po),
+                )
+
+
+@view_config(route_name='order_pdf_export', permission='edit')
+def order_pdf_export(request):
+    try:
+        start = end = distributor = None
+        if request.params.get('start'):
+            start = parse_date(request.params['start']).date()
+        if request.params.get('end'):
+            end = parse_date(request.params['end']).date()
+    except ValueError:
+        raise HTTPBadRequest('start and end must be dates')
+    if request.params.get('distributor'):
+        distributor = Distributor.get(request.params['distributor'])
+        if distributor is None:
+            return HTTPNotFound('No such distributor')
+    orders = select_orders(start, end, distributor)
+    processes = request.registry.settings.get('order_pdf.processes')
+    pdfs = render_orders(orders, processes=int(processes) if processes else None)
+    return Response(app_iter=zip_stream(pdfs),
+                    content_type='application/zip',
+                    content_disposition='attachment; filename="orders.zip"')
 
 
 @view_config(route_name='order_add', renderer='templates/order_add.pt', permission='edit')
@@ -184,15 +350,15 @@ def order_add(request):
     save_url = request.route_url('order_add')
     return dict(theme=Theme(request),
                 save_url=save_url,
-                shipping_methods=ShippingMethod.list(),
-                distributors=Distributor.list(),
+                shipping_method_options=datalist_options(ShippingMethod),
+                distributor_options=datalist_options(Distributor),
                 )
 
 
 @view_config(route_name='order_edit', renderer='templates/order_edit.pt', permission='edit')
 def order_edit(request):
     po = request.matchdict['po']
-    order = Order.get(po)
+    order = Order.get(po, load='detail')
     message = ''
     newisbn = ''
     if 'new-book' in request.params:
@@ -227,24 +393,76 @@ def order_edit(request):
         else:
             DBSession.add(OrderEntry(order, book, quantity))
             return HTTPFound(location=request.route_url('order_edit', po=po))
+    elif 'entries.submitted' in request.params:
+        report = order.add_entries(_entry_lines(request))
+        problems = ['{} ({})'.format(line['isbn13'], line['status'])
+                    for line in report if line['status'] not in ('added', 'merged')]
+        if not problems:
+            return HTTPFound(location=request.route_url('order_edit', po=po))
+        message = "{} lines saved; not saved: {}".format(len(report) - len(problems), ', '.join(problems))
     return dict(theme=Theme(request),
                 order=order,
                 message=message,
                 newisbn=newisbn,
                 save_url=request.route_url('order_edit', po=po),
-                shipping_methods=ShippingMethod.list(),
-                distributors=Distributor.list(),
+                shipping_method_options=datalist_options(ShippingMethod),
+                distributor_options=datalist_options(Distributor),
                 delete_entry_pattern=request.application_url + "/order/{po}/delete_entry/{isbn13}",
                 )
 
 
+def _parse_entry_lines(text):
+    """Return [(isbn13, quantity), ...] from lines of 'isbn13 quantity'.
+
+    The ISBN and quantity may be separated by spaces, a tab or a comma, and
+    hyphens in the ISBN are ignored. A line with no quantity, as a barcode
+    scanner sends, is for one copy; a quantity that is not a number is None.
+    """
+    lines = []
+    for line in text.splitlines():
+        fields = re.split(r'[\s,;]+', line.strip())
+        if fields == ['']:
+            continue
+        quantity = 1
+        if len(fields) > 1:
+            try:
+                quantity = int(fields[1])
+            except ValueError:
+                quantity = None
+        lines.append((fields[0].replace('-', ''), quantity))
+    return lines
+
+
+def _entry_lines(request):
+    upload = request.POST.get('file')
+    if hasattr(upload, 'file'):
+        return _parse_entry_lines(upload.file.read().decode('utf-8'))
+    return _parse_entry_lines(request.params.get('entries', ''))
+
+
+@view_config(route_name='order_entries_add', renderer='json', request_method='POST', permission='edit')
+def order_entries_add(request):
+    po = request.matchdict['po']
+    order = Order.get(po)
+    if order is None:
+        return HTTPNotFound('No such order')
+    report = order.add_entries(_entry_lines(request))
+    statuses = [line['status'] for line in report]
+    return dict(lines=report,
+                added=statuses.count('added'),
+                merged=statuses.count('merged'),
+                rejected=len(statuses) - statuses.count('added') - statuses.count('merged'),
+                )
+
+
 @view_config(route_name='order_delete', renderer='templates/order_delete.pt', permission='edit')
 def order_delete(request):
     po = request.matchdict['po']
-    order = Order.get(po)
     if 'form.submitted' in request.params:
-        DBSession.delete(order)
+        if not Order.delete(po):
+            return HTTPNotFound('No such order')
         return HTTPFound(location=request.route_url('order_list'))
+    order = Order.get(po)
     return dict(theme=Theme(request),
                 order=order,
                 delete_url=request.route_url('order_delete', po=po),
@@ -255,26 +473,30 @@ def order_delete(request):
 def order_entry_delete(request):
     po = request.matchdict['po']
     isbn13 = request.matchdict['isbn13']
-    order_entry = OrderEntry.get(po, isbn13)
-    DBSession.delete(order_entry)
+    if not OrderEntry.delete(po, isbn13):
+        return HTTPNotFound('No such order entry')
     return HTTPFound(location=request.route_url('order_edit', po=po))
 
 
-@view_config(route_name='distributor_list', renderer='templates/distributor_list.pt')
+@view_config(route_name='distributor_list', renderer='templates/distributor_list.pt',
+             decorator=conditional(*ORDERS))
 def distributor_list(request):
-    distributors = Distributor.list()
     return dict(theme=Theme(request),
-                distributors=distributors,
+                distributors=Distributor.summaries(),
                 distributor_url=lambda name: request.route_url('distributor_view', short_name=name),
                 )
 
 
-@view_config(route_name='distributor_view', renderer='templates/distributor_view.pt')
+@view_config(route_name='distributor_view', renderer='templates/distributor_view.pt',
+             decorator=conditional(*ORDERS))
 def distributor_view(request):
     name = request.matchdict['short_name']
     distributor = Distributor.get(name)
+    if distributor is None:
+        return HTTPNotFound('No such distributor')
     return dict(theme=Theme(request),
                 distributor=distributor,
+                monthly_totals=distributor.monthly_totals(),
                 edit_url=request.route_url('distributor_edit', short_name=name),
                 )
 
@@ -339,7 +561,8 @@ def distributor_delete(request):
     return HTTPFound(request.route_url('distributor_list'))
 
 
-@view_config(route_name='publisher_list', renderer='templates/publisher_list.pt')
+@view_config(route_name='publisher_list', renderer='templates/publisher_list.pt',
+             decorator=conditional('publishers'))
 def publisher_list(request):
     publishers = Publisher.list()
     return dict(theme=Theme(request),
@@ -381,6 +604,108 @@ def publisher_add(request):
                 )
 
 
+@view_config(route_name='export')
+def export(request):
+    table = request.matchdict['table']
+    fmt = request.matchdict['format']
+    try:
+        app_iter = exporter.export(DBSession.bind, table, fmt)
+    except ValueError:
+        return HTTPNotFound('No such export')
+    filename = '{}.{}'.format(table, fmt)
+    return Response(app_iter=app_iter,
+                    content_type=exporter.FORMATS[fmt],
+                    content_disposition='attachment; filename="{}"'.format(filename))
+
+
+@view_config(route_name='report')
+def report(request):
+    # imported here so that ReportLab is only loaded once a PDF is drawn
+    from .reports import (
+        get_report,
+        render_report,
+        )
+    name = request.matchdict['name']
+    try:
+        get_report(name)
+    except ValueError:
+        return HTTPNotFound('No such report')
+    pdf = render_report(name, group=request.params.get('group') or None)
+    return Response(body=pdf, content_type='application/pdf',
+                    content_disposition='inline; filename="{}.pdf"'.format(name))
+
+
+# the resource each API route serves
+API_ROUTES = {
+    'api_books': 'books',
+    'api_book': 'books',
+    'api_orders': 'orders',
+    'api_order': 'orders',
+    'api_distributors': 'distributors',
+    'api_distributor': 'distributors',
+    'api_publishers': 'publishers',
+    'api_publisher': 'publishers',
+    }
+
+
+def _api_list(params, name):
+    return [value for value in params.get(name, '').split(',') if value]
+
+
+def _api_options(request, resource):
+    fields = _api_list(request.params, 'fields') or None
+    include = _api_list(request.params, 'include')
+    try:
+        resource.field_names(fields)
+        resource.check_include(include)
+    except ValueError as e:
+        raise HTTPBadRequest(str(e))
+    return fields, include
+
+
+@view_config(route_name='api_books', renderer='json', decorator=conditional(*CATALOGUE))
+@view_config(route_name='api_orders', renderer='json', decorator=conditional(*(CATALOGUE + ORDERS)))
+@view_config(route_name='api_distributors', renderer='json', decorator=conditional(*ORDERS))
+@view_config(route_name='api_publishers', renderer='json', decorator=conditional('publishers'))
+def api_collection(request):
+    """A batch of resources by key, e.g. /api/books?isbn=a,b,c, or else one page of them in key order."""
+    resource = api.get_resource(API_ROUTES[request.matched_route.name])
+    fields, include = _api_options(request, resource)
+    if resource.param in request.params:
+        keys = _api_list(request.params, resource.param)
+        if len(keys) > api.MAX_BATCH:
+            raise HTTPBadRequest('at most {} keys may be asked for at once'.format(api.MAX_BATCH))
+        objs = api.fetch(resource, keys=keys, fields=fields, include=include)
+        by_key = dict((obj[resource.key], obj) for obj in objs)
+        return {resource.name: [by_key[key] for key in keys if key in by_key],
+                'missing': [key for key in keys if key not in by_key]}
+    try:
+        limit = min(int(request.params.get('limit', api.PAGE_SIZE)), api.MAX_PAGE_SIZE)
+        assert limit > 0
+    except (AssertionError, ValueError):
+        raise HTTPBadRequest('limit must be a positive integer')
+    objs = api.fetch(resource, after=request.params.get('after'), limit=limit, fields=fields, include=include)
+    next_url = None
+    if len(objs) == limit:
+        query = dict(request.params)
+        query['after'] = objs[-1][resource.key]
+        next_url = request.route_url(request.matched_route.name, _query=query)
+    return {resource.name: objs, 'next_url': next_url}
+
+
+@view_config(route_name='api_book', renderer='json', decorator=conditional(*CATALOGUE))
+@view_config(route_name='api_order', renderer='json', decorator=conditional(*(CATALOGUE + ORDERS)))
+@view_config(route_name='api_distributor', renderer='json', decorator=conditional(*ORDERS))
+@view_config(route_name='api_publisher', renderer='json', decorator=conditional('publishers'))
+def api_item(request):
+    resource = api.get_resource(API_ROUTES[request.matched_route.name])
+    fields, include = _api_options(request, resource)
+    objs = api.fetch(resource, keys=[request.matchdict['key']], fields=fields, include=include)
+    if not objs:
+        return HTTPNotFound('No such {}'.format(request.matched_route.name[len('api_'):]))
+    return objs[0]
+
+
 @view_config(route_name='login', renderer='templates/login.pt')
 @forbidden_view_config(renderer='templates/login.pt')
 def login(request):
@@ -18,6 +18,11 @@ requires = [
     'reportlab',
     ]
 
+# normalizes ISBN batches with array operations rather than one at a time
+extras = {
+    'fast': ['numpy'],
+    }
+
 setup(name='bookdb',
       version='0.0',
       description='bookdb',
@@ -37,11 +42,19 @@ setup(name='bookdb',
       zip_safe=False,
       test_suite='bookdb',
       install_requires=requires,
+      extras_require=extras,
       entry_points="""\
       [paste.app_factory]
       main = bookdb:main
       [console_scripts]
       initialize_bookdb_db = bookdb.scripts.initializedb:main
+      migrate_bookdb_db = bookdb.scripts.migratedb:main
+      export_bookdb_order_pdfs = bookdb.scripts.exportpdfs:main
+      import_books = bookdb.scripts.importbooks:main
+      export_bookdb = bookdb.scripts.export:main
+      generate_bookdb_fixture = bookdb.scripts.generatefixture:main
+      print_bookdb_report = bookdb.scripts.printreport:main
+      precompile_bookdb_templates = bookdb.scripts.precompiletemplates:main
       """,
       )
 